@@ -34,8 +34,46 @@ def create_app():
     app.register_blueprint(student_bp)
     app.register_blueprint(teacher_bp)
 
-    # 数据库连接关闭钩子
-    from app.db import close_db # 初始化
+    # 数据库连接关闭钩子：请求结束时把连接归还连接池
+    from app.db import close_db, get_pool # 初始化
     app.teardown_appcontext(close_db)
 
+    # 登录身份：每个请求生成 g.identity，并校验账号版本号（禁用即下线）
+    from app.identity import init_identity
+    init_identity(app)
+
+    # 按请求统计 SQL 语句数和耗时（管理员诊断页面）
+    from app.sqlstats import init_sql_stats
+    init_sql_stats(app)
+
+    # 密码哈希算法设置 + 进程池（登录高峰期不阻塞请求线程）
+    from app.hashing import configure_hash_policy
+    configure_hash_policy(app.config)
+    if app.config.get('HASH_EXECUTOR_ENABLED'):
+        from app.hashing import init_hashing
+        init_hashing(app)
+
+    # 学生课表缓存（LRU）
+    from app.timetable import init_timetable_cache
+    init_timetable_cache(app)
+
+    # 成绩分布统计缓存（按班次，LRU）
+    from app.grade_stats import init_grade_stats_cache
+    init_grade_stats_cache(app)
+
+    # 数据库结构迁移（索引等）
+    if app.config.get('AUTO_MIGRATE'):
+        from app.migrations import migrate
+        migrate(app.config['DATABASE'])
+
+    # 按 DB_POOL_SIZE 创建连接池（同时把数据库切换到 WAL 模式）
+    with app.app_context():
+        get_pool()
+        get_pool(readonly=True)
+
+    # 选课座位账本（可选）
+    if app.config.get('SEAT_LEDGER_ENABLED'):
+        from app.seat_ledger import init_ledger
+        init_ledger(app)
+
     return app
\ No newline at end of file
@@ -1,10 +1,22 @@
 # app/admin.py
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash
-from app.db import get_db_connection
+from app.hashing import hash_password, get_hashing_executor, rehash_stats, HashingBusy, BUSY_MESSAGE
+from app.db import get_db_connection, get_read_connection
+from app.catalog import bump_catalog_version
+from app.seat_ledger import get_ledger
+from app.semester import invalidate_current_semester
+from app.identity import bump_auth_version, invalidate_auth_versions
+from app.timetable import get_timetable_cache
+from app.grade_stats import breakdown, get_grade_stats_cache, BUCKETS as GRADE_BUCKETS
+from app.mailbox import load_threads
+from app.search import search_messages, people_filter, people_count
+from app.counters import get_count, get_counts
+from app.pagination import paginate
+from app.export import csv_response
+from app.bulk_import import import_csv, FIELDS as IMPORT_FIELDS
+from app import sqlstats
 from datetime import date
 from datetime import datetime
-from math import ceil
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -15,7 +27,7 @@ def require_admin():
 @admin_bp.route('/colleges')
 def colleges():
     if not require_admin(): return redirect(url_for('main.dashboard'))
-    conn = get_db_connection()
+    conn = get_read_connection()
     colleges = conn.execute("SELECT * FROM college ORDER BY college_id").fetchall()
     conn.close()
     return render_template('admin/admin_colleges.html', colleges=colleges)
@@ -62,6 +74,7 @@ def edit_college(college_id):
         try:
             conn.execute("UPDATE college SET college_name = ?, address = ?, phone = ? WHERE college_id = ?", (name, address, phone, college_id))
             conn.commit()
+            bump_catalog_version()
             flash('✅ College information updated successfully!')
         except sqlite3.Error as e:
             flash(f'❌ Update failed: {str(e)}')
@@ -72,6 +85,27 @@ def edit_college(college_id):
     return render_template('admin/admin_college_form.html', form=dict(college), is_edit=True)
 
 # --- Teacher Management ---
+def _teacher_filters(search_query, college_filter, title_filter):
+    """教师列表和导出共用的筛选条件，返回 (where_clauses, params)"""
+    where_clauses = []
+    params = []
+
+    if search_query:
+        # 全文索引：工号、姓名、职称、学院名称按词前缀匹配
+        clause, clause_params = people_filter('teacher', search_query, 't')
+        where_clauses.append(clause)
+        params.extend(clause_params)
+
+    if college_filter:
+        where_clauses.append("t.college_id = ?")
+        params.append(college_filter)
+
+    if title_filter:
+        where_clauses.append("t.title = ?")
+        params.append(title_filter)
+
+    return where_clauses, params
+
 @admin_bp.route('/teachers')
 def teachers():
     if not require_admin():
@@ -81,12 +115,13 @@ def teachers():
     college_filter = request.args.get('college_id', '')
     title_filter = request.args.get('title', '').strip()
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     if page < 1:
         page = 1
 
     ITEMS_PER_PAGE = 20
 
-    conn = get_db_connection()
+    conn = get_read_connection()
 
     colleges = conn.execute("SELECT * FROM college ORDER BY college_name").fetchall()
 
@@ -96,43 +131,23 @@ def teachers():
         ORDER BY title
     """).fetchall()
 
-    where_clauses = []
-    params = []
-
-    if search_query:
-        base_like = f'%{search_query}%'
-        where_clauses.append("(t.teacher_id LIKE ? OR t.name LIKE ? OR t.title LIKE ? OR c.college_name LIKE ?)")
-        params.extend([base_like] * 4)
-
-    if college_filter:
-        where_clauses.append("t.college_id = ?")
-        params.append(college_filter)
-
-    if title_filter:
-        where_clauses.append("t.title = ?")
-        params.append(title_filter)
-
+    where_clauses, params = _teacher_filters(search_query, college_filter, title_filter)
     where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
 
-    count_query = """
-        SELECT COUNT(*) 
-        FROM teacher t 
-        LEFT JOIN college c ON t.college_id = c.college_id
-    """ + where_sql
-    total_count = conn.execute(count_query, params).fetchone()[0]
-    total_pages = (total_count + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-
-    if total_pages > 0 and page > total_pages:
-        page = total_pages
-
-    offset = (page - 1) * ITEMS_PER_PAGE
-    data_query = """
-        SELECT t.*, c.college_name 
-        FROM teacher t 
-        LEFT JOIN college c ON t.college_id = c.college_id
-    """ + where_sql + " ORDER BY t.teacher_id LIMIT ? OFFSET ?"
-
-    teachers = conn.execute(data_query, params + [ITEMS_PER_PAGE, offset]).fetchall()
+    if not search_query and not title_filter:
+        # 未筛选或只按学院筛选：直接读计数器
+        total_count = get_count(conn, 'teacher.college_id', college_filter) if college_filter else get_count(conn, 'teacher')
+    elif not college_filter and not title_filter:
+        # 只有搜索条件：直接在全文索引上计数
+        total_count = people_count(conn, 'teacher', search_query)
+    else:
+        count_query = "SELECT COUNT(*) FROM teacher t" + where_sql
+        total_count = conn.execute(count_query, params).fetchone()[0]
+
+    teachers, pager = paginate(
+        conn, "t.*, c.college_name", "teacher t LEFT JOIN college c ON t.college_id = c.college_id",
+        where_clauses, params, ['t.teacher_id'], ITEMS_PER_PAGE, total_count, page=page, cursor=cursor
+    )
     conn.close()
 
     return render_template(
@@ -143,9 +158,34 @@ def teachers():
         selected_college=college_filter,
         selected_title=title_filter,
         search_query=search_query,
-        current_page=page,
-        total_pages=total_pages,
-        total_count=total_count
+        current_page=pager['page'],
+        total_pages=pager['pages'],
+        total_count=total_count,
+        pager=pager
+    )
+
+@admin_bp.route('/teachers/export')
+def export_teachers():
+    """按当前筛选条件流式导出教师 CSV"""
+    if not require_admin():
+        return redirect(url_for('main.dashboard'))
+
+    where_clauses, params = _teacher_filters(
+        request.args.get('q', '').strip(),
+        request.args.get('college_id', ''),
+        request.args.get('title', '').strip()
+    )
+    where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    return csv_response(
+        f"teachers_{date.today():%Y%m%d}.csv",
+        ['Teacher ID', 'Name', 'Gender', 'Date of Birth', 'Title', 'College ID', 'College'],
+        get_read_connection(),
+        """
+            SELECT t.teacher_id, t.name, t.gender, t.birth_date, t.title, t.college_id, c.college_name
+            FROM teacher t
+            LEFT JOIN college c ON t.college_id = c.college_id
+        """ + where_sql + " ORDER BY t.teacher_id",
+        params
     )
 
 @admin_bp.route('/teachers/add', methods=['GET', 'POST'])
@@ -198,7 +238,10 @@ def edit_teacher(teacher_id):
         try:
             conn.execute("UPDATE teacher SET name = ?, gender = ?, birth_date = ?, title = ?, college_id = ? WHERE teacher_id = ?",
                          (name, gender, birth, title, cid, teacher_id))
+            bump_auth_version(conn, user_id=teacher_id, role='teacher')
             conn.commit()
+            invalidate_auth_versions()
+            bump_catalog_version()
             flash(f'✅ Teacher {name} information updated successfully!')
         except sqlite3.Error as e:
             flash(f'❌ Update failed: {str(e)}')
@@ -212,29 +255,18 @@ def edit_teacher(teacher_id):
 # --- Student Management ---
 ITEMS_PER_PAGE = 20
 
-@admin_bp.route('/students')
-def students():
-    if not require_admin():
-        return redirect(url_for('main.dashboard'))
-
-    search_query = request.args.get('q', '').strip()
-    selected_year = request.args.get('year', '').strip()
-    sort_by = request.args.get('sort_by', 'student_id')
-    order = request.args.get('order', 'asc')
-    page = request.args.get('page', 1, type=int)
-    if page < 1:
-        page = 1
-
-    allowed_sort_fields = {'student_id', 'birth_date', 'enrollment_year'}
-    if sort_by not in allowed_sort_fields:
-        sort_by = 'student_id'
-    if order not in ('asc', 'desc'):
-        order = 'asc'
-
-    conn = get_db_connection()
+# 学生列表的排序键（keyset 分页：可空列用 IFNULL，最后用学号兜底；对应索引见 migrations.py）
+STUDENT_SORT_KEYS = {
+    'student_id': ['s.student_id'],
+    'birth_date': ["IFNULL(s.birth_date, '')", 's.student_id'],
+    'enrollment_year': ['IFNULL(s.enrollment_year, 0)', 's.student_id'],
+}
 
+def _student_filters(search_query, selected_year):
+    """学生列表和导出共用的筛选条件，返回 (where_clauses, params, 是否为全文检索)"""
     where_clauses = []
     params = []
+    text_search = False
 
     if search_query:
         clean_q = search_query.strip().rstrip('Cohort').strip()
@@ -251,38 +283,60 @@ def students():
             where_clauses.append("s.enrollment_year = ?")
             params.append(year_value)
         else:
-            text_fields = ['s.student_id', 's.name', 's.phone', 's.hometown', 'c.college_name', 's.birth_date', 's.id_card']
-            text_clause = " OR ".join([f"{field} LIKE ?" for field in text_fields])
-            where_clauses.append(f"({text_clause})")
-            params.extend([f'%{search_query}%'] * len(text_fields))
+            # 全文索引：学号、姓名、电话、籍贯、身份证号、出生日期、学院名称按词前缀匹配
+            clause, clause_params = people_filter('student', search_query, 's')
+            where_clauses.append(clause)
+            params.extend(clause_params)
+            text_search = True
 
     if selected_year and selected_year.isdigit():
         where_clauses.append("s.enrollment_year = ?")
         params.append(int(selected_year))
 
+    return where_clauses, params, text_search
+
+@admin_bp.route('/students')
+def students():
+    if not require_admin():
+        return redirect(url_for('main.dashboard'))
+
+    search_query = request.args.get('q', '').strip()
+    selected_year = request.args.get('year', '').strip()
+    sort_by = request.args.get('sort_by', 'student_id')
+    order = request.args.get('order', 'asc')
+    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    if page < 1:
+        page = 1
+
+    if sort_by not in STUDENT_SORT_KEYS:
+        sort_by = 'student_id'
+    if order not in ('asc', 'desc'):
+        order = 'asc'
+
+    conn = get_read_connection()
+
+    where_clauses, params, text_search = _student_filters(search_query, selected_year)
     where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
 
-    count_query = "SELECT COUNT(*) FROM student s LEFT JOIN college c ON s.college_id = c.college_id" + where_sql
-    total_count = conn.execute(count_query, params).fetchone()[0]
-    total_pages = (total_count + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-    if page > total_pages and total_pages > 0:
-        page = total_pages
-
-    base_query = """
-        SELECT s.*, c.college_name
-        FROM student s
-        LEFT JOIN college c ON s.college_id = c.college_id
-    """ + where_sql + f" ORDER BY {sort_by} {order.upper()} LIMIT ? OFFSET ?"
-
-    offset = (page - 1) * ITEMS_PER_PAGE
-    students = conn.execute(base_query, params + [ITEMS_PER_PAGE, offset]).fetchall()
-
-    year_stats = conn.execute("""
-        SELECT enrollment_year, COUNT(*) as count
-        FROM student
-        GROUP BY enrollment_year
-        ORDER BY enrollment_year DESC
-    """).fetchall()
+    year_counts = get_counts(conn, 'student.enrollment_year')
+    if not search_query:
+        # 未筛选或只按入学年份筛选：直接读计数器
+        total_count = year_counts.get(str(int(selected_year)), 0) if where_clauses else get_count(conn, 'student')
+    elif text_search and len(where_clauses) == 1:
+        # 只有搜索条件：直接在全文索引上计数
+        total_count = people_count(conn, 'student', search_query)
+    else:
+        count_query = "SELECT COUNT(*) FROM student s" + where_sql
+        total_count = conn.execute(count_query, params).fetchone()[0]
+
+    students, pager = paginate(
+        conn, "s.*, c.college_name", "student s LEFT JOIN college c ON s.college_id = c.college_id",
+        where_clauses, params, STUDENT_SORT_KEYS[sort_by], ITEMS_PER_PAGE, total_count,
+        page=page, cursor=cursor, descending=(order == 'desc')
+    )
+
+    year_stats = sorted(((int(year), count) for year, count in year_counts.items() if year.isdigit()), reverse=True)
 
     conn.close()
 
@@ -295,8 +349,38 @@ def students():
         sort_by=sort_by,
         order=order,
         total_count=total_count,
-        current_page=page,
-        total_pages=total_pages
+        current_page=pager['page'],
+        total_pages=pager['pages'],
+        pager=pager
+    )
+
+@admin_bp.route('/students/export')
+def export_students():
+    """按当前筛选条件和排序流式导出学生 CSV"""
+    if not require_admin():
+        return redirect(url_for('main.dashboard'))
+
+    sort_by = request.args.get('sort_by', 'student_id')
+    if sort_by not in STUDENT_SORT_KEYS:
+        sort_by = 'student_id'
+    direction = 'DESC' if request.args.get('order') == 'desc' else 'ASC'
+
+    where_clauses, params, _ = _student_filters(request.args.get('q', '').strip(),
+                                                request.args.get('year', '').strip())
+    where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    order_sql = ", ".join(f"{key} {direction}" for key in STUDENT_SORT_KEYS[sort_by])
+    return csv_response(
+        f"students_{date.today():%Y%m%d}.csv",
+        ['Student ID', 'Name', 'Gender', 'Date of Birth', 'Phone', 'Hometown',
+         'College ID', 'College', 'ID Card', 'Enrollment Year'],
+        get_read_connection(),
+        """
+            SELECT s.student_id, s.name, s.gender, s.birth_date, s.phone, s.hometown,
+                   s.college_id, c.college_name, s.id_card, s.enrollment_year
+            FROM student s
+            LEFT JOIN college c ON s.college_id = c.college_id
+        """ + where_sql + " ORDER BY " + order_sql,
+        params
     )
 
 @admin_bp.route('/students/add', methods=['GET', 'POST'])
@@ -328,6 +412,35 @@ def add_student():
     conn.close()
     return render_template('admin/admin_student_form.html', form={'student_id': '', 'name': '', 'gender': '', 'birth_date': '', 'phone': '', 'hometown': '', 'college_id': ''}, colleges=colleges, is_edit=False)
 
+# 导入结果页最多列出的错误行数，其余只显示数量
+IMPORT_ERRORS_SHOWN = 500
+
+def _import_view(kind, list_endpoint):
+    """学生 / 教师 CSV 批量导入：GET 显示上传表单，POST 导入并显示逐行错误报告"""
+    if not require_admin(): return redirect(url_for('main.dashboard'))
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV file to import.', 'error')
+            return redirect(request.url)
+        report = import_csv(get_db_connection(), kind, upload.stream,
+                            create_accounts=bool(request.form.get('create_accounts')))
+        flash(f'✅ Imported {report.inserted} of {report.rows} row(s)'
+              + (f', created {report.accounts} account(s)' if report.accounts else '')
+              + (f'; {len(report.errors)} row(s) rejected' if report.errors else ''),
+              'success' if not report.errors else 'warning')
+    return render_template('admin/admin_import.html', kind=kind, fields=IMPORT_FIELDS[kind],
+                           list_endpoint=list_endpoint, report=report, errors_shown=IMPORT_ERRORS_SHOWN)
+
+@admin_bp.route('/students/import', methods=['GET', 'POST'])
+def import_students():
+    return _import_view('student', 'admin.students')
+
+@admin_bp.route('/teachers/import', methods=['GET', 'POST'])
+def import_teachers():
+    return _import_view('teacher', 'admin.teachers')
+
 @admin_bp.route('/students/edit/<student_id>', methods=['GET', 'POST'])
 def edit_student(student_id):
     if not require_admin(): return redirect(url_for('main.dashboard'))
@@ -351,7 +464,12 @@ def edit_student(student_id):
         try:
             conn.execute("UPDATE student SET name = ?, gender = ?, birth_date = ?, phone = ?, hometown = ?, college_id = ? WHERE student_id = ?",
                          (name, gender, birth, phone, hometown, cid, student_id))
+            bump_auth_version(conn, user_id=student_id, role='student')
             conn.commit()
+            invalidate_auth_versions()
+            ledger = get_ledger()
+            if ledger is not None:
+                ledger.forget_student(student_id)  # 学院可能变化，选课资格按新学院判定
             flash(f'✅ Student {name} information updated successfully!')
         except sqlite3.Error as e:
             flash(f'❌ Update failed: {str(e)}')
@@ -369,49 +487,32 @@ def courses():
         return redirect(url_for('main.dashboard'))
 
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = ITEMS_PER_PAGE
-    offset = (page - 1) * per_page
 
     college_id = request.args.get('college_id', '').strip()
-    conn = get_db_connection()
+    conn = get_read_connection()
 
-    count_query = "SELECT COUNT(*) FROM course co"
-    data_query = """
-        SELECT co.*, c.college_name 
-        FROM course co 
-        LEFT JOIN college c ON co.college_id = c.college_id
-    """
+    where_clauses = []
     params = []
 
     if college_id:
-        count_query += " WHERE co.college_id = ?"
-        data_query += " WHERE co.college_id = ?"
+        where_clauses.append("co.college_id = ?")
         params.append(college_id)
 
-    total = conn.execute(count_query, params).fetchone()[0]
+    total = get_count(conn, 'course.college_id', college_id) if college_id else get_count(conn, 'course')
 
-    data_query += " ORDER BY co.course_id LIMIT ? OFFSET ?"
-    paginated_params = params + [per_page, offset]
-    courses = conn.execute(data_query, paginated_params).fetchall()
+    courses, pagination = paginate(
+        conn, "co.*, c.college_name", "course co LEFT JOIN college c ON co.college_id = c.college_id",
+        where_clauses, params, ['co.course_id'], per_page, total, page=page, cursor=cursor
+    )
 
     colleges = conn.execute("SELECT * FROM college ORDER BY college_name").fetchall()
 
-    college_counts = conn.execute("""
-        SELECT college_id, COUNT(*) as count 
-        FROM course 
-        GROUP BY college_id
-    """).fetchall()
-    college_count_dict = {row['college_id']: row['count'] for row in college_counts}
+    college_count_dict = get_counts(conn, 'course.college_id')
 
     conn.close()
 
-    pagination = {
-        'total': total,
-        'per_page': per_page,
-        'page': page,
-        'pages': (total + per_page - 1) // per_page
-    }
-
     return render_template(
         'admin/admin_courses.html',
         courses=courses,
@@ -441,6 +542,7 @@ def add_course():
             conn.execute("INSERT INTO course (course_id, course_name, credits, hours, college_id) VALUES (?, ?, ?, ?, ?)",
                          (cid, name, credits, hours, college_id))
             conn.commit()
+            bump_catalog_version()
             flash(f'✅ Course {name} ({cid}) added successfully!')
         except ValueError:
             flash('❌ Credits or hours must be integers.')
@@ -476,6 +578,7 @@ def edit_course(course_id):
             conn.execute("UPDATE course SET course_name = ?, credits = ?, hours = ?, college_id = ? WHERE course_id = ?",
                          (name, credits, hours, college_id, course_id))
             conn.commit()
+            bump_catalog_version()
             flash('✅ Course information updated successfully!')
         except ValueError:
             flash('❌ Credits or hours must be integers.')
@@ -498,69 +601,46 @@ def accounts():
         return redirect(url_for('main.dashboard'))
 
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     q = request.args.get('q', '').strip()
     per_page = 20
-    offset = (page - 1) * per_page
 
-    conn = get_db_connection()
+    conn = get_read_connection()
 
     count_base = "SELECT COUNT(*) FROM account"
     count_params = []
 
-    select_clause = """
-        SELECT username, role, user_id, is_active,
-        CASE 
-            WHEN role = 'student' THEN (SELECT name FROM student WHERE student_id = user_id)
-            WHEN role = 'teacher' THEN (SELECT name FROM teacher WHERE teacher_id = user_id)
-            ELSE 'System Administrator'
-        END AS real_name
-    """
-    from_clause = " FROM account"
+    # 姓名取 account.display_name（触发器同步的冗余列），不再逐行查 student / teacher
+    select_clause = "username, role, user_id, is_active, display_name AS real_name"
     where_clauses = []
     query_params = []
 
     if q:
-        like_pattern = f'%{q}%'
-        where_clauses.append("""
-            (username LIKE ? 
-             OR (role = 'student' AND EXISTS (
-                 SELECT 1 FROM student 
-                 WHERE student_id = account.user_id AND name LIKE ?
-             )) 
-             OR (role = 'teacher' AND EXISTS (
-                 SELECT 1 FROM teacher 
-                 WHERE teacher_id = account.user_id AND name LIKE ?
-             ))
-            )
-        """)
-        count_params = [like_pattern, like_pattern, like_pattern]
-        query_params = [like_pattern, like_pattern, like_pattern]
+        # 用户名或姓名任意位置包含即匹配（姓名取冗余列，只扫 account 一张表）；转义输入中的 LIKE 通配符
+        like_pattern = '%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        where_clauses.append("(username LIKE ? ESCAPE '\\' OR display_name LIKE ? ESCAPE '\\')")
+        count_params = [like_pattern, like_pattern]
+        query_params = [like_pattern, like_pattern]
 
     where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-    order_limit_sql = " ORDER BY role, username LIMIT ? OFFSET ?"
 
-    total = conn.execute(count_base + where_sql, count_params).fetchone()[0]
+    total = conn.execute(count_base + where_sql, count_params).fetchone()[0] if q else get_count(conn, 'account')
 
-    accounts = conn.execute(
-        select_clause + from_clause + where_sql + order_limit_sql,
-        query_params + [per_page, offset]
-    ).fetchall()
+    accounts, pager = paginate(
+        conn, select_clause, "account", where_clauses, query_params, ['role', 'username'],
+        per_page, total, page=page, cursor=cursor
+    )
 
     conn.close()
 
-    total_pages = ceil(total / per_page) if total > 0 else 1
-    if page < 1:
-        page = 1
-    elif page > total_pages and total_pages > 0:
-        page = total_pages
-
     return render_template(
         'admin/admin_accounts.html',
         accounts=accounts,
-        current_page=page,
-        total_pages=total_pages,
+        current_page=pager['page'],
+        total_pages=max(pager['pages'], 1),
         total=total,
-        current_query=q
+        current_query=q,
+        pager=pager
     )
 
 @admin_bp.route('/accounts/add', methods=['GET', 'POST'])
@@ -590,7 +670,12 @@ def add_account():
                 conn.close()
                 return redirect(request.url)
 
-        hashed = generate_password_hash(password)
+        try:
+            hashed = hash_password(password)
+        except HashingBusy:
+            flash(BUSY_MESSAGE, 'error')
+            conn.close()
+            return redirect(request.url)
         conn.execute("INSERT INTO account (username, password_hash, role, user_id, is_active) VALUES (?, ?, ?, ?, ?)",
                      (username, hashed, role, user_id, 1))
         conn.commit()
@@ -608,7 +693,9 @@ def toggle_account_status():
     if current:
         new_status = 0 if current['is_active'] else 1
         conn.execute("UPDATE account SET is_active = ? WHERE username = ?", (new_status, username))
+        bump_auth_version(conn, username)  # 已登录的会话在下一次请求时失效
         conn.commit()
+        invalidate_auth_versions(username)
         flash(f'✅ Account {username} has been {"enabled" if new_status else "disabled"}', 'success')
     conn.close()
     return redirect(url_for('admin.accounts'))
@@ -625,7 +712,12 @@ def reset_password():
         flash('User does not exist', 'error')
         conn.close()
         return redirect(url_for('admin.accounts'))
-    hashed_pw = generate_password_hash('123456')
+    try:
+        hashed_pw = hash_password('123456')
+    except HashingBusy:
+        flash(BUSY_MESSAGE, 'error')
+        conn.close()
+        return redirect(url_for('admin.accounts'))
     conn.execute("UPDATE account SET password_hash = ? WHERE username = ?", (hashed_pw, username))
     conn.commit()
     conn.close()
@@ -636,7 +728,7 @@ def reset_password():
 # --- Semester Course Selection Period Management ---
 @admin_bp.route('/manage-semesters', methods=['GET'])
 def manage_semesters():
-    conn = get_db_connection()
+    conn = get_read_connection()
     semesters = conn.execute('''
         SELECT semester_id, semester_name, is_current, selection_start, selection_end
         FROM semester ORDER BY semester_id DESC
@@ -671,6 +763,8 @@ def add_semester():
                     VALUES (?, ?, ?, ?)
                 ''', (sid, name, db_start, db_end))
                 conn.commit()
+                bump_catalog_version()
+                invalidate_current_semester()
                 conn.close()
                 flash(f'✅ Semester {name} added successfully!', 'success')
                 return redirect(url_for('admin.manage_semesters'))
@@ -751,6 +845,8 @@ def edit_semester(semester_id):
             WHERE semester_id = ?
         ''', (name, db_start, db_end, is_current, semester_id))
         conn.commit()
+        bump_catalog_version()
+        invalidate_current_semester()
         conn.close()
 
         flash(f'✅ Semester "{name}" updated successfully!', 'success')
@@ -767,6 +863,8 @@ def delete_semester(semester_id):
     else:
         conn.execute("DELETE FROM semester WHERE semester_id = ?", (semester_id,))
         conn.commit()
+        bump_catalog_version()
+        invalidate_current_semester()
         flash('🗑️ Semester deleted.', 'info')
     return redirect(url_for('admin.manage_semesters'))
 
@@ -807,40 +905,52 @@ def messages():
         return redirect(url_for('main.dashboard'))
 
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    q = request.args.get('q', '').strip()
     ITEMS_PER_PAGE = 15
-    offset = (page - 1) * ITEMS_PER_PAGE
 
-    conn = get_db_connection()
+    conn = get_read_connection()
 
-    total = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    snippets = {}
+    truncated = False
+    # 检索结果按相关度排名，只在有限的命中窗口内按页码翻页
+    pager = {'numbered': True, 'prev_cursor': None, 'next_cursor': None}
+    if q:
+        # 全文检索：按相关度排序，附带命中摘要
+        page = max(page, 1)
+        total, hits, truncated = search_messages(conn, q, ITEMS_PER_PAGE, (page - 1) * ITEMS_PER_PAGE)
+        snippets = dict(hits)
+        rows = {}
+        if hits:
+            rows = {row['message_id']: row for row in conn.execute(
+                f"SELECT * FROM messages WHERE message_id IN ({','.join('?' * len(hits))})",
+                [message_id for message_id, _ in hits]
+            ).fetchall()}
+        main_messages = [rows[message_id] for message_id, _ in hits if message_id in rows]
+    else:
+        total = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        main_messages, pager = paginate(
+            conn, "*", "messages", [], [], ['last_activity_at', 'message_id'],
+            ITEMS_PER_PAGE, total, page=page, cursor=cursor, descending=True
+        )
+        page = pager['page']
     total_pages = (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
 
-    main_messages = conn.execute("""
-        SELECT m.*,
-               (SELECT MAX(created_at) FROM replies r WHERE r.message_id = m.message_id) AS last_activity
-        FROM messages m
-        ORDER BY COALESCE(last_activity, m.created_at) DESC
-        LIMIT ? OFFSET ?
-    """, (ITEMS_PER_PAGE, offset)).fetchall()
-
-    threads = []
-    for msg in main_messages:
-        replies = conn.execute("""
-            SELECT * FROM replies
-            WHERE message_id = ?
-            ORDER BY created_at ASC
-        """, (msg['message_id'],)).fetchall()
-        threads.append({
-            'main': msg,
-            'replies': replies
-        })
+    # 当前页所有对话的回复一次查出
+    threads = load_threads(conn, main_messages)
+    for thread in threads:
+        thread['snippet'] = snippets.get(thread['main']['message_id'])
 
     conn.close()
     return render_template(
         'admin/admin_messages.html',
         threads=threads,
         current_page=page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        total=total,
+        truncated=truncated,
+        q=q,
+        pager=pager
     )
 
 @admin_bp.route('/messages/<int:message_id>/read', methods=['POST'])
@@ -886,4 +996,86 @@ def reply_to_message(message_id):
     finally:
         conn.close()
 
-    return redirect(url_for('admin.messages', page=request.args.get('page', 1)))
\ No newline at end of file
+    return redirect(url_for('admin.messages', page=request.args.get('page', 1)))
+
+
+# --- Grade Statistics ---
+@admin_bp.route('/grade-stats')
+def grade_stats():
+    """全校（按学院）或某个学院（按课程）的总评成绩分布，可限定学期"""
+    if not require_admin():
+        return redirect(url_for('main.dashboard'))
+    college_id = request.args.get('college_id') or None
+    semester_id = request.args.get('semester_id') or None
+
+    conn = get_read_connection()
+    try:
+        semesters = conn.execute("SELECT semester_id, semester_name FROM semester ORDER BY semester_id DESC").fetchall()
+        colleges = conn.execute("SELECT college_id, college_name FROM college ORDER BY college_id").fetchall()
+        college = next((c for c in colleges if c['college_id'] == college_id), None)
+        if college_id and not college:
+            flash('College not found.', 'error')
+            return redirect(url_for('admin.grade_stats', semester_id=semester_id))
+
+        by = 'course' if college else 'college'
+        total, groups = breakdown(conn, by, college_id=college_id, semester_id=semester_id)
+
+        # 选课人数、未出成绩人数取自物化的 section_stats
+        key = 'oc.course_id' if college else 'c.college_id'
+        params = [value for value in (college_id, semester_id) if value]
+        progress = {row[0]: (row[1], row[2]) for row in conn.execute(f"""
+            SELECT {key}, SUM(ss.enrolled), SUM(ss.ungraded)
+            FROM section_stats ss
+            JOIN offered_course oc ON ss.offered_id = oc.offered_id
+            JOIN course c ON oc.course_id = c.course_id
+            WHERE 1 = 1 {'AND c.college_id = ?' if college_id else ''} {'AND oc.semester_id = ?' if semester_id else ''}
+            GROUP BY {key}
+        """, params)}
+
+        if college:
+            names = dict(conn.execute("SELECT course_id, course_name FROM course WHERE college_id = ?",
+                                      (college_id,)).fetchall())
+        else:
+            names = {c['college_id']: c['college_name'] for c in colleges}
+    finally:
+        conn.close()
+
+    rows = [{'key': k, 'name': names.get(k, k), 'stats': summary.metrics(),
+             'enrolled': progress.get(k, (0, 0))[0], 'ungraded': progress.get(k, (0, 0))[1]}
+            for k, summary in groups.items()]
+    rows.sort(key=lambda row: row['key'])
+    return render_template('admin/admin_grade_stats.html',
+                           total=total.metrics(),
+                           enrolled=sum(e for e, _ in progress.values()),
+                           ungraded=sum(u for _, u in progress.values()),
+                           rows=rows,
+                           bucket_names=GRADE_BUCKETS,
+                           college=college,
+                           colleges=colleges,
+                           semesters=semesters,
+                           semester_id=semester_id)
+
+
+# --- SQL Diagnostics ---
+@admin_bp.route('/diagnostics')
+def diagnostics():
+    if not require_admin():
+        return redirect(url_for('main.dashboard'))
+    stats = sqlstats.snapshot()
+    hasher = get_hashing_executor()
+    return render_template('admin/admin_diagnostics.html',
+                           endpoints=stats['endpoints'],
+                           slowest=stats['slowest'],
+                           warnings=stats['warnings'],
+                           hashing=hasher.stats() if hasher else None,
+                           rehash=rehash_stats(),
+                           caches=[get_timetable_cache().stats(), get_grade_stats_cache().stats()])
+
+
+@admin_bp.route('/diagnostics/reset', methods=['POST'])
+def reset_diagnostics():
+    if not require_admin():
+        return redirect(url_for('main.dashboard'))
+    sqlstats.reset()
+    flash('✅ SQL statistics have been reset.', 'success')
+    return redirect(url_for('admin.diagnostics'))
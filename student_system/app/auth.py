@@ -1,10 +1,30 @@
 # app/auth.py
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+import hmac
+
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app
 from app.db import get_db_connection
+from app.hashing import (check_password, hash_password, needs_rehash, rehash_in_background, HashingBusy,
+                         BUSY_MESSAGE, INITIAL_PASSWORD, initial_password)
+from app.identity import login_user
 
 auth_bp = Blueprint('auth', __name__)
 
+ID_CARD_TABLES = {'student': ('student', 'student_id'), 'teacher': ('teacher', 'teacher_id')}
+
+
+def verify_password(conn, user, password):
+    """校验账号密码；批量导入后还没有哈希的账号（INITIAL_PASSWORD）与身份证后 6 位比对"""
+    if user['password_hash'] != INITIAL_PASSWORD:
+        return check_password(user['password_hash'], password)
+    if user['role'] not in ID_CARD_TABLES:
+        return False
+    table, key = ID_CARD_TABLES[user['role']]
+    row = conn.execute(f"SELECT id_card FROM {table} WHERE {key} = ?", (user['user_id'],)).fetchone()
+    if not row:
+        return False
+    return hmac.compare_digest(initial_password(row['id_card']).encode(), password.encode())
+
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if 'username' in session:
@@ -17,9 +37,18 @@ def login():
 
         if user:
             is_active = bool(user['is_active']) if 'is_active' in user.keys() else True
-            if is_active and check_password_hash(user['password_hash'], password):
-                session['username'] = username
-                session['role'] = user['role']
+            try:
+                valid = is_active and verify_password(conn, user, password)
+            except HashingBusy:
+                # 登录高峰：哈希队列已满，快速返回让用户稍后重试
+                flash(BUSY_MESSAGE, 'error')
+                return render_template('login.html'), 503
+            if valid:
+                login_user(conn, user)
+                if user['password_hash'] == INITIAL_PASSWORD or (
+                        current_app.config.get('REHASH_ON_LOGIN') and needs_rehash(user['password_hash'])):
+                    # 导入后首次登录，或旧参数生成的哈希：后台按当前设置计算并写回，不影响本次登录
+                    rehash_in_background(current_app.config['DATABASE'], username, password, user['password_hash'])
                 flash('Login successful!', 'success')
                 return redirect(url_for('main.dashboard'))
             elif not is_active:
@@ -62,7 +91,11 @@ def forgot_password():
             return render_template('forgot_password.html')
 
         new_password = id_card[-6:]
-        hashed_pw = generate_password_hash(new_password)
+        try:
+            hashed_pw = hash_password(new_password)
+        except HashingBusy:
+            flash(BUSY_MESSAGE)
+            return render_template('forgot_password.html'), 503
         conn.execute("UPDATE account SET password_hash = ? WHERE username = ?", (hashed_pw, username))
         conn.commit()
         flash(f'✅ Password has been reset to the last 6 digits of your ID: {new_password}. Please log in immediately and change your password.')
@@ -91,20 +124,24 @@ def change_password():
 
         conn = get_db_connection()
         user = conn.execute(
-            "SELECT password_hash FROM account WHERE username = ?",
+            "SELECT password_hash, role, user_id FROM account WHERE username = ?",
             (session['username'],)
         ).fetchone()
-        conn.close()
 
-        if not user or not check_password_hash(user['password_hash'], old):
-            flash('Current password is incorrect.', 'error')
-            return render_template(get_password_template(role))
+        try:
+            if not user or not verify_password(conn, user, old):
+                flash('Current password is incorrect.', 'error')
+                return render_template(get_password_template(role))
+            new_hash = hash_password(new)
+        except HashingBusy:
+            flash(BUSY_MESSAGE, 'error')
+            return render_template(get_password_template(role)), 503
 
         # Update password
         conn = get_db_connection()
         conn.execute(
             "UPDATE account SET password_hash = ? WHERE username = ?",
-            (generate_password_hash(new), session['username'])
+            (new_hash, session['username'])
         )
         conn.commit()
         conn.close()
@@ -129,7 +166,6 @@ def get_password_template(role: str) -> str:
 
 @auth_bp.route('/logout')
 def logout():
-    session.pop('username', None)
-    session.pop('role', None)
+    session.clear()
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('auth.login'))
\ No newline at end of file
@@ -0,0 +1,254 @@
+# app/bulk_import.py
+"""
+学生 / 教师 CSV 批量导入
+
+上传的文件不整个读进内存，也不逐行查询、逐行提交：
+- csv.reader 边读边解析，每 CHUNK_ROWS 行为一块
+- 格式校验（身份证号、手机号、日期、性别）在 Python 中完成；学院是否存在用导入开始时取出的
+  学院编号集合判断；学号/工号、身份证号是否已存在，每块用一条 IN 查询找出
+- 通过校验的行用 executemany 插入，每块一个事务，写锁只在插入期间持有，不会长时间挡住其他写入
+- 校验或插入失败的行不中断导入，记入错误报告 [(行号, 学号/工号, 原因)]
+
+表头可以是导出文件的表头（Student ID、Date of Birth ...），也可以是列名（student_id ...），
+不区分大小写；不认识的列（如导出文件中的 College）忽略。文件编码为 UTF-8（可带 BOM）或
+GB18030（Excel 在中文系统上另存的 CSV）。
+
+勾选创建账号时同时插入 account（用户名 = 学号/工号）。密码哈希不在导入时计算（每个上百毫秒，
+一万个账号要几十分钟），而是记为 INITIAL_PASSWORD，见 app/hashing.py。
+计数器、全文索引、账号显示名由触发器同步。
+"""
+import codecs
+import csv
+import io
+import re
+import sqlite3
+from datetime import date
+
+from app.hashing import INITIAL_PASSWORD
+
+CHUNK_ROWS = 1000
+
+ID_CARD_RE = re.compile(r'^\d{17}[\dX]$')
+PHONE_RE = re.compile(r'^1[3-9]\d{9}$')
+GENDERS = ('M', 'F')
+
+# 每类导入的字段：(列名, 导出文件中的表头, 是否必填)
+FIELDS = {
+    'student': [
+        ('student_id', 'Student ID', True),
+        ('name', 'Name', True),
+        ('gender', 'Gender', False),
+        ('birth_date', 'Date of Birth', False),
+        ('phone', 'Phone', False),
+        ('hometown', 'Hometown', False),
+        ('college_id', 'College ID', True),
+        ('id_card', 'ID Card', True),
+        ('enrollment_year', 'Enrollment Year', False),
+    ],
+    'teacher': [
+        ('teacher_id', 'Teacher ID', True),
+        ('name', 'Name', True),
+        ('gender', 'Gender', False),
+        ('birth_date', 'Date of Birth', False),
+        ('title', 'Title', False),
+        ('college_id', 'College ID', True),
+        ('id_card', 'ID Card', True),
+    ],
+}
+
+
+class ImportReport:
+    """导入结果：新增行数、新增账号数、已有账号（跳过）数和逐行错误"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.inserted = 0
+        self.accounts = 0
+        self.accounts_skipped = 0
+        self.errors = []
+
+    def error(self, line, key, message):
+        self.errors.append((line, key, message))
+
+
+def open_csv(stream):
+    """按文件开头判断编码（UTF-8 / GB18030），返回文本流；成绩单上传也用它"""
+    head = stream.read(64 * 1024)
+    stream.seek(0)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head)   # 末尾被截断的多字节字符不算错误
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'gb18030'
+    return io.TextIOWrapper(stream, encoding=encoding, newline='')
+
+
+def _columns(kind, header):
+    """表头 -> {列名: 在行中的位置}，缺少必填列时抛出 ValueError"""
+    names = {}
+    for column, label, _ in FIELDS[kind]:
+        names[column.lower()] = column
+        names[label.lower()] = column
+    positions = {}
+    for i, title in enumerate(header):
+        column = names.get((title or '').strip().lower())
+        if column and column not in positions:
+            positions[column] = i
+    missing = [label for column, label, required in FIELDS[kind] if required and column not in positions]
+    if missing:
+        raise ValueError('Missing required column(s): ' + ', '.join(missing))
+    return positions
+
+
+def _validate(kind, values, colleges):
+    """校验并规范化一行，返回 (记录, None) 或 (None, 原因)"""
+    record = {column: (values.get(column) or '').strip() or None for column, _, _ in FIELDS[kind]}
+    key = FIELDS[kind][0][0]
+
+    for column, label, required in FIELDS[kind]:
+        if required and not record[column]:
+            return None, f'{label} is required'
+    record[key] = record[key].upper()
+    if len(record[key]) > 20:
+        return None, f'{FIELDS[kind][0][1]} is too long'
+
+    id_card = record['id_card'].upper()
+    if not ID_CARD_RE.match(id_card):
+        return None, 'ID card must be 18 characters (17 digits + digit or X)'
+    record['id_card'] = id_card
+
+    if record['college_id'] not in colleges:
+        return None, f"College {record['college_id']} does not exist"
+
+    gender = record['gender']
+    if gender:
+        gender = gender.upper()
+        if gender not in GENDERS:
+            return None, 'Gender must be M or F'
+        record['gender'] = gender
+
+    if record['birth_date']:
+        try:
+            record['birth_date'] = date.fromisoformat(record['birth_date']).isoformat()
+        except ValueError:
+            return None, 'Date of birth must be YYYY-MM-DD'
+
+    if kind == 'student':
+        if record['phone'] and not PHONE_RE.match(record['phone']):
+            return None, 'Invalid phone number'
+        if record['enrollment_year']:
+            if not re.fullmatch(r'(19|20)\d\d', record['enrollment_year']):
+                return None, 'Enrollment year must be a 4-digit year'
+            record['enrollment_year'] = int(record['enrollment_year'])
+    return record, None
+
+
+def _existing(conn, table, column, values):
+    """values 中已存在于 table.column 的值（values 不超过一块，远低于 SQLite 的参数个数上限）"""
+    values = list(values)
+    sql = f"SELECT {column} FROM {table} WHERE {column} IN ({','.join('?' * len(values))})"
+    return {row[0] for row in conn.execute(sql, values)}
+
+
+def _insert_chunk(conn, kind, chunk, create_accounts, report):
+    """校验通过的一块行：去掉与库中重复的，插入并提交。chunk 为 [(行号, 记录)]"""
+    key = FIELDS[kind][0][0]
+    taken_keys = _existing(conn, kind, key, (record[key] for _, record in chunk))
+    taken_cards = _existing(conn, kind, 'id_card', (record['id_card'] for _, record in chunk))
+
+    rows = []
+    for line, record in chunk:
+        if record[key] in taken_keys:
+            report.error(line, record[key], f'{FIELDS[kind][0][1]} already exists')
+        elif record['id_card'] in taken_cards:
+            report.error(line, record[key], 'ID card already exists')
+        else:
+            rows.append((line, record))
+    if not rows:
+        return
+
+    columns = [column for column, _, _ in FIELDS[kind]]
+    insert_sql = (f"INSERT INTO {kind} ({', '.join(columns)}) "
+                  f"VALUES ({', '.join('?' * len(columns))})")
+    account_sql = """
+        INSERT OR IGNORE INTO account (username, password_hash, role, user_id, is_active)
+        VALUES (?, ?, ?, ?, 1)
+    """
+    try:
+        conn.executemany(insert_sql, [[record[c] for c in columns] for _, record in rows])
+        inserted = rows
+    except sqlite3.IntegrityError:
+        # 查重之后又被其他请求写入了同样的编号：逐行重试，找出冲突的行
+        conn.rollback()
+        inserted = []
+        for line, record in rows:
+            try:
+                conn.execute(insert_sql, [record[c] for c in columns])
+                inserted.append((line, record))
+            except sqlite3.IntegrityError as e:
+                report.error(line, record[key], str(e))
+
+    if create_accounts and inserted:
+        # rowcount 只计 INSERT 本身插入的行（不含触发器的改动），OR IGNORE 跳过的不计
+        created = conn.executemany(account_sql, [(record[key], INITIAL_PASSWORD, kind, record[key])
+                                                 for _, record in inserted]).rowcount
+        report.accounts += created
+        report.accounts_skipped += len(inserted) - created
+    conn.commit()
+    report.inserted += len(inserted)
+
+
+def import_csv(conn, kind, stream, create_accounts=False, chunk_rows=CHUNK_ROWS):
+    """
+    从二进制流 stream 导入 kind（'student' / 'teacher'）CSV，返回 ImportReport。
+    已提交的块不会因为后面的行出错而回滚；缺少必填列时不导入，记为第 1 行的错误；文件中途无法解码时在该处停止。
+    """
+    report = ImportReport(kind)
+    key = FIELDS[kind][0][0]
+    colleges = {row[0] for row in conn.execute("SELECT college_id FROM college")}
+    reader = csv.reader(open_csv(stream))
+    seen_keys, seen_cards = set(), set()
+    chunk = []
+    try:
+        header = next(reader, None)
+        if header is None:
+            report.error(1, '', 'The file is empty')
+            return report
+        try:
+            positions = _columns(kind, header)
+        except ValueError as e:
+            report.error(1, '', str(e))
+            return report
+
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            line = reader.line_num
+            report.rows += 1
+            values = {column: row[i] for column, i in positions.items() if i < len(row)}
+            record, message = _validate(kind, values, colleges)
+            if message:
+                report.error(line, (values.get(key) or '').strip(), message)
+                continue
+            # 文件内部的重复：保留第一次出现的行
+            if record[key] in seen_keys:
+                report.error(line, record[key], f'Duplicate {FIELDS[kind][0][1]} in file')
+                continue
+            if record['id_card'] in seen_cards:
+                report.error(line, record[key], 'Duplicate ID card in file')
+                continue
+            seen_keys.add(record[key])
+            seen_cards.add(record['id_card'])
+
+            chunk.append((line, record))
+            if len(chunk) >= chunk_rows:
+                _insert_chunk(conn, kind, chunk, create_accounts, report)
+                chunk = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        # 之前读到的行照常导入
+        report.error(reader.line_num + 1, '', f'Unreadable file, import stopped here: {e}')
+    if chunk:
+        _insert_chunk(conn, kind, chunk, create_accounts, report)
+    report.errors.sort()   # 格式错误在读取时记录，重复在插入时记录，按行号排列
+    return report
@@ -0,0 +1,125 @@
+# app/cache.py
+"""
+进程内 LRU 缓存
+
+按键缓存、超过 maxsize 时淘汰最久未使用的条目，内存占用与用户总数无关。
+get_or_build() 在缓存缺失时调用 build() 生成值；生成期间该键被 invalidate() 时
+不写入这份可能过期的结果（与 semester.py 的版本号检查同理，只是按键判断）。
+"""
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, name='cache'):
+        self.maxsize = maxsize
+        self.name = name
+        self._data = OrderedDict()
+        self._building = {}   # key -> 生成中的标记，invalidate 时移除
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_build(self, key, build, valid=None):
+        """
+        取缓存值，缺失（或 valid(value) 为假）时调用 build() 生成并缓存。
+        """
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING and (valid is None or valid(value)):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+            token = self._building[key] = object()
+
+        value = build()
+
+        with self._lock:
+            if self._building.get(key) is token:
+                del self._building[key]
+                self._put(key, value)
+        return value
+
+    def get_many(self, keys, build):
+        """
+        批量版 get_or_build：缺失的键一次交给 build(缺失键列表) 生成 {键: 值}，返回 {键: 值}。
+        生成期间被 invalidate() 的键不写入缓存（本次仍返回生成的值）。
+        """
+        found, tokens = {}, {}
+        with self._lock:
+            for key in keys:
+                value = self._data.get(key, _MISSING)
+                if value is _MISSING:
+                    tokens[key] = self._building[key] = object()
+                else:
+                    self._data.move_to_end(key)
+                    found[key] = value
+            self.hits += len(found)
+            self.misses += len(tokens)
+        if not tokens:
+            return found
+
+        built = build(list(tokens))
+
+        with self._lock:
+            for key, token in tokens.items():
+                if self._building.get(key) is token:
+                    del self._building[key]
+                    if key in built:
+                        self._put(key, built[key])
+        found.update(built)
+        return found
+
+    def invalidate(self, key):
+        with self._lock:
+            self._building.pop(key, None)
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._building.clear()
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
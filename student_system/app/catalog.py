@@ -0,0 +1,99 @@
+# app/catalog.py
+"""
+选课页面的课程目录快照
+
+当前学期的开课目录对所有学生都相同（座位数除外），因此整个进程共享一份
+按学院、课程名预先分组好的快照，以 (学期, 目录版本) 为键缓存。
+管理员修改课程、教师、学院或学期后调用 bump_catalog_version() 使其失效。
+每个学生的已选情况、学分、年级资格只在快照之上做轻量叠加，不再重跑大 JOIN。
+"""
+import threading
+from itertools import groupby
+from operator import itemgetter
+
+_lock = threading.Lock()
+_version = 0
+_snapshot = None
+
+
+class CatalogSnapshot:
+    """某学期开课目录的只读快照，sections 中的字典不可被修改"""
+
+    def __init__(self, semester_id, version, rows):
+        self.semester_id = semester_id
+        self.version = version
+        self.sections = {row['offered_id']: row for row in rows}
+
+        # 按 (学院, 课程名) 分组；rows 已按 course_name, time_slot 排序
+        self.groups = []
+        ordered = sorted(rows, key=itemgetter('college_name', 'course_name'))
+        for (college_name, course_name), group in groupby(ordered, key=itemgetter('college_name', 'course_name')):
+            sections = tuple(group)
+            rep = sections[0]
+            self.groups.append({
+                'college_id': rep['course_college_id'],
+                'college_name': college_name,
+                'course_name': course_name,
+                'credits': rep['credits'],
+                'target_grade': rep['target_grade'],
+                'sections': sections,
+            })
+
+        self.groups_by_college = {}
+        for group in self.groups:
+            self.groups_by_college.setdefault(group['college_id'], []).append(group)
+        for groups in self.groups_by_college.values():
+            groups.sort(key=itemgetter('course_name'))
+
+        self.college_names = {g['college_id']: g['college_name'] for g in self.groups}
+
+
+def bump_catalog_version():
+    """课程目录相关数据被修改后调用，下一次访问时重建快照"""
+    global _version, _snapshot
+    with _lock:
+        _version += 1
+        _snapshot = None
+
+
+def catalog_version():
+    return _version
+
+
+def get_catalog(conn, semester_id):
+    """返回指定学期的目录快照，缓存失效时才执行一次完整 JOIN"""
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.semester_id == semester_id and snapshot.version == _version:
+        return snapshot
+
+    version = _version
+    rows = conn.execute("""
+        SELECT oc.offered_id, c.course_name, t.name AS teacher_name, col.college_name,
+               oc.time_slot, oc.classroom, oc.capacity, oc.current_count,
+               c.college_id AS course_college_id,
+               c.target_grade,
+               c.credits
+        FROM offered_course oc
+        JOIN course c ON oc.course_id = c.course_id
+        JOIN teacher t ON oc.teacher_id = t.teacher_id
+        JOIN college col ON c.college_id = col.college_id
+        WHERE oc.semester_id = ?
+        ORDER BY c.course_name, oc.time_slot
+    """, (semester_id,)).fetchall()
+    snapshot = CatalogSnapshot(semester_id, version, [dict(row) for row in rows])
+
+    with _lock:
+        # 构建期间版本又被修改时，不缓存这份可能过期的快照
+        if version == _version:
+            _snapshot = snapshot
+    return snapshot
+
+
+def seat_counts(conn, semester_id):
+    """当前学期各班次的实时已选人数（快照中的 current_count 仅为构建时的值）"""
+    rows = conn.execute(
+        "SELECT offered_id, current_count FROM offered_course WHERE semester_id = ?",
+        (semester_id,)
+    ).fetchall()
+    return {row['offered_id']: row['current_count'] for row in rows}
@@ -0,0 +1,110 @@
+# app/counters.py
+"""
+表行数计数器
+
+管理员首页和各列表页的总数原来每次都 COUNT(*) 全表。现在由 SQLite 触发器维护 counters 表：
+- (表名, '')：student / teacher / course / account 的总行数
+- (表名.列名, 值)：按列分组的行数，如各入学年份的学生数、各学院的课程数
+
+触发器在 INSERT / DELETE（以及分组列被 UPDATE）时在同一事务内加减，任何写入途径
+（页面、tools 脚本、sqlite3 命令行）都会同步。check_counters() 与实际 COUNT(*) 对比，
+发现偏差时可以重建（tools/计数器校验.py）。
+"""
+
+# (scope, 表名, 分组列)，分组列为 None 表示只统计总数
+COUNTED = [
+    ('student', 'student', None),
+    ('teacher', 'teacher', None),
+    ('course', 'course', None),
+    ('account', 'account', None),
+    ('student.enrollment_year', 'student', 'enrollment_year'),
+    ('teacher.college_id', 'teacher', 'college_id'),
+    ('course.college_id', 'course', 'college_id'),
+]
+
+
+def _key(ref, column):
+    return f"COALESCE({ref}.{column}, '')" if column else "''"
+
+
+def _add(scope, key_sql, delta):
+    return (f"INSERT INTO counters (scope, key, value) VALUES ('{scope}', {key_sql}, {delta}) "
+            f"ON CONFLICT (scope, key) DO UPDATE SET value = value + {delta};")
+
+
+def counter_triggers():
+    """返回维护 counters 的触发器语句（先删除同名触发器，可重复执行）"""
+    statements = []
+    for table in dict.fromkeys(t for _, t, _ in COUNTED):
+        scopes = [(scope, column) for scope, t, column in COUNTED if t == table]
+        on_insert = ' '.join(_add(scope, _key('NEW', column), 1) for scope, column in scopes)
+        on_delete = ' '.join(_add(scope, _key('OLD', column), -1) for scope, column in scopes)
+        statements += [
+            f'DROP TRIGGER IF EXISTS trg_counters_{table}_insert',
+            f'CREATE TRIGGER trg_counters_{table}_insert AFTER INSERT ON "{table}" BEGIN {on_insert} END',
+            f'DROP TRIGGER IF EXISTS trg_counters_{table}_delete',
+            f'CREATE TRIGGER trg_counters_{table}_delete AFTER DELETE ON "{table}" BEGIN {on_delete} END',
+        ]
+        for scope, column in scopes:
+            if column is None:
+                continue
+            statements += [
+                f'DROP TRIGGER IF EXISTS trg_counters_{table}_{column}',
+                f'CREATE TRIGGER trg_counters_{table}_{column} AFTER UPDATE OF "{column}" ON "{table}" '
+                f'WHEN OLD."{column}" IS NOT NEW."{column}" BEGIN '
+                f'{_add(scope, _key("OLD", column), -1)} {_add(scope, _key("NEW", column), 1)} END',
+            ]
+    return statements
+
+
+def _actual(conn, scope, table, column):
+    """按实际数据统计 {key: count}"""
+    if column is None:
+        return {'': conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]}
+    rows = conn.execute(
+        f'SELECT COALESCE("{column}", \'\'), COUNT(*) FROM "{table}" GROUP BY 1'
+    ).fetchall()
+    return {str(key): count for key, count in rows}
+
+
+def rebuild_counters(conn):
+    """按实际数据重建全部计数器（调用方负责 commit）"""
+    conn.execute("DELETE FROM counters")
+    for scope, table, column in COUNTED:
+        conn.executemany(
+            "INSERT INTO counters (scope, key, value) VALUES (?, ?, ?)",
+            [(scope, key, count) for key, count in _actual(conn, scope, table, column).items()]
+        )
+
+
+def check_counters(conn, repair=False):
+    """
+    对比计数器和实际行数，返回偏差列表 [(scope, key, 计数器值, 实际值)]。
+    repair=True 且有偏差时重建计数器并提交。
+    """
+    drift = []
+    for scope, table, column in COUNTED:
+        stored = {str(key): value for key, value in conn.execute(
+            "SELECT key, value FROM counters WHERE scope = ?", (scope,)
+        ).fetchall()}
+        actual = _actual(conn, scope, table, column)
+        for key in sorted(set(stored) | set(actual)):
+            if stored.get(key, 0) != actual.get(key, 0):
+                drift.append((scope, key, stored.get(key, 0), actual.get(key, 0)))
+    if drift and repair:
+        rebuild_counters(conn)
+        conn.commit()
+    return drift
+
+
+def get_count(conn, scope, key=''):
+    """单个计数器的值，没有记录为 0"""
+    row = conn.execute("SELECT value FROM counters WHERE scope = ? AND key = ?", (scope, str(key))).fetchone()
+    return row[0] if row else 0
+
+
+def get_counts(conn, scope):
+    """某个分组计数器的全部取值 {key: count}（不含已减到 0 的）"""
+    return {key: value for key, value in conn.execute(
+        "SELECT key, value FROM counters WHERE scope = ? AND value > 0", (scope,)
+    ).fetchall()}
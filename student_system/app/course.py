@@ -1,8 +1,15 @@
 # app/course.py
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from app.db import get_db_connection
+from app.db import get_db_connection, get_read_connection
+from app.seat_ledger import get_ledger
+from app.catalog import get_catalog, seat_counts
+from app.semester import get_current_semester
+from app.identity import get_identity
+from app.grade_stats import invalidate_grade_stats
+from app.teacher_stats import record_enroll, record_drop
+from app.timetable import invalidate_timetable
+from app.timeslot import time_slot_mask
 from datetime import datetime
-from itertools import groupby
 from operator import itemgetter
 
 course_bp = Blueprint('course', __name__)
@@ -14,135 +21,100 @@ def select_course():
         flash('Please log in first!')
         return redirect(url_for('auth.login'))
 
-    student_id = session['username']
-    conn = get_db_connection()
+    student_id = get_identity().user_id
+    conn = get_read_connection()
 
     try:
         # === 1. 获取当前学期及选课时间窗口 ===
-        current_semester = conn.execute("""
-            SELECT semester_id, semester_name, selection_start, selection_end 
-            FROM semester 
-            WHERE is_current = 1
-        """).fetchone()
+        current_semester = get_current_semester(conn)
 
         if not current_semester:
             flash('No active semester found. Course selection is unavailable.')
             return redirect(url_for('main.dashboard'))
 
-        now = datetime.now().date()
-        selection_start = datetime.strptime(current_semester['selection_start'], '%Y-%m-%d %H:%M:%S').date()
-        selection_end = datetime.strptime(current_semester['selection_end'], '%Y-%m-%d %H:%M:%S').date()
-
-        if not (selection_start <= now <= selection_end):
+        if not current_semester.window_open_on():
+            selection_start = current_semester.selection_start.date() if current_semester.selection_start else 'N/A'
+            selection_end = current_semester.selection_end.date() if current_semester.selection_end else 'N/A'
             flash(f'❌ Course selection is not available at this time! Selection period: {selection_start} to {selection_end}')
             return redirect(url_for('main.dashboard'))
 
-        # === 2. 获取学生信息 ===
-        student = conn.execute(
-            "SELECT college_id, enrollment_year FROM student WHERE student_id = ?",
-            (student_id,)
-        ).fetchone()
-        if not student:
+        # === 2. 学生信息（登录时已解析）===
+        identity = get_identity()
+        if identity.enrollment_year is None:
             flash('Student information error!')
             return redirect(url_for('main.dashboard'))
 
-        student_college_id = student['college_id']
+        student_college_id = identity.college_id
         current_year = datetime.now().year
-        student_grade = current_year - student['enrollment_year'] + 1
-
-        # === 3. 查询所有本院当前学期课程（包括已选的）===
-        all_courses = conn.execute("""
-            SELECT oc.offered_id, c.course_name, t.name AS teacher_name, col.college_name,
-                   oc.time_slot, oc.classroom, oc.capacity, oc.current_count, 
-                   c.college_id AS course_college_id, 
-                   c.target_grade,
-                   c.credits
-            FROM offered_course oc
-            JOIN course c ON oc.course_id = c.course_id
-            JOIN teacher t ON oc.teacher_id = t.teacher_id
-            JOIN college col ON c.college_id = col.college_id
-            JOIN semester s ON oc.semester_id = s.semester_id
-            WHERE s.is_current = 1
-            ORDER BY c.course_name, oc.time_slot
-        """).fetchall()
-
-        all_courses = [dict(row) for row in all_courses]
-        my_college_list = [c for c in all_courses if c['course_college_id'] == student_college_id]
-
-        # === 4. 查询已选课程（精确到班次）===
-        enrolled = conn.execute("""
-            SELECT oc.offered_id, c.course_name, t.name AS teacher_name, col.college_name,
-                   oc.time_slot, oc.classroom, oc.capacity, oc.current_count, c.credits 
-            FROM enrollment e
-            JOIN offered_course oc ON e.offered_id = oc.offered_id
-            JOIN course c ON oc.course_id = c.course_id
-            JOIN teacher t ON oc.teacher_id = t.teacher_id
-            JOIN college col ON c.college_id = col.college_id
-            JOIN semester s ON oc.semester_id = s.semester_id
-            WHERE s.is_current = 1 AND e.student_id = ?
-            ORDER BY c.course_name
-        """, (student_id,)).fetchall()
+        student_grade = current_year - identity.enrollment_year + 1
+
+        # === 3. 取共享的课程目录快照（按学院、课程名预分组），叠加实时座位数 ===
+        semester_id = current_semester.semester_id
+        catalog = get_catalog(conn, semester_id)
+        ledger = get_ledger()
+        counts = ledger.seat_counts() if ledger is not None else seat_counts(conn, semester_id)
+
+        def with_seats(sec):
+            return dict(sec, current_count=counts.get(sec['offered_id'], sec['current_count']))
+
+        # === 4. 查询已选课程（精确到班次），课程详情直接取自快照 ===
+        if ledger is not None:
+            # 账本中包含尚未写回数据库的选课结果
+            enrolled_offered_ids = ledger.enrolled_ids(student_id)
+        else:
+            enrolled_offered_ids = {row['offered_id'] for row in conn.execute("""
+                SELECT e.offered_id
+                FROM enrollment e
+                JOIN offered_course oc ON e.offered_id = oc.offered_id
+                WHERE e.student_id = ? AND oc.semester_id = ?
+            """, (student_id, semester_id))}
 
+        enrolled_offered_ids &= catalog.sections.keys()
+        enrolled = sorted((with_seats(catalog.sections[oid]) for oid in enrolled_offered_ids),
+                          key=itemgetter('course_name'))
         total_credits = sum(course['credits'] for course in enrolled)
-
-        # 🔑 关键：记录已选的 offered_id 和 course_name
-        enrolled_offered_ids = {e['offered_id'] for e in enrolled}
         enrolled_course_names = {e['course_name'] for e in enrolled}
 
-        # === 5. 聚合本院课程，并为每个班次标记是否已选 + 排序 ===
-        my_college_list_sorted = sorted(my_college_list, key=itemgetter('course_name'))
+        # === 5. 本院课程：为每个班次标记是否已选 + 排序 ===
         my_college_courses_grouped = []
 
-        for course_name, group in groupby(my_college_list_sorted, key=itemgetter('course_name')):
-            sections = list(group)
-            rep = sections[0]
-            credits = rep['credits']
-            target_grade = rep['target_grade']
+        for group in catalog.groups_by_college.get(student_college_id, []):
+            course_name = group['course_name']
+            credits = group['credits']
+            target_grade = group['target_grade']
 
             already_enrolled = course_name in enrolled_course_names
 
             # 构建增强版班次列表：每个班次带 is_enrolled 标记
             enhanced_sections = []
             selectable_sections = []
-            for sec in sections:
-                is_enrolled = sec['offered_id'] in enrolled_offered_ids
-                enhanced_sec = dict(sec)
-                enhanced_sec['is_enrolled'] = is_enrolled
+            for sec in group['sections']:
+                enhanced_sec = with_seats(sec)
+                enhanced_sec['is_enrolled'] = sec['offered_id'] in enrolled_offered_ids
                 enhanced_sections.append(enhanced_sec)
 
                 # 判断是否可选（注意：这里逻辑必须和前端一致）
                 if (not already_enrolled
                         and sec['target_grade'] == student_grade
-                        and sec['current_count'] < sec['capacity']
+                        and enhanced_sec['current_count'] < sec['capacity']
                         and (total_credits + credits) <= 18):
                     selectable_sections.append(enhanced_sec)
 
-            # ✅【关键】对班次排序：可选的在前，不可选的在后
-            def section_sort_key(sec):
-                # 如果是可选班次，排前面（0），否则排后面（1）
-                is_selectable = (
-                        not already_enrolled
-                        and sec['target_grade'] == student_grade
-                        and sec['current_count'] < sec['capacity']
-                        and (total_credits + credits) <= 18
-                )
-                return (0 if is_selectable else 1, sec['time_slot'])  # 次级按时间排序
-
-            sorted_sections = sorted(enhanced_sections, key=section_sort_key)
-
-            # 判断整个课程是否“有可选项”
-            has_selectable = len(selectable_sections) > 0
+            # ✅【关键】对班次排序：可选的在前，不可选的在后（次级按时间排序）
+            selectable_ids = {sec['offered_id'] for sec in selectable_sections}
+            sorted_sections = sorted(enhanced_sections,
+                                     key=lambda sec: (0 if sec['offered_id'] in selectable_ids else 1, sec['time_slot']))
 
             my_college_courses_grouped.append({
                 'course_name': course_name,
                 'credits': credits,
-                'college_name': rep['college_name'],
+                'college_name': group['college_name'],
                 'target_grade': target_grade,
                 'sections': sorted_sections,  # ← 已排序的班次
                 'selectable_sections': selectable_sections,
                 'already_enrolled': already_enrolled,
                 'would_exceed_limit': (total_credits + credits) > 18,
-                '_has_selectable': has_selectable  # ← 用于课程排序
+                '_has_selectable': len(selectable_sections) > 0  # ← 用于课程排序
             })
 
         # ✅【关键】对课程整体排序：有可选班次的课程在前，完全不可选的在后
@@ -156,27 +128,12 @@ def select_course():
 
         my_college_courses_grouped.sort(key=course_sort_key)
 
-        # === 6. 聚合其他学院课程（按 course_name + college_name 分组）===
-        other_college_list = [c for c in all_courses if c['course_college_id'] != student_college_id]
-
-        # 提取所有其他学院的名称（用于下拉框）
-        other_colleges = sorted({c['college_name'] for c in other_college_list})
-
-        # 按 (college_name, course_name) 分组
-        other_college_list_sorted = sorted(other_college_list, key=lambda x: (x['college_name'], x['course_name']))
-        other_college_grouped = []
-
-        for (college_name, course_name), group in groupby(other_college_list_sorted,
-                                                          key=lambda x: (x['college_name'], x['course_name'])):
-            sections = list(group)
-            rep = sections[0]
-            other_college_grouped.append({
-                'college_name': college_name,
-                'course_name': course_name,
-                'credits': rep['credits'],
-                'target_grade': rep['target_grade'],
-                'sections': sections  # 所有班次
-            })
+        # === 6. 其他学院课程（快照中已按 college_name + course_name 分组排序）===
+        other_colleges = sorted(name for cid, name in catalog.college_names.items() if cid != student_college_id)
+        other_college_grouped = [
+            dict(group, sections=[with_seats(sec) for sec in group['sections']])
+            for group in catalog.groups if group['college_id'] != student_college_id
+        ]
 
         return render_template('student/select_course.html',
                                username=student_id,
@@ -196,7 +153,126 @@ def select_course():
         conn.close()
 
 
-from datetime import datetime
+def _selection_window(conn, semester_id):
+    """返回当前学期的选课起止时间 (start, end)；班次不属于当前学期或未设置时间时返回 None"""
+    semester = get_current_semester(conn)
+    if semester is None or semester.semester_id != semester_id or not semester.has_window:
+        return None
+    return semester.selection_start, semester.selection_end
+
+
+def _parse_offered_id(offered_id):
+    try:
+        return int(offered_id)
+    except (TypeError, ValueError):
+        return None
+
+
+# 选课校验一次取回：学生信息、班次信息、是否已选该班次/同名课程、
+# 已选学分合计、同学期时间冲突的课程名，替代原来逐项执行的 8 条查询
+# （选课时间窗口取自当前学期缓存）
+SELECTION_ELIGIBILITY_SQL = """
+    SELECT
+        st.college_id AS student_college_id,
+        st.enrollment_year,
+        oc.offered_id,
+        oc.semester_id,
+        oc.time_slot,
+        oc.time_mask,
+        c.college_id,
+        c.course_name,
+        c.target_grade,
+        c.credits,
+        EXISTS (
+            SELECT 1 FROM enrollment e
+            WHERE e.student_id = st.student_id AND e.offered_id = oc.offered_id
+        ) AS section_enrolled,
+        EXISTS (
+            SELECT 1
+            FROM enrollment e
+            JOIN offered_course oc2 ON e.offered_id = oc2.offered_id
+            JOIN course c2 ON oc2.course_id = c2.course_id
+            WHERE e.student_id = st.student_id AND c2.course_name = c.course_name
+        ) AS same_name_enrolled,
+        (
+            SELECT COALESCE(SUM(c3.credits), 0)
+            FROM enrollment e
+            JOIN offered_course oc3 ON e.offered_id = oc3.offered_id
+            JOIN course c3 ON oc3.course_id = c3.course_id
+            WHERE e.student_id = st.student_id
+        ) AS current_total,
+        (
+            SELECT GROUP_CONCAT(c4.course_name, ', ')
+            FROM enrollment e
+            JOIN offered_course oc4 ON e.offered_id = oc4.offered_id
+            JOIN course c4 ON oc4.course_id = c4.course_id
+            WHERE e.student_id = st.student_id
+              AND oc4.semester_id = oc.semester_id
+              AND (oc4.time_mask & oc.time_mask) != 0
+        ) AS conflict_names
+    FROM student st
+    LEFT JOIN offered_course oc ON oc.offered_id = ?
+    LEFT JOIN course c ON oc.course_id = c.course_id
+    WHERE st.student_id = ?
+"""
+
+
+def load_selection_eligibility(conn, student_id, offered_id):
+    """执行合并后的选课校验查询，学生不存在时返回 None"""
+    row = conn.execute(SELECTION_ELIGIBILITY_SQL, (offered_id, student_id)).fetchone()
+    if row is None or row['offered_id'] is None or row['time_mask'] is not None:
+        return row
+
+    # 尚未回填位图的旧数据：补算位图后单独查一次冲突
+    info = dict(row)
+    conflicts = conn.execute("""
+        SELECT c.course_name
+        FROM enrollment e
+        JOIN offered_course oc ON e.offered_id = oc.offered_id
+        JOIN course c ON oc.course_id = c.course_id
+        WHERE e.student_id = ? AND oc.semester_id = ? AND (oc.time_mask & ?) != 0
+    """, (student_id, info['semester_id'], time_slot_mask(info['time_slot']))).fetchall()
+    info['conflict_names'] = ', '.join(r['course_name'] for r in conflicts) or None
+    return info
+
+
+def check_selection_eligibility(info, semester=None):
+    """按原有顺序校验，返回第一条不满足的提示信息；全部通过返回 None。semester 为当前学期"""
+    if info is None:
+        return 'Student information error!'
+
+    if info['offered_id'] is None:
+        return 'Course does not exist!'
+
+    # 权限检查：本学院
+    if info['college_id'] != info['student_college_id']:
+        return '❌ You can only select courses offered by your own college!'
+
+    # 年级检查
+    student_grade = datetime.now().year - info['enrollment_year'] + 1
+    if info['target_grade'] != student_grade:
+        return f'❌ This course is only open to grade {info["target_grade"]} students!'
+
+    # 选课时间窗口检查（仅当前学期的班次有窗口）
+    if semester is not None and semester.semester_id == info['semester_id'] and semester.has_window:
+        if not semester.window_open_on():
+            return 'Course selection is not available outside the designated period!'
+
+    if info['section_enrolled']:
+        return '❌ You have already enrolled in this course section!'
+
+    if info['same_name_enrolled']:
+        return f'❌ You have already enrolled in “{info["course_name"]}” — duplicate course names are not allowed!'
+
+    new_total = info['current_total'] + (info['credits'] or 0)
+    if new_total > 15:
+        return f'❌ Enrollment failed: total credits would reach {new_total}, exceeding the 15-credit limit!'
+
+    if info['conflict_names']:
+        return f'❌ Time conflict! Overlaps with enrolled course(s): 「{info["conflict_names"]}」.'
+
+    return None
+
 
 @course_bp.route('/handle-select-course', methods=['POST'])
 def handle_select_course():
@@ -209,118 +285,32 @@ def handle_select_course():
         flash('Invalid course ID!')
         return redirect(url_for('course.select_course'))
 
-    student_id = session['username']
+    student_id = get_identity().user_id
+
+    # 启用座位账本时，全部校验和占座都在内存中完成，写库由账本批量异步完成；
+    # 账本使用自己的连接，这里不占用读写连接池（选课时间取自当前学期缓存，未命中时走只读连接）
+    ledger = get_ledger()
+    if ledger is not None:
+        def window_open(semester_id):
+            window = _selection_window(get_read_connection(), semester_id)
+            return window is None or window[0].date() <= datetime.now().date() <= window[1].date()
+
+        try:
+            error = ledger.enroll(student_id, _parse_offered_id(offered_id), window_open=window_open)
+            if not error:
+                invalidate_timetable(student_id)  # 写回数据库后账本会再失效一次
+            flash(error or '✅ Course selected successfully!')
+        except Exception as e:
+            flash(f'Enrollment failed: {str(e)}')
+        return redirect(url_for('course.select_course'))
+
     conn = get_db_connection()
     try:
-        # === 1. 获取学生信息 ===
-        student = conn.execute(
-            "SELECT college_id, enrollment_year FROM student WHERE student_id = ?",
-            (student_id,)
-        ).fetchone()
-        if not student:
-            flash('Student information error!')
-            return redirect(url_for('course.select_course'))
-        student_college_id = student['college_id']
-        current_year = datetime.now().year
-        student_grade = current_year - student['enrollment_year'] + 1
-
-        # === 2. 获取课程详细信息（用于权限、年级、时间等检查）===
-        course_info = conn.execute("""
-            SELECT 
-                c.college_id, 
-                oc.capacity, 
-                oc.time_slot,
-                c.target_grade,
-                c.course_name,
-                oc.semester_id
-            FROM offered_course oc
-            JOIN course c ON oc.course_id = c.course_id
-            WHERE oc.offered_id = ?
-        """, (offered_id,)).fetchone()
-
-        if not course_info:
-            flash('Course does not exist!')
-            return redirect(url_for('course.select_course'))
-
-        # === 3. 权限检查：本学院 ===
-        if course_info['college_id'] != student_college_id:
-            flash('❌ You can only select courses offered by your own college!')
-            return redirect(url_for('course.select_course'))
-
-        # === 4. 年级检查 ===
-        if course_info['target_grade'] != student_grade:
-            flash(f'❌ This course is only open to grade {course_info["target_grade"]} students!')
-            return redirect(url_for('course.select_course'))
-
-        # === 5. 选课时间窗口检查 ===
-        selection_info = conn.execute("""
-            SELECT s.selection_start, s.selection_end 
-            FROM semester s 
-            WHERE s.semester_id = ? AND s.is_current = 1
-        """, (course_info['semester_id'],)).fetchone()
-
-        if selection_info:
-            print("🔍 DEBUG: selection_start =", repr(selection_info['selection_start']))
-            print("🔍 DEBUG: selection_end   =", repr(selection_info['selection_end']))
-            now = datetime.now().date()
-            selection_start = datetime.strptime(selection_info['selection_start'], '%Y-%m-%d %H:%M:%S').date()
-            selection_end = datetime.strptime(selection_info['selection_end'], '%Y-%m-%d %H:%M:%S').date()
-            if not (selection_start <= now <= selection_end):
-                flash('Course selection is not available outside the designated period!')
-                return redirect(url_for('course.select_course'))
-
-        # === 6. 是否已选该班次 ===
-        if conn.execute("SELECT 1 FROM enrollment WHERE student_id = ? AND offered_id = ?",
-                        (student_id, offered_id)).fetchone():
-            flash('❌ You have already enrolled in this course section!')
-            return redirect(url_for('course.select_course'))
-
-        # === 7. 检查是否已选同名课程 ===
-        same_name_check = conn.execute("""
-            SELECT 1
-            FROM enrollment e
-            JOIN offered_course oc2 ON e.offered_id = oc2.offered_id
-            JOIN course c2 ON oc2.course_id = c2.course_id
-            WHERE e.student_id = ? AND c2.course_name = ?
-        """, (student_id, course_info['course_name'])).fetchone()
-
-        if same_name_check:
-            flash(f'❌ You have already enrolled in “{course_info["course_name"]}” — duplicate course names are not allowed!')
-            return redirect(url_for('course.select_course'))
-
-        # === 7.5 【新增】检查学分是否超限 ===
-        current_total = conn.execute("""
-                SELECT COALESCE(SUM(c.credits), 0) AS total
-                FROM enrollment e
-                JOIN offered_course oc ON e.offered_id = oc.offered_id
-                JOIN course c ON oc.course_id = c.course_id
-                WHERE e.student_id = ?
-            """, (student_id,)).fetchone()['total']
-
-        new_course_credits = conn.execute("""
-                SELECT credits 
-                FROM course c 
-                JOIN offered_course oc ON c.course_id = oc.course_id 
-                WHERE oc.offered_id = ?
-            """, (offered_id,)).fetchone()['credits']
-
-        if current_total + new_course_credits > 15:
-            flash(f'❌ Enrollment failed: total credits would reach {current_total + new_course_credits}, exceeding the 15-credit limit!')
-            return redirect(url_for('course.select_course'))
-
-        # === 8. 时间冲突检查 ===
-        new_time = course_info['time_slot']
-        conflicts = conn.execute("""
-            SELECT c.course_name
-            FROM enrollment e
-            JOIN offered_course oc ON e.offered_id = oc.offered_id
-            JOIN course c ON oc.course_id = c.course_id
-            WHERE e.student_id = ? AND oc.time_slot = ?
-        """, (student_id, new_time)).fetchall()
-
-        if conflicts:
-            conflict_names = ', '.join([row['course_name'] for row in conflicts])
-            flash(f'❌ Time conflict! Overlaps with enrolled course(s): 「{conflict_names}」.')
+        # === 1~8. 一条语句取回全部校验所需数据，再按原顺序逐项判断 ===
+        error = check_selection_eligibility(load_selection_eligibility(conn, student_id, offered_id),
+                                            get_current_semester(conn))
+        if error:
+            flash(error)
             return redirect(url_for('course.select_course'))
 
         # === 9. 【关键】原子化占位：尝试增加名额（仅当未满时）===
@@ -344,7 +334,9 @@ def handle_select_course():
             "INSERT INTO enrollment (student_id, offered_id, regular_score, exam_score, total_score) VALUES (?, ?, NULL, NULL, NULL)",
             (student_id, offered_id)
         )
+        record_enroll(conn, student_id, offered_id)  # 教师仪表盘统计
         conn.commit()
+        invalidate_timetable(student_id)
         flash('✅ Course selected successfully!')
 
     except Exception as e:
@@ -368,35 +360,54 @@ def drop_course():
         flash('Invalid course ID!')
         return redirect(url_for('main.dashboard'))
 
-    student_id = session['username']
+    student_id = get_identity().user_id
+
+    # 退课同样经过座位账本，保证内存座位数与数据库一致
+    ledger = get_ledger()
+    if ledger is not None:
+        def window_open(semester_id):
+            window = _selection_window(get_read_connection(), semester_id)
+            return window is None or window[0] <= datetime.now() <= window[1]
+
+        try:
+            error = ledger.drop(student_id, _parse_offered_id(offered_id), window_open=window_open)
+            if not error:
+                invalidate_timetable(student_id)
+            flash(error or '✅ Course dropped successfully!')
+        except Exception as e:
+            flash(f'Drop failed: {str(e)}')
+        return redirect(url_for('course.select_course'))
+
     conn = get_db_connection()
     try:
+        # 班次所属学期和是否已选一次查出，选课时间取自当前学期缓存
+        section = conn.execute("""
+            SELECT oc.semester_id,
+                   EXISTS (
+                       SELECT 1 FROM enrollment e
+                       WHERE e.student_id = ? AND e.offered_id = oc.offered_id
+                   ) AS enrolled
+            FROM offered_course oc
+            WHERE oc.offered_id = ?
+        """, (student_id, offered_id)).fetchone()
+
         # 选课时间检查
-        selection_info = conn.execute("""
-            SELECT s.selection_start, s.selection_end 
-            FROM semester s 
-            JOIN offered_course oc ON s.semester_id = oc.semester_id 
-            WHERE oc.offered_id = ? AND s.is_current = 1
-        """, (offered_id,)).fetchone()
-
-        if selection_info:
-            now = datetime.now()
-            selection_start = datetime.strptime(selection_info['selection_start'], '%Y-%m-%d %H:%M:%S')
-            selection_end = datetime.strptime(selection_info['selection_end'], '%Y-%m-%d %H:%M:%S')
-            if not (selection_start <= now <= selection_end):
-                flash('Drop period has ended. Please act within the allowed timeframe!')
-                return redirect(url_for('course.select_course'))
-
-        exists = conn.execute("SELECT 1 FROM enrollment WHERE student_id = ? AND offered_id = ?",
-                              (student_id, offered_id)).fetchone()
-        if not exists:
+        window = _selection_window(conn, section['semester_id']) if section else None
+        if window and not (window[0] <= datetime.now() <= window[1]):
+            flash('Drop period has ended. Please act within the allowed timeframe!')
+            return redirect(url_for('course.select_course'))
+
+        if not section or not section['enrolled']:
             flash('❌ You are not enrolled in this course — cannot drop!')
             return redirect(url_for('course.select_course'))
 
-        # 执行退选 + 减少人数
+        # 执行退选 + 减少人数（教师仪表盘统计须在删除前更新）
+        record_drop(conn, student_id, offered_id)
         conn.execute("DELETE FROM enrollment WHERE student_id = ? AND offered_id = ?", (student_id, offered_id))
         conn.execute("UPDATE offered_course SET current_count = current_count - 1 WHERE offered_id = ?", (offered_id,))
         conn.commit()
+        invalidate_timetable(student_id)
+        invalidate_grade_stats(_parse_offered_id(offered_id))
         flash('✅ Course dropped successfully!')
 
     except Exception as e:
@@ -1,40 +1,187 @@
 # app/db.py
-from flask import g
-from werkzeug.security import generate_password_hash
+from flask import g, current_app, has_app_context
+from contextlib import contextmanager
+import queue
 import sqlite3
-from config import Config
+import threading
+from app.sqlstats import timed_execute
+from app.hashing import hash_password
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PooledConnection(sqlite3.Connection):
+    """连接池中的长连接：视图里手动调用的 close() 不再真正关闭，请求结束时统一归还连接池"""
+    sql_stats = None  # 请求期间挂上 RequestSQLStats，execute 会被计时
+
+    def execute(self, sql, parameters=()):
+        if self.sql_stats is None:
+            return super().execute(sql, parameters)
+        return timed_execute(self, self.sql_stats, 'execute', sql, parameters)
+
+    def executemany(self, sql, parameters):
+        if self.sql_stats is None:
+            return super().executemany(sql, parameters)
+        return timed_execute(self, self.sql_stats, 'executemany', sql, parameters)
+
+    def close(self):
+        pass
+
+    def really_close(self):
+        sqlite3.Connection.close(self)
+
+
+class ConnectionPool:
+    """有上限的 SQLite 连接池，连接在请求之间复用，省去每次 connect 和 PRAGMA 的开销"""
+
+    def __init__(self, database, size=8, readonly=False, timeout=20.0,
+                 cache_size_kb=8192, mmap_size=128 * 1024 * 1024, cached_statements=512):
+        self.database = database
+        self.size = size
+        self.readonly = readonly
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=PooledConnection
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON;')
+        if not self.readonly:
+            # WAL 下读不阻塞写、写不阻塞读；journal_mode 会持久保存在数据库文件中
+            conn.execute('PRAGMA journal_mode = WAL;')
+        conn.execute('PRAGMA synchronous = NORMAL;')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)};')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)};')
+        if self.readonly:
+            conn.execute('PRAGMA query_only = ON;')
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError('database connection pool exhausted')
+
+    def release(self, conn, error=None):
+        conn.sql_stats = None
+        try:
+            # 未提交的修改（或出错的事务）一律回滚，保证下一个使用者拿到干净的连接
+            if error is not None or conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.really_close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception as e:
+            self.release(conn, e)
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.really_close()
+            with self._lock:
+                self._created -= 1
+
+
+def get_pool(database=None, readonly=False):
+    """按 (数据库, 是否只读) 取进程内共享的连接池，数据库路径默认取 current_app.config['DATABASE']"""
+    if database is None:
+        database = current_app.config['DATABASE']
+    key = (database, readonly)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    if readonly:
+        # 只读连接不能修改 journal_mode，先由读写连接池把数据库切换到 WAL
+        with get_pool(database).connection():
+            pass
+    size = current_app.config.get('DB_POOL_SIZE', 8) if has_app_context() else 8
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(database, size=size, readonly=readonly)
+            _pools[key] = pool
+    return pool
 
-DATABASE = Config.DATABASE
 
 def get_db_connection():
-    """使用 flask.g 管理数据库连接，避免多线程锁和泄漏"""
+    """从连接池取读写连接，请求内复用，请求结束时由 close_db 归还"""
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            DATABASE,
-            timeout=20.0,
-            check_same_thread=False
-        )
-        g.db.row_factory = sqlite3.Row
-        g.db.execute('PRAGMA foreign_keys = ON;')
+        g.db = get_pool().acquire()
+        g.db.sql_stats = g.get('sql_stats')
     return g.db
 
+
+def get_read_connection():
+    """GET 页面使用的只读连接（query_only），WAL 模式下不会被选课写事务阻塞"""
+    if 'read_db' not in g:
+        g.read_db = get_pool(readonly=True).acquire()
+        g.read_db.sql_stats = g.get('sql_stats')
+    return g.read_db
+
+
 def close_db(error):
-    """请求结束时关闭数据库连接，出错则回滚"""
+    """请求结束时把连接归还连接池，出错或有未提交事务则回滚"""
     db = g.pop('db', None)
     if db is not None:
-        if error:
-            db.rollback()
-        db.close()
+        get_pool().release(db, error)
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        get_pool(readonly=True).release(read_db, error)
 
 def init_admin():
     """初始化管理员账号"""
     conn = get_db_connection()
     admin = conn.execute("SELECT 1 FROM account WHERE username = 'admin'").fetchone()
     if not admin:
-        hashed = generate_password_hash('admin123')
+        hashed = hash_password('admin123')
         conn.execute(
             "INSERT INTO account (username, password_hash, role, user_id, is_active) VALUES (?, ?, ?, ?, ?)",
             ('admin', hashed, 'admin', '1', 1)
         )
         conn.commit()
-        print("✅ 自动创建管理员账号: admin / admin123")
\ No newline at end of file
+        print("✅ 自动创建管理员账号: admin / admin123")
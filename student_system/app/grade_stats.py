@@ -0,0 +1,233 @@
+# app/grade_stats.py
+"""
+成绩分布统计
+
+教师的课程详情页原来只列出每个学生的成绩，均值、中位数、及格率、分数段都要导出后自己算。
+这里为每个班次计算总评成绩的分布，并汇总到整门课程、整个学院或全校：
+- 按 offered_id 分批的 GROUP BY offered_id, total_score 查询一次读完这些班次的分数
+  （只读覆盖索引 idx_enrollment_grades 中对应的区间，不回表、不排序），每个班次得到
+  0–100 分的直方图和人数、和、平方和、最低 / 最高分
+- 直方图、人数、和、平方和都可以直接相加：课程 / 学院 / 全校的汇总由各班次的摘要合并，
+  不再扫描明细；百分位数取自合并后的直方图，对整数总评是精确值（旧数据中带小数的总评
+  按整数分档，百分位数误差小于 1 分；均值、标准差用精确的和计算）
+- 每个班次的摘要按 offered_id 缓存（LRU，最多 Config.GRADE_STATS_CACHE_SIZE 个班次），
+  汇总时只查询缓存中没有的班次
+只统计已有总评的选课记录，选课人数 / 未出成绩人数取自 section_stats。
+修改成绩、退课的事务提交之后调用 invalidate_grade_stats(offered_id)；选课只增加没有成绩的记录，不影响统计。
+"""
+import math
+from itertools import groupby
+from operator import itemgetter
+
+from app.cache import LRUCache
+
+DEFAULT_SIZE = 50000   # 每个班次约 1 KB；应不少于全校班次数，全校汇总才能全部命中缓存
+PASS_MARK = 60
+# 分数段：(名称, 最低分, 最高分)
+BUCKETS = [('0–59', 0, 59), ('60–69', 60, 69), ('70–79', 70, 79), ('80–89', 80, 89), ('90–100', 90, 100)]
+_IN_BATCH = 500   # 每条查询的 offered_id 个数
+
+_cache = None
+
+
+class GradeSummary:
+    """一组已出成绩的选课记录的总评分布，可与其他摘要合并（只读）"""
+    __slots__ = ('count', 'total', 'squares', 'low', 'high', 'histogram')
+
+    def __init__(self, count=0, total=0.0, squares=0.0, low=None, high=None, histogram=None):
+        self.count = count
+        self.total = total
+        self.squares = squares
+        self.low = low
+        self.high = high
+        self.histogram = histogram or [0] * 101   # histogram[n]：总评取整后为 n 分的人数
+
+    @classmethod
+    def merge(cls, summaries):
+        summaries = [s for s in summaries if s.count]
+        if not summaries:
+            return cls()
+        return cls(
+            count=sum(s.count for s in summaries),
+            total=sum(s.total for s in summaries),
+            squares=sum(s.squares for s in summaries),
+            low=min(s.low for s in summaries),
+            high=max(s.high for s in summaries),
+            histogram=[sum(column) for column in zip(*(s.histogram for s in summaries))],
+        )
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def stddev(self):
+        """总体标准差"""
+        if not self.count:
+            return None
+        return math.sqrt(max(self.squares / self.count - self.mean ** 2, 0.0))
+
+    def _value_at(self, index):
+        """从低到高第 index 个（从 0 开始）分数"""
+        seen = 0
+        for score, n in enumerate(self.histogram):
+            seen += n
+            if seen > index:
+                return score
+        return 100
+
+    def percentile(self, q):
+        """第 q 百分位数（相邻两个分数之间线性插值）"""
+        if not self.count:
+            return None
+        rank = q / 100 * (self.count - 1)
+        index = int(rank)
+        low = self._value_at(index)
+        if rank == index:
+            return float(low)
+        return low + (self._value_at(index + 1) - low) * (rank - index)
+
+    @property
+    def passed(self):
+        return sum(self.histogram[PASS_MARK:])
+
+    def buckets(self):
+        """[(分数段, 人数, 占比 %)]"""
+        return [(name, n, n * 100 / self.count if self.count else 0)
+                for name, n in ((name, sum(self.histogram[low:high + 1])) for name, low, high in BUCKETS)]
+
+    def metrics(self):
+        """模板使用的各项指标，没有成绩时除人数外均为 None"""
+        return {
+            'graded': self.count,
+            'mean': self.mean,
+            'stddev': self.stddev,
+            'min': self.low,
+            'max': self.high,
+            'p25': self.percentile(25),
+            'median': self.percentile(50),
+            'p75': self.percentile(75),
+            'p90': self.percentile(90),
+            'pass_rate': self.passed * 100 / self.count if self.count else None,
+            'buckets': self.buckets(),
+        }
+
+
+def init_grade_stats_cache(app):
+    global _cache
+    _cache = LRUCache(app.config.get('GRADE_STATS_CACHE_SIZE', DEFAULT_SIZE), name='grade_stats')
+    return _cache
+
+
+def get_grade_stats_cache():
+    global _cache
+    if _cache is None:
+        _cache = LRUCache(DEFAULT_SIZE, name='grade_stats')
+    return _cache
+
+
+def _accumulate(rows):
+    """
+    (offered_id, total_score, 人数) 按班次累加成 {offered_id: GradeSummary}。
+    rows 按 offered_id 有序（GROUP BY 沿索引顺序输出），每个班次的各项和在局部变量中累加。
+    """
+    result = {}
+    for offered_id, group in groupby(rows, itemgetter(0)):
+        histogram = [0] * 101
+        count = total = squares = 0
+        low = high = None
+        for _, score, n in group:
+            histogram[min(max(int(score), 0), 100)] += n
+            count += n
+            total += score * n
+            squares += score * score * n
+            if low is None or score < low:
+                low = score
+            if high is None or score > high:
+                high = score
+        result[offered_id] = GradeSummary(count, total, squares, low, high, histogram)
+    return result
+
+
+def _load(conn, offered_ids):
+    """
+    按班次从 enrollment 计算摘要；没有成绩的班次得到空摘要。
+    按 offered_id 分批查询，每批只读取这些班次在索引中的区间（即使要计算全校的班次，
+    也比整表扫描后丢弃不需要的行快）。
+    """
+    sql = """
+        SELECT offered_id, total_score, COUNT(*) FROM enrollment
+        WHERE offered_id IN ({marks}) AND total_score IS NOT NULL
+        GROUP BY offered_id, total_score
+    """
+    offered_ids = sorted(offered_ids)
+    result = {}
+    for i in range(0, len(offered_ids), _IN_BATCH):
+        part = offered_ids[i:i + _IN_BATCH]
+        result.update(_accumulate(conn.execute(sql.format(marks=','.join('?' * len(part))), part)))
+    for offered_id in offered_ids:
+        result.setdefault(offered_id, GradeSummary())
+    return result
+
+
+def section_summaries(conn, offered_ids):
+    """{offered_id: GradeSummary}，优先取缓存"""
+    return get_grade_stats_cache().get_many(offered_ids, lambda missing: _load(conn, missing))
+
+
+def section_summary(conn, offered_id):
+    return section_summaries(conn, [offered_id])[offered_id]
+
+
+def rollup(conn, offered_ids):
+    """若干班次合并后的摘要"""
+    return GradeSummary.merge(section_summaries(conn, list(offered_ids)).values())
+
+
+def _sections(conn, course_id=None, college_id=None, semester_id=None):
+    """符合条件的班次 [(offered_id, course_id, college_id)]（课程的开课学院）"""
+    sql = """
+        SELECT oc.offered_id, oc.course_id, c.college_id
+        FROM offered_course oc
+        JOIN course c ON oc.course_id = c.course_id
+    """
+    clauses, params = [], []
+    for column, value in (('oc.course_id', course_id), ('c.college_id', college_id), ('oc.semester_id', semester_id)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return conn.execute(sql, params).fetchall()
+
+
+def course_summary(conn, course_id, semester_id=None):
+    """一门课程所有班次（可限定学期）的合并分布"""
+    return rollup(conn, [row[0] for row in _sections(conn, course_id=course_id, semester_id=semester_id)])
+
+
+def college_summary(conn, college_id, semester_id=None):
+    """一个学院开设的所有课程的合并分布"""
+    return rollup(conn, [row[0] for row in _sections(conn, college_id=college_id, semester_id=semester_id)])
+
+
+def breakdown(conn, by, college_id=None, semester_id=None):
+    """
+    按学院（by='college'）或课程（by='course'）分组汇总，返回 (全部合计, {分组键: GradeSummary})。
+    所有班次的摘要一次取出（缺少的一次算出），各组在内存中合并。
+    """
+    sections = _sections(conn, college_id=college_id, semester_id=semester_id)
+    summaries = section_summaries(conn, [row[0] for row in sections])
+    position = 1 if by == 'course' else 2
+    groups = {}
+    for row in sections:
+        groups.setdefault(row[position], []).append(summaries[row[0]])
+    return (GradeSummary.merge(summaries.values()),
+            {key: GradeSummary.merge(members) for key, members in groups.items()})
+
+
+def invalidate_grade_stats(*offered_ids):
+    """班次的成绩变化（修改成绩、重算总评、退课）后调用（在事务提交之后）"""
+    cache = get_grade_stats_cache()
+    for offered_id in offered_ids:
+        cache.invalidate(offered_id)
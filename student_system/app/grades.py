@@ -0,0 +1,143 @@
+# app/grades.py
+"""
+成绩批量写入
+
+成绩录入页原来逐个学生 UPDATE，在循环里换算总评、逐行捕获异常并逐行 flash。现在：
+- 先校验整张表单（或整个上传的成绩单），有错误时一条也不写，把所有错误一次列出
+- 校验通过后用一条 executemany 在一个事务内写入，分数和总评都没有变化的行不改动
+- 总评公式只在 SQL 中定义一处（_total），表单保存、成绩单上传、单个学生修改、修改比例后重算共用；
+  重算是作用于整个班次的一条 UPDATE
+- 总评按整数运算四舍五入（与页面上 Math.round 的预览一致），不受 0.4、0.6 这类浮点误差影响
+
+函数不提交事务：调用方提交后使相关学生的课表缓存失效（invalidate_timetable），
+有成绩变化时再使班次的成绩统计失效（invalidate_grade_stats）。
+"""
+import csv
+import math
+
+from app.bulk_import import open_csv
+from app.teacher_stats import refresh_sections
+
+DEFAULT_REGULAR_RATIO = 40
+
+# 成绩单的列，与 teacher.export_grades 导出的一致；total_score 列只是参考，上传时按比例重算
+SHEET_HEADER = ['student_id', 'name', 'regular_score', 'exam_score', 'total_score']
+
+
+def _total(regular, exam):
+    """总评 = 平时 × 比例 + 考试 × (100 - 比例)，四舍五入取整；任一项为空时为空"""
+    return f"CAST(({regular} * :ratio + {exam} * (100 - :ratio) + 50) / 100 AS INTEGER)"
+
+
+_SAVE_SQL = f"""
+    UPDATE enrollment
+    SET regular_score = :regular, exam_score = :exam, total_score = {_total(':regular', ':exam')}
+    WHERE enrollment_id = :enrollment_id AND offered_id = :offered_id
+      AND (regular_score IS NOT :regular OR exam_score IS NOT :exam
+           OR total_score IS NOT {_total(':regular', ':exam')})
+"""
+
+_RECOMPUTE_SQL = f"""
+    UPDATE enrollment
+    SET total_score = {_total('regular_score', 'exam_score')}
+    WHERE offered_id = :offered_id AND total_score IS NOT {_total('regular_score', 'exam_score')}
+"""
+
+
+def parse_ratio(value):
+    """平时成绩比例（0–100 的整数），不合法时抛出 ValueError"""
+    try:
+        ratio = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('平时成绩和考试成绩比例必须是数字！')
+    if not ratio.is_integer() or not 0 <= ratio <= 100:
+        raise ValueError('平时成绩比例必须是 0 到 100 之间的整数！')
+    return int(ratio)
+
+
+def parse_score(value):
+    """分数文本 -> None（空）/ 0–100 的数，不合法时抛出 ValueError"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        score = float(value)
+    except ValueError:
+        raise ValueError(f'“{value}” 不是有效的分数')
+    if not math.isfinite(score) or not 0 <= score <= 100:
+        raise ValueError(f'分数 {value} 超出 0–100 的范围')
+    return int(score) if score.is_integer() else round(score, 2)
+
+
+def read_grade_form(form, roster):
+    """
+    校验成绩录入表单。roster 为 [(enrollment_id, student_id, name)]，
+    返回 (成绩列表 [(enrollment_id, 平时, 考试)], 错误列表 [(学号, 姓名, 原因)])
+    """
+    grades, errors = [], []
+    for enrollment_id, student_id, name in roster:
+        try:
+            regular = parse_score(form.get(f'regular_{enrollment_id}'))
+            exam = parse_score(form.get(f'exam_{enrollment_id}'))
+        except ValueError as e:
+            errors.append((student_id, name, str(e)))
+            continue
+        grades.append((enrollment_id, regular, exam))
+    return grades, errors
+
+
+def read_grade_sheet(stream, roster):
+    """
+    校验上传的成绩单（CSV，按学号对应，可以只包含部分学生）。roster 为 {学号: enrollment_id}，
+    返回 (成绩列表 [(enrollment_id, 平时, 考试)], 错误列表 [(行号, 学号, 原因)])
+    """
+    grades, errors = [], []
+    reader = csv.reader(open_csv(stream))
+    try:
+        header = [(title or '').strip().lower() for title in next(reader, [])]
+        missing = [column for column in ('student_id', 'regular_score', 'exam_score') if column not in header]
+        if missing:
+            return [], [(1, '', '缺少列：' + ', '.join(missing))]
+        key, regular_at, exam_at = (header.index(c) for c in ('student_id', 'regular_score', 'exam_score'))
+
+        seen = set()
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            line = reader.line_num
+            row = row + [''] * (len(header) - len(row))
+            student_id = row[key].strip().upper()
+            if student_id not in roster:
+                errors.append((line, student_id, '该学生没有选这门课'))
+                continue
+            if student_id in seen:
+                errors.append((line, student_id, '学号重复'))
+                continue
+            seen.add(student_id)
+            try:
+                grades.append((roster[student_id], parse_score(row[regular_at]), parse_score(row[exam_at])))
+            except ValueError as e:
+                errors.append((line, student_id, str(e)))
+    except (UnicodeDecodeError, csv.Error) as e:
+        errors.append((reader.line_num + 1, '', f'文件无法读取：{e}'))
+    return grades, errors
+
+
+def save_grades(conn, offered_id, grades, regular_ratio):
+    """一次写入整个班次的成绩 [(enrollment_id, 平时, 考试)]，返回实际改动的行数"""
+    changed = conn.executemany(_SAVE_SQL, [
+        {'enrollment_id': enrollment_id, 'offered_id': offered_id,
+         'regular': regular, 'exam': exam, 'ratio': regular_ratio}
+        for enrollment_id, regular, exam in grades
+    ]).rowcount
+    if changed:
+        refresh_sections(conn, [offered_id])   # 未出成绩人数可能变化
+    return changed
+
+
+def recompute_totals(conn, offered_id, regular_ratio):
+    """按新的比例重算班次内所有总评（一条 UPDATE），返回改动的行数"""
+    changed = conn.execute(_RECOMPUTE_SQL, {'offered_id': offered_id, 'ratio': regular_ratio}).rowcount
+    if changed:
+        refresh_sections(conn, [offered_id])
+    return changed
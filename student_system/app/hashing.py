@@ -0,0 +1,312 @@
+# app/hashing.py
+"""
+密码哈希执行器
+
+check_password_hash / generate_password_hash 故意设计得很耗 CPU。选课当天整届学生同时登录时，
+在请求线程里直接计算会占满唯一的工作线程。这里把哈希计算交给进程池，可以用满所有 CPU 核心：
+- 同时排队 + 计算中的任务数不超过 HASH_MAX_PENDING，超出时立即抛出 HashingBusy，
+  视图返回“请稍后再试”，而不是让请求无限排队
+- 记录队列深度、排队等待时间和哈希计算耗时，显示在管理员 SQL Diagnostics 页面
+
+哈希算法和参数由 Config.PASSWORD_HASH_METHOD / PASSWORD_SALT_LENGTH 决定。
+登录成功后如果发现已存储的哈希不符合当前设置，在后台用当前设置重新计算并写回，
+用户无需重置密码（tools/密码哈希基准.py 用于比较各候选设置的登录吞吐量）：
+- 后台重新计算有单独的名额（HASH_MAX_BACKGROUND），不占用登录请求的 HASH_MAX_PENDING
+- 计算结果交给专门的写回线程写入数据库。完成回调运行在进程池的管理线程中，
+  在回调里等待连接池会卡住所有哈希任务的结果（登录请求拿着连接等结果，形成互相等待）
+- 写回队列有上限（REHASH_QUEUE_SIZE），满了就跳过这次升级；未启用执行器时哈希也由写回线程逐个计算，
+  不会为每次登录新开线程
+
+未启用（HASH_EXECUTOR_ENABLED = False）或在 tools 脚本中未初始化时，直接在当前线程计算。
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import Config
+
+LATENCY_SAMPLES = 1000
+REHASH_QUEUE_SIZE = 64
+BUSY_MESSAGE = 'The server is busy right now. Please try again in a few seconds.'
+
+_executor = None
+_policy = {
+    'method': getattr(Config, 'PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+    'salt_length': getattr(Config, 'PASSWORD_SALT_LENGTH', 16),
+}
+_rehash = {'scheduled': 0, 'written': 0, 'skipped': 0, 'failed': 0}
+_rehash_lock = threading.Lock()
+# (数据库, 用户名, 新哈希, 旧哈希, 哈希参数)，由写回线程写入；新哈希为 None 时由写回线程按哈希参数计算
+_rehash_writes = queue.Queue(maxsize=REHASH_QUEUE_SIZE)
+_rehash_writer = None
+
+
+class HashingBusy(Exception):
+    """哈希队列已满（或等待超时），调用方应提示用户稍后再试"""
+
+
+def _run_hash(op, args):
+    """在子进程中执行，返回 (结果, 计算耗时ms)"""
+    start = time.perf_counter()
+    if op == 'check':
+        result = check_password_hash(*args)
+    else:
+        result = generate_password_hash(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class HashingExecutor:
+    def __init__(self, workers=None, max_pending=64, timeout=10.0, max_background=2):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.max_background = max_background
+        self.timeout = timeout
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._background_slots = threading.BoundedSemaphore(max_background)
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._background = 0
+        self._max_seen = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._total_ms = deque(maxlen=LATENCY_SAMPLES)   # 提交到拿到结果
+        self._hash_ms = deque(maxlen=LATENCY_SAMPLES)    # 子进程中的纯计算时间
+
+    def _submit(self, op, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy()
+
+        with self._lock:
+            self._pending += 1
+            self._max_seen = max(self._max_seen, self._pending)
+        start = time.perf_counter()
+        future = self._pool.submit(_run_hash, op, args)
+        try:
+            result, hash_ms = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # 还没开始计算的直接取消
+            with self._lock:
+                self._timeouts += 1
+            raise HashingBusy()
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+        with self._lock:
+            self._completed += 1
+            self._total_ms.append((time.perf_counter() - start) * 1000)
+            self._hash_ms.append(hash_ms)
+        return result
+
+    def submit_background(self, callback, op, *args):
+        """
+        不等待结果的后台任务，完成后在进程池的管理线程中调用 callback(result)。
+        使用单独的 max_background 个名额，不占用登录请求的名额；名额用完时不提交，返回 False。
+        callback 必须立即返回（不能访问数据库或等待锁），否则会耽误所有任务的结果。
+        """
+        if not self._background_slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._background += 1
+
+        def done(future):
+            with self._lock:
+                self._background -= 1
+            self._background_slots.release()
+            if not future.cancelled() and future.exception() is None:
+                callback(future.result()[0])
+
+        self._pool.submit(_run_hash, op, args).add_done_callback(done)
+        return True
+
+    def warm_up(self):
+        """启动时预先创建全部子进程，避免之后在多线程请求中 fork"""
+        for future in [self._pool.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    def check_password_hash(self, pwhash, password):
+        return self._submit('check', pwhash, password)
+
+    def generate_password_hash(self, password, method, salt_length):
+        return self._submit('generate', password, method, salt_length)
+
+    def stats(self):
+        with self._lock:
+            total, hashed = list(self._total_ms), list(self._hash_ms)
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'background': self._background,
+                'max_background': self.max_background,
+                'max_seen': self._max_seen,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'total_p50': _percentile(total, 50),
+                'total_p95': _percentile(total, 95),
+                'hash_p50': _percentile(hashed, 50),
+                'hash_p95': _percentile(hashed, 95),
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def configure_hash_policy(config):
+    """从应用配置读取哈希算法及参数（如 'scrypt:32768:8:1'、'pbkdf2:sha256:600000'）"""
+    _policy['method'] = config.get('PASSWORD_HASH_METHOD', _policy['method'])
+    _policy['salt_length'] = config.get('PASSWORD_SALT_LENGTH', _policy['salt_length'])
+
+
+def hash_policy():
+    return dict(_policy)
+
+
+def needs_rehash(pwhash):
+    """已存储的哈希（method$salt$hash）是否与当前设置不同"""
+    try:
+        method, salt, _ = pwhash.split('$', 2)
+    except (AttributeError, ValueError):
+        return False
+    return method != _policy['method'] or len(salt) != _policy['salt_length']
+
+
+# 批量导入创建的账号不立即计算哈希，password_hash 记为 INITIAL_PASSWORD，表示密码仍是初始密码
+# （身份证后 6 位）。登录时按身份证号比对（见 auth.py），成功后由 rehash_in_background 换成
+# 正常哈希。初始密码本来就能从 student / teacher 表中的身份证号得到，先不计算哈希并不降低安全性；
+# 它不是合法的 werkzeug 哈希，check_password 对它总是返回 False。
+INITIAL_PASSWORD = '!initial'
+DEFAULT_PASSWORD = '123456'
+
+
+def initial_password(id_card):
+    """初始密码：身份证后 6 位，没有身份证号时为 123456"""
+    return id_card[-6:] if id_card and len(id_card) >= 6 else DEFAULT_PASSWORD
+
+
+def init_hashing(app):
+    """按配置创建全局哈希执行器，并在处理请求之前启动子进程"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+    _executor = HashingExecutor(
+        workers=app.config.get('HASH_WORKERS'),
+        max_pending=app.config.get('HASH_MAX_PENDING', 64),
+        timeout=app.config.get('HASH_TIMEOUT', 10.0),
+        max_background=app.config.get('HASH_MAX_BACKGROUND', 2),
+    )
+    _executor.warm_up()
+    atexit.register(_executor.shutdown)
+    return _executor
+
+
+def get_hashing_executor():
+    """未启用时返回 None"""
+    return _executor
+
+
+def check_password(pwhash, password):
+    """校验密码；执行器繁忙时抛出 HashingBusy"""
+    if _executor is None:
+        return check_password_hash(pwhash, password)
+    return _executor.check_password_hash(pwhash, password)
+
+
+def hash_password(password):
+    """按当前设置生成密码哈希；执行器繁忙时抛出 HashingBusy"""
+    if _executor is None:
+        return generate_password_hash(password, _policy['method'], _policy['salt_length'])
+    return _executor.generate_password_hash(password, _policy['method'], _policy['salt_length'])
+
+
+def _count_rehash(key):
+    with _rehash_lock:
+        _rehash[key] += 1
+
+
+def _write_rehashes():
+    """写回线程：逐个写入重新计算的哈希（只在哈希未被改动时写回，期间用户改了密码则放弃）"""
+    from app.db import get_pool
+
+    while True:
+        database, username, new_hash, old_hash, args = _rehash_writes.get()
+        try:
+            if new_hash is None:
+                new_hash = generate_password_hash(*args)
+            with get_pool(database).connection() as conn:
+                cur = conn.execute(
+                    "UPDATE account SET password_hash = ? WHERE username = ? AND password_hash = ?",
+                    (new_hash, username, old_hash)
+                )
+                conn.commit()
+            _count_rehash('written' if cur.rowcount else 'skipped')
+        except Exception as e:
+            _count_rehash('failed')
+            print(f"⚠️ 密码哈希升级失败 {username}: {e}")
+
+
+def _queue_rehash_write(item):
+    """放入写回队列，队列已满时返回 False"""
+    global _rehash_writer
+    with _rehash_lock:
+        if _rehash_writer is None:
+            _rehash_writer = threading.Thread(target=_write_rehashes, name='rehash-writer', daemon=True)
+            _rehash_writer.start()
+    try:
+        _rehash_writes.put_nowait(item)
+    except queue.Full:
+        return False
+    return True
+
+
+def rehash_in_background(database, username, password, old_hash):
+    """
+    登录成功后按当前设置重新计算哈希并写回，不阻塞登录请求。
+    后台名额用完或写回队列已满时跳过，下次登录再处理。
+    """
+    def write(new_hash):
+        # 只把结果放入写回队列，不在这里访问数据库
+        if not _queue_rehash_write((database, username, new_hash, old_hash, None)):
+            _count_rehash('skipped')
+
+    args = (password, _policy['method'], _policy['salt_length'])
+    if _executor is None:
+        # 未启用执行器：交给写回线程计算，同一时刻只有一个后台哈希
+        queued = _queue_rehash_write((database, username, None, old_hash, args))
+    else:
+        queued = _executor.submit_background(write, 'generate', *args)
+    if not queued:
+        _count_rehash('skipped')
+        return False
+    _count_rehash('scheduled')
+    return True
+
+
+def rehash_stats():
+    with _rehash_lock:
+        return dict(_rehash, **_policy)
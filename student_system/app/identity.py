@@ -0,0 +1,162 @@
+# app/identity.py
+"""
+登录身份
+
+登录时一次性解析出角色对应的身份（user_id、姓名、学院、入学年份）存入 session，
+之后每个请求由 before_request 钩子生成 g.identity，视图不再反复查 account 表。
+
+account.auth_version 是账号的身份版本号，登录时记入 session：
+- 管理员启用/禁用账号、修改学生/教师信息时版本号 +1
+- 请求时发现版本号变化：账号已禁用则清空 session（强制下线），否则重新解析身份
+版本号在进程内缓存 Config.AUTH_VERSION_TTL 秒，过期后按主键重新查一次数据库，
+其他工作进程中的修改最迟在这段时间后生效。修改版本号的事务提交之后，
+调用方再调用 invalidate_auth_versions() 使本进程的缓存立即失效（与 invalidate_timetable 相同）。
+"""
+import time
+
+from flask import g, session, flash, current_app
+
+from app.db import get_read_connection
+
+DEFAULT_TTL = 5.0
+_versions = {}   # username -> (auth_version, is_active, 缓存时间)
+
+
+class Identity:
+    """当前请求的登录用户（只读）"""
+
+    def __init__(self, username, role, user_id, display_name=None, college_id=None, enrollment_year=None):
+        self.username = username
+        self.role = role
+        self.user_id = user_id
+        self.display_name = display_name
+        self.college_id = college_id
+        self.enrollment_year = enrollment_year
+
+    @property
+    def name(self):
+        return self.display_name
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+    @property
+    def is_teacher(self):
+        return self.role == 'teacher'
+
+    @property
+    def is_student(self):
+        return self.role == 'student'
+
+
+def resolve_identity(conn, account):
+    """根据 account 行查出角色对应的身份信息，返回可存入 session 的字典"""
+    identity = {
+        'user_id': account['user_id'],
+        'display_name': None,
+        'college_id': None,
+        'enrollment_year': None,
+        'auth_version': account['auth_version'] or 0,
+    }
+    if account['role'] == 'student':
+        row = conn.execute(
+            "SELECT name, college_id, enrollment_year FROM student WHERE student_id = ?",
+            (account['user_id'],)
+        ).fetchone()
+        if row:
+            identity.update(display_name=row['name'], college_id=row['college_id'],
+                            enrollment_year=row['enrollment_year'])
+    elif account['role'] == 'teacher':
+        row = conn.execute(
+            "SELECT name, college_id FROM teacher WHERE teacher_id = ?", (account['user_id'],)
+        ).fetchone()
+        if row:
+            identity.update(display_name=row['name'], college_id=row['college_id'])
+    else:
+        identity['display_name'] = 'System Administrator'
+    return identity
+
+
+def login_user(conn, account):
+    """登录成功后写入 session"""
+    session['username'] = account['username']
+    session['role'] = account['role']
+    session.update(resolve_identity(conn, account))
+    _versions[account['username']] = (account['auth_version'] or 0, bool(account['is_active']), time.monotonic())
+
+
+def _account_state(username):
+    """(auth_version, is_active)，账号不存在返回 None"""
+    state = _versions.get(username)
+    if state is None or time.monotonic() - state[2] > current_app.config.get('AUTH_VERSION_TTL', DEFAULT_TTL):
+        row = get_read_connection().execute(
+            "SELECT auth_version, is_active FROM account WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            _versions.pop(username, None)
+            return None
+        state = _versions[username] = (row['auth_version'] or 0, bool(row['is_active']), time.monotonic())
+    return state[:2]
+
+
+def bump_auth_version(conn, username=None, user_id=None, role=None):
+    """
+    账号身份版本号 +1（调用方负责 commit，提交后调用 invalidate_auth_versions）。
+    按 username 或 (user_id, role) 指定账号，已登录的会话在下一次请求时重新校验。
+    """
+    if username is not None:
+        conn.execute("UPDATE account SET auth_version = auth_version + 1 WHERE username = ?", (username,))
+    else:
+        conn.execute("UPDATE account SET auth_version = auth_version + 1 WHERE user_id = ? AND role = ?",
+                     (user_id, role))
+
+
+def invalidate_auth_versions(*usernames):
+    """
+    bump_auth_version 的事务提交之后调用：丢弃本进程缓存的版本号。
+    不指定用户名（按 user_id 修改时）清空全部缓存。
+    在提交之前失效的话，并发请求可能又把旧版本号读进缓存。
+    """
+    if not usernames:
+        _versions.clear()
+    for username in usernames:
+        _versions.pop(username, None)
+
+
+def load_identity():
+    """before_request：校验版本号并生成 g.identity；未登录时为 None"""
+    g.identity = None
+    username = session.get('username')
+    if not username:
+        return
+
+    state = _account_state(username)
+    if state is None or not state[1]:
+        # 账号被删除或被禁用：强制下线
+        session.clear()
+        flash('Your account has been disabled. Please contact the administrator.', 'error')
+        return
+
+    if session.get('auth_version') != state[0] or 'user_id' not in session:
+        # 身份信息有变化（或旧版本登录的会话）：重新解析一次
+        account = get_read_connection().execute(
+            "SELECT username, role, user_id, is_active, auth_version FROM account WHERE username = ?",
+            (username,)
+        ).fetchone()
+        session['role'] = account['role']
+        session.update(resolve_identity(get_read_connection(), account))
+
+    g.identity = Identity(
+        username, session.get('role'), session.get('user_id'), session.get('display_name'),
+        session.get('college_id'), session.get('enrollment_year')
+    )
+
+
+def get_identity():
+    """当前请求的 Identity，未登录返回 None"""
+    return g.get('identity')
+
+
+def init_identity(app):
+    app.before_request(load_identity)
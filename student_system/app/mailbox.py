@@ -0,0 +1,31 @@
+# app/mailbox.py
+"""
+校长信箱会话加载
+
+学生信箱和管理员留言页原来对每条主消息各查一次回复（N+1），排序还要对每条消息
+做一次 MAX(replies.created_at) 子查询。现在：
+- messages.last_activity_at 记录最后一次活动时间（发信或最新回复），由触发器在插入回复时更新，
+  列表按该列 + 索引排序
+- 当前页所有消息的回复一次查出，在 Python 中按 message_id 分组
+"""
+from itertools import groupby
+from operator import itemgetter
+
+# 单条语句 IN (...) 的参数个数上限（旧版 SQLite 为 999）
+CHUNK_SIZE = 500
+
+
+def load_threads(conn, messages):
+    """messages 为主消息行列表，返回 [{'main': 主消息, 'replies': [回复...]}]，顺序不变"""
+    ids = [msg['message_id'] for msg in messages]
+    replies = {}
+    for i in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[i:i + CHUNK_SIZE]
+        rows = conn.execute(f"""
+            SELECT * FROM replies
+            WHERE message_id IN ({','.join('?' * len(chunk))})
+            ORDER BY message_id, created_at ASC, reply_id ASC
+        """, chunk).fetchall()
+        for message_id, group in groupby(rows, key=itemgetter('message_id')):
+            replies[message_id] = list(group)
+    return [{'main': msg, 'replies': replies.get(msg['message_id'], [])} for msg in messages]
@@ -1,6 +1,11 @@
 # app/main.py
 from flask import Blueprint, render_template, redirect, url_for, session, flash
-from app.db import get_db_connection
+from app.db import get_read_connection
+from app.semester import get_current_semester
+from app.identity import get_identity
+from app.teacher_stats import teacher_summary
+from app.counters import get_count
+from app.timetable import get_timetable
 from datetime import datetime
 
 main_bp = Blueprint('main', __name__)
@@ -18,23 +23,23 @@ def dashboard():
 
     role = session.get('role', 'student')
     username = session['username']
-    conn = get_db_connection()
+    identity = get_identity()
+    conn = get_read_connection()
 
     if role == 'admin':
-        stats = conn.execute("""
-            SELECT 
-                (SELECT COUNT(*) FROM student) AS student_count,
-                (SELECT COUNT(*) FROM teacher) AS teacher_count,
-                (SELECT COUNT(*) FROM course) AS course_count
-        """).fetchone()
-        current_semester = conn.execute(
-            "SELECT semester_name FROM semester WHERE is_current = 1"
-        ).fetchone()
+        # 总数由触发器维护（app/counters.py），不再 COUNT(*) 全表
+        stats = {
+            'student_count': get_count(conn, 'student'),
+            'teacher_count': get_count(conn, 'teacher'),
+            'course_count': get_count(conn, 'course'),
+        }
+        current_semester = get_current_semester(conn)
         return render_template('admin/dashboard_admin.html',
                                username=username,
                                stats=stats,
                                current_semester=current_semester)
     elif role == 'teacher':
+        # 选课人数取自物化统计 section_stats（见 app/teacher_stats.py），不再逐班次 COUNT
         courses = conn.execute("""
             SELECT 
                 oc.offered_id,
@@ -43,47 +48,22 @@ def dashboard():
                 oc.classroom,
                 oc.time_slot,
                 oc.capacity,
-                COUNT(e.student_id) AS student_count
+                COALESCE(ss.enrolled, 0) AS student_count
             FROM offered_course oc
             JOIN course c ON oc.course_id = c.course_id
             JOIN semester s ON oc.semester_id = s.semester_id
-            LEFT JOIN enrollment e ON oc.offered_id = e.offered_id
-            WHERE oc.teacher_id = (
-                SELECT user_id 
-                FROM account 
-                WHERE username = ?
-            )
-            GROUP BY oc.offered_id, c.course_name, s.semester_name, oc.classroom, oc.time_slot, oc.capacity
+            LEFT JOIN section_stats ss ON ss.offered_id = oc.offered_id
+            WHERE oc.teacher_id = ?
             ORDER BY s.semester_name, c.course_name
-        """, (username,)).fetchall()
+        """, (identity.user_id,)).fetchall()
 
-        # 去重统计：该教师当前学期教的所有课程中，有多少个不同学生
-        total_unique_students = conn.execute("""
-            SELECT COALESCE(COUNT(DISTINCT e.student_id), 0)
-            FROM offered_course oc
-            JOIN semester s ON oc.semester_id = s.semester_id
-            LEFT JOIN enrollment e ON oc.offered_id = e.offered_id
-            WHERE oc.teacher_id = (SELECT user_id FROM account WHERE username = ?)
-              AND s.is_current = 1
-        """, (username,)).fetchone()[0]
-
-        # 查询当前学期名称
-        current_semester_row = conn.execute("""
-            SELECT semester_name 
-            FROM semester 
-            WHERE is_current = 1
-        """).fetchone()
-
-        # 查询未完成成绩录入的课程门数
-        pending_courses = conn.execute("""
-            SELECT COUNT(DISTINCT oc.offered_id)
-            FROM offered_course oc
-            JOIN enrollment e ON oc.offered_id = e.offered_id
-            WHERE oc.teacher_id = (SELECT user_id FROM account WHERE username = ?)
-              AND e.total_score IS NULL
-        """, (username,)).fetchone()[0]
+        current_semester = get_current_semester(conn)
+
+        # 当前学期不同学生数、未完成成绩录入的课程门数：按 teacher_id 读取 teacher_stats
+        total_unique_students, pending_courses = teacher_summary(
+            conn, identity.user_id, current_semester.semester_id if current_semester else None)
 
-        current_semester_name = current_semester_row['semester_name'] if current_semester_row else 'Unknown Semester'
+        current_semester_name = current_semester.semester_name if current_semester else 'Unknown Semester'
         return render_template('teacher/dashboard_teacher.html',
                                username=username,
                                courses=courses,
@@ -93,65 +73,19 @@ def dashboard():
 
 
     else:  # student
-        student_id = conn.execute(
-            "SELECT user_id FROM account WHERE username = ?", (username,)
-        ).fetchone()['user_id']
-        # 获取已选课程（含 time_slot）
-
-        enrollments = conn.execute("""
-                SELECT 
-                    c.course_name, 
-                    t.name AS teacher_name, 
-                    e.regular_score, 
-                    e.exam_score, 
-                    e.total_score, 
-                    oc.offered_id,
-                    oc.time_slot,
-                    oc.classroom
-
-                FROM enrollment e
-                JOIN offered_course oc ON e.offered_id = oc.offered_id
-                JOIN course c ON oc.course_id = c.course_id
-                JOIN teacher t ON oc.teacher_id = t.teacher_id
-                JOIN semester s ON oc.semester_id = s.semester_id
-                WHERE e.student_id = ? AND s.is_current = 1
-            """, (student_id,)).fetchall()
-
-        # === 新增：查询当前学期的选课时间窗口 ===
-        selection_window = conn.execute("""
-            SELECT 
-                strftime('%Y-%m-%d %H:%M:%S', selection_start) AS start_fmt,
-                strftime('%Y-%m-%d %H:%M:%S', selection_end) AS end_fmt
-            FROM semester 
-            WHERE is_current = 1
-        """).fetchone()
+        student_id = identity.user_id
+        current_semester = get_current_semester(conn)
 
-        # 获取当前时间字符串
-        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        # === 按星期几分组课程（用于课程表）===
-        courses_by_day = {}
-        weekday_map = {
-            '周一': 0,
-            '周二': 1,
-            '周三': 2,
-            '周四': 3,
-            '周五': 4,
-            '周六': 5,
-            '周日': 6
-        }
+        # 已选课程和按星期分组的课表（按学生缓存，选课/退课后失效）
+        timetable = get_timetable(conn, student_id, current_semester.semester_id) if current_semester else None
+        enrollments = timetable.enrollments if timetable else []
+        courses_by_day = timetable.courses_by_day if timetable else {}
 
-        for row in enrollments:
-            slot = row['time_slot']
-            if not slot:
-                continue
+        # === 当前学期的选课时间窗口（start_fmt / end_fmt）===
+        selection_window = current_semester
 
-            for day_str, day_index in weekday_map.items():
-                if day_str in slot:
-                    if day_index not in courses_by_day:
-                        courses_by_day[day_index] = []
-                    courses_by_day[day_index].append(row)
-                    break
+        # 获取当前时间字符串
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
         return render_template('student/dashboard_student.html',
                                username=username,
@@ -167,7 +101,7 @@ def profile():
 
     username = session['username']
     role = session.get('role', 'student')
-    conn = get_db_connection()
+    conn = get_read_connection()
 
     user_info = {'role': role, 'username': username}
 
@@ -177,8 +111,8 @@ def profile():
                    s.hometown, s.id_card, c.college_name, s.enrollment_year
             FROM student s
             JOIN college c ON s.college_id = c.college_id
-            WHERE s.student_id = (SELECT user_id FROM account WHERE username = ?)
-        """, (username,)).fetchone()
+            WHERE s.student_id = ?
+        """, (get_identity().user_id,)).fetchone()
         if data:
             user_info.update(dict(data))
 
@@ -188,14 +122,13 @@ def profile():
                    t.id_card, t.salary, c.college_name
             FROM teacher t
             JOIN college c ON t.college_id = c.college_id
-            WHERE t.teacher_id = (SELECT user_id FROM account WHERE username = ?)
-        """, (username,)).fetchone()
+            WHERE t.teacher_id = ?
+        """, (get_identity().user_id,)).fetchone()
         if data:
             user_info.update(dict(data))
 
     # 管理员不查额外信息
     conn.close()
-    conn.close()
 
     # 根据角色选择不同的模板
     template = ''
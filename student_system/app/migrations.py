@@ -0,0 +1,366 @@
+# app/migrations.py
+"""
+数据库结构迁移
+
+迁移按版本号顺序执行，已执行到的版本记录在数据库的 PRAGMA user_version 中。
+应用启动时自动执行（Config.AUTO_MIGRATE），也可以手动运行 tools/数据库迁移.py。
+新增迁移：在 MIGRATIONS 末尾追加 (版本号, 说明, SQL 语句列表或 callable(conn))，版本号只增不改。
+"""
+import sqlite3
+
+
+def add_column(table, column, definition):
+    """ALTER TABLE ADD COLUMN 不支持 IF NOT EXISTS；按 init_db.sql 新建的库已带该列时跳过"""
+    def step(conn):
+        columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+        if column not in columns:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}')
+    return step
+
+
+def create_teacher_stats(conn):
+    """教师仪表盘统计表（见 app/teacher_stats.py），建表后按现有选课数据填充"""
+    from app.teacher_stats import rebuild_teacher_stats
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS section_stats (
+            offered_id INTEGER PRIMARY KEY,
+            teacher_id VARCHAR(20) NOT NULL,
+            semester_id VARCHAR(20) NOT NULL,
+            enrolled INTEGER NOT NULL DEFAULT 0,
+            ungraded INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_section_stats_teacher ON section_stats (teacher_id, semester_id)')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS teacher_stats (
+            teacher_id VARCHAR(20) NOT NULL,
+            semester_id VARCHAR(20) NOT NULL,
+            student_count INTEGER NOT NULL DEFAULT 0,
+            pending_sections INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (teacher_id, semester_id)
+        ) WITHOUT ROWID
+    """)
+    rebuild_teacher_stats(conn)
+
+
+def create_counters(conn):
+    """触发器维护的行数计数器（见 app/counters.py），建表后按现有数据填充"""
+    from app.counters import counter_triggers, rebuild_counters
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL DEFAULT '',
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID
+    """)
+    for statement in counter_triggers():
+        conn.execute(statement)
+    rebuild_counters(conn)
+
+
+def add_message_activity(conn):
+    """messages.last_activity_at：发信时间或最新回复时间，由触发器维护（见 app/mailbox.py）"""
+    add_column('messages', 'last_activity_at', 'DATETIME')(conn)
+    conn.execute("""
+        UPDATE messages SET last_activity_at = COALESCE(
+            (SELECT MAX(created_at) FROM replies r WHERE r.message_id = messages.message_id), created_at)
+    """)
+    conn.execute('DROP TRIGGER IF EXISTS trg_messages_activity_insert')
+    conn.execute("""
+        CREATE TRIGGER trg_messages_activity_insert AFTER INSERT ON messages
+        WHEN NEW.last_activity_at IS NULL
+        BEGIN
+            UPDATE messages SET last_activity_at = NEW.created_at WHERE message_id = NEW.message_id;
+        END
+    """)
+    conn.execute('DROP TRIGGER IF EXISTS trg_replies_activity_insert')
+    conn.execute("""
+        CREATE TRIGGER trg_replies_activity_insert AFTER INSERT ON replies
+        BEGIN
+            UPDATE messages SET last_activity_at = NEW.created_at
+            WHERE message_id = NEW.message_id
+              AND (last_activity_at IS NULL OR last_activity_at < NEW.created_at);
+        END
+    """)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_activity ON messages (last_activity_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_student_activity ON messages (student_id, last_activity_at)')
+
+
+def create_mailbox_fts(conn):
+    """信箱全文索引（FTS5 外部内容表 + 同步触发器，见 app/search.py），建好后按现有数据重建"""
+    from app.search import rebuild_mailbox_index
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            title, content, content='messages', content_rowid='message_id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS replies_fts USING fts5(
+            content, content='replies', content_rowid='reply_id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    for table, columns in (('messages', ('message_id', 'title', 'content')), ('replies', ('reply_id', 'content'))):
+        rowid, fields = columns[0], columns[1:]
+        names = ', '.join(fields)
+        new = ', '.join(f'NEW.{f}' for f in fields)
+        old = ', '.join(f'OLD.{f}' for f in fields)
+        delete = f"INSERT INTO {table}_fts ({table}_fts, rowid, {names}) VALUES ('delete', OLD.{rowid}, {old});"
+        insert = f"INSERT INTO {table}_fts (rowid, {names}) VALUES (NEW.{rowid}, {new});"
+        for event, body in (('insert', insert), ('delete', delete), ('update', delete + ' ' + insert)):
+            conn.execute(f'DROP TRIGGER IF EXISTS trg_{table}_fts_{event}')
+            # 只在被索引的列变化时更新（last_activity_at 等不影响索引）
+            on = f'UPDATE OF {names}' if event == 'update' else event.upper()
+            conn.execute(f'CREATE TRIGGER trg_{table}_fts_{event} AFTER {on} ON {table} BEGIN {body} END')
+    rebuild_mailbox_index(conn)
+
+
+def create_people_fts(conn):
+    """学生 / 教师列表全文索引（FTS5 + 同步触发器，见 app/search.py），建好后按现有数据重建"""
+    from app.search import PEOPLE_INDEXES, rebuild_people_index
+    for fts, table, columns in PEOPLE_INDEXES.values():
+        names = ', '.join(columns)
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {names}, college_name, prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        delete = f"DELETE FROM {fts} WHERE rowid = OLD.rowid;"
+        insert = f"""INSERT INTO {fts} (rowid, {names}, college_name)
+            SELECT NEW.rowid, {', '.join(f'NEW.{c}' for c in columns)},
+                   (SELECT college_name FROM college WHERE college_id = NEW.college_id);"""
+        for event, body in (('insert', insert), ('delete', delete), ('update', delete + ' ' + insert)):
+            conn.execute(f'DROP TRIGGER IF EXISTS trg_{table}_fts_{event}')
+            on = f'UPDATE OF {names}, college_id' if event == 'update' else event.upper()
+            conn.execute(f'CREATE TRIGGER trg_{table}_fts_{event} AFTER {on} ON {table} BEGIN {body} END')
+    # 学院改名时更新该学院所有学生、教师的索引行
+    rename = ' '.join(
+        f"UPDATE {fts} SET college_name = NEW.college_name "
+        f"WHERE rowid IN (SELECT rowid FROM {table} WHERE college_id = NEW.college_id);"
+        for fts, table, _ in PEOPLE_INDEXES.values()
+    )
+    conn.execute('DROP TRIGGER IF EXISTS trg_college_fts_update')
+    conn.execute(f'CREATE TRIGGER trg_college_fts_update AFTER UPDATE OF college_name ON college BEGIN {rename} END')
+    rebuild_people_index(conn)
+
+
+def add_account_display_name(conn):
+    """
+    account.display_name：学生 / 教师姓名（管理员为 'System Administrator'）的冗余副本，
+    管理员账号页直接读取和检索，不再逐行查 student / teacher。由触发器同步：
+    新建账号、修改账号的角色或 user_id、新增 / 改名 / 删除学生或教师时更新
+    """
+    add_column('account', 'display_name', 'TEXT')(conn)
+    name_of = """CASE {alias}role
+        WHEN 'student' THEN (SELECT name FROM student WHERE student_id = {alias}user_id)
+        WHEN 'teacher' THEN (SELECT name FROM teacher WHERE teacher_id = {alias}user_id)
+        ELSE 'System Administrator'
+    END"""
+    conn.execute(f"UPDATE account SET display_name = {name_of.format(alias='')}")
+
+    triggers = {
+        'trg_account_name_insert': f"""AFTER INSERT ON account BEGIN
+            UPDATE account SET display_name = {name_of.format(alias='NEW.')} WHERE username = NEW.username;
+        END""",
+        'trg_account_name_update': f"""AFTER UPDATE OF role, user_id ON account BEGIN
+            UPDATE account SET display_name = {name_of.format(alias='NEW.')} WHERE username = NEW.username;
+        END""",
+    }
+    for role, key in (('student', 'student_id'), ('teacher', 'teacher_id')):
+        clear = f"UPDATE account SET display_name = NULL WHERE user_id = OLD.{key} AND role = '{role}';"
+        assign = f"UPDATE account SET display_name = NEW.name WHERE user_id = NEW.{key} AND role = '{role}';"
+        triggers[f'trg_{role}_account_name_insert'] = f"AFTER INSERT ON {role} BEGIN {assign} END"
+        triggers[f'trg_{role}_account_name_update'] = f"AFTER UPDATE OF name, {key} ON {role} BEGIN {clear} {assign} END"
+        triggers[f'trg_{role}_account_name_delete'] = f"AFTER DELETE ON {role} BEGIN {clear} END"
+    for name, body in triggers.items():
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute(f'CREATE TRIGGER {name} {body}')
+
+    # 账号页按用户名或姓名前缀检索（LIKE 不区分大小写，索引要用 NOCASE 才能走范围查找）
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_account_display_name ON account (display_name COLLATE NOCASE)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_account_username_nocase ON account (username COLLATE NOCASE)')
+
+
+def add_time_mask(conn):
+    """
+    offered_course.time_mask：上课时间的周×节次位图（见 app/timeslot.py），按 time_slot 回填。
+    无法解析的上课时间记为 0（不与任何班次冲突），tools/回填time_mask.py 会列出这些记录
+    """
+    from app.timeslot import time_slot_mask
+    add_column('offered_course', 'time_mask', 'INTEGER')(conn)
+    conn.executemany(
+        "UPDATE offered_course SET time_mask = ? WHERE offered_id = ?",
+        [(time_slot_mask(time_slot), offered_id)
+         for offered_id, time_slot in conn.execute("SELECT offered_id, time_slot FROM offered_course").fetchall()]
+    )
+
+
+MIGRATIONS = [
+    (1, 'index offered_course by teacher and semester', [
+        'CREATE INDEX IF NOT EXISTS idx_offered_course_teacher ON offered_course (teacher_id, semester_id)',
+        'CREATE INDEX IF NOT EXISTS idx_offered_course_semester ON offered_course (semester_id)',
+    ]),
+    (2, 'index enrollment by offered_id', [
+        'CREATE INDEX IF NOT EXISTS idx_enrollment_offered ON enrollment (offered_id, student_id)',
+    ]),
+    (3, 'index account by user_id', [
+        'CREATE INDEX IF NOT EXISTS idx_account_user ON account (user_id)',
+    ]),
+    (4, 'index mailbox messages and replies', [
+        'CREATE INDEX IF NOT EXISTS idx_messages_student ON messages (student_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_replies_message ON replies (message_id, created_at)',
+    ]),
+    (5, 'account.auth_version for session revocation', add_column('account', 'auth_version', 'INTEGER NOT NULL DEFAULT 0')),
+    (6, 'materialized teacher dashboard statistics', create_teacher_stats),
+    (7, 'trigger-maintained row counters', create_counters),
+    (8, 'messages.last_activity_at for mailbox ordering', add_message_activity),
+    (9, 'full-text index over mailbox messages and replies', create_mailbox_fts),
+    (10, 'full-text index for admin student and teacher lists', create_people_fts),
+    (11, 'indexes for keyset pagination of admin lists', [
+        "CREATE INDEX IF NOT EXISTS idx_student_birth ON student (IFNULL(birth_date, ''), student_id)",
+        'CREATE INDEX IF NOT EXISTS idx_student_year ON student (IFNULL(enrollment_year, 0), student_id)',
+        'CREATE INDEX IF NOT EXISTS idx_teacher_college ON teacher (college_id, teacher_id)',
+        'CREATE INDEX IF NOT EXISTS idx_course_college ON course (college_id, course_id)',
+        'CREATE INDEX IF NOT EXISTS idx_account_role ON account (role, username)',
+    ]),
+    (12, 'account.display_name for the admin accounts page', add_account_display_name),
+    # 账号显示名触发器按 (user_id, role) 更新；只有 user_id 单列索引时，没有统计信息的查询规划器
+    # 会选 idx_account_role（role = 'student'），每插入 / 修改一个学生就扫描一遍全部学生账号
+    (13, 'index account by user_id and role', [
+        'CREATE INDEX IF NOT EXISTS idx_account_user_role ON account (user_id, role)',
+        'DROP INDEX IF EXISTS idx_account_user',
+    ]),
+    # 成绩统计按 (offered_id, total_score) 分组，只读覆盖索引中对应班次的区间，不回表也不排序
+    (14, 'index enrollment scores for grade statistics', [
+        'CREATE INDEX IF NOT EXISTS idx_enrollment_grades ON enrollment (offered_id, total_score)',
+    ]),
+    # time_mask 原来只在 init_db.sql 和手动脚本中添加，按旧库启动时选课、课表页面会出错
+    (15, 'offered_course.time_mask weekday x period bitmask', add_time_mask),
+    # 账号页搜索恢复为任意位置匹配（'%q%' 用不上索引），迁移 12 为前缀匹配建的两个 NOCASE 索引不再使用
+    (16, 'drop unused account prefix-search indexes', [
+        'DROP INDEX IF EXISTS idx_account_display_name',
+        'DROP INDEX IF EXISTS idx_account_username_nocase',
+    ]),
+]
+
+# 需要确认不再全表扫描的热点查询: (名称, SQL, 参数)
+HOT_QUERIES = [
+    ('teacher dashboard sections', """
+        SELECT oc.offered_id, COUNT(e.student_id)
+        FROM offered_course oc
+        LEFT JOIN enrollment e ON oc.offered_id = e.offered_id
+        WHERE oc.teacher_id = ?
+        GROUP BY oc.offered_id
+    """, ('T0001',)),
+    ('catalog sections by semester', """
+        SELECT offered_id, current_count FROM offered_course WHERE semester_id = ?
+    """, ('S2025B',)),
+    ('course roster', """
+        SELECT s.student_id, s.name
+        FROM enrollment e
+        JOIN student s ON e.student_id = s.student_id
+        WHERE e.offered_id = ?
+    """, (1,)),
+    ('account by user_id', """
+        SELECT username FROM account WHERE user_id = ?
+    """, ('S2025000001',)),
+    ('account display name sync', """
+        UPDATE account SET display_name = ? WHERE user_id = ? AND role = 'student'
+    """, ('Name', 'S2025000001')),
+    ('student mailbox', """
+        SELECT * FROM messages WHERE student_id = ? ORDER BY last_activity_at DESC
+    """, ('S2025000001',)),
+    ('admin mailbox page', """
+        SELECT * FROM messages ORDER BY last_activity_at DESC, message_id DESC LIMIT 15
+    """, ()),
+    ('student list by birth date (keyset)', """
+        SELECT * FROM student s
+        WHERE IFNULL(s.birth_date, '') <= ? AND (IFNULL(s.birth_date, ''), s.student_id) < (?, ?)
+        ORDER BY IFNULL(s.birth_date, '') DESC, s.student_id DESC LIMIT 20
+    """, ('2004-01-01', '2004-01-01', 'S2025000001')),
+    ('student list by enrollment year (keyset)', """
+        SELECT * FROM student s
+        WHERE IFNULL(s.enrollment_year, 0) >= ? AND (IFNULL(s.enrollment_year, 0), s.student_id) > (?, ?)
+        ORDER BY IFNULL(s.enrollment_year, 0) ASC, s.student_id ASC LIMIT 20
+    """, (2024, 2024, 'S2024000001')),
+    ('account list (keyset)', """
+        SELECT username FROM account WHERE role >= ? AND (role, username) > (?, ?) ORDER BY role, username LIMIT 20
+    """, ('student', 'student', 'S2024000001')),
+    ('admin mailbox page (keyset)', """
+        SELECT * FROM messages WHERE last_activity_at <= ? AND (last_activity_at, message_id) < (?, ?)
+        ORDER BY last_activity_at DESC, message_id DESC LIMIT 15
+    """, ('2025-01-01 00:00:00', '2025-01-01 00:00:00', 100)),
+    ('grade statistics by section', """
+        SELECT offered_id, total_score, COUNT(*) FROM enrollment
+        WHERE offered_id IN (?, ?) AND total_score IS NOT NULL
+        GROUP BY offered_id, total_score
+    """, (1, 2)),
+    ('thread replies', """
+        SELECT * FROM replies WHERE message_id IN (?, ?) ORDER BY message_id, created_at ASC
+    """, (1, 2)),
+]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def explain_hot_queries(conn):
+    """返回 {查询名称: [查询计划行, ...]}"""
+    plans = {}
+    for name, sql, params in HOT_QUERIES:
+        try:
+            plans[name] = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        except sqlite3.Error as e:
+            plans[name] = [f'(unavailable: {e})']
+    return plans
+
+
+def print_query_plans(before, after):
+    for name in after:
+        print(f"🔎 {name}")
+        if before is not None and before.get(name) != after[name]:
+            for line in before.get(name, []):
+                print(f"     before: {line}")
+        for line in after[name]:
+            marker = '⚠️' if line.startswith('SCAN') and 'COVERING INDEX' not in line and 'USING INDEX' not in line else '  '
+            print(f"   {marker} after: {line}")
+
+
+def migrate(database, explain=False):
+    """执行所有未执行的迁移，返回迁移后的版本号；有迁移执行或 explain=True 时打印热点查询计划"""
+    conn = sqlite3.connect(database, timeout=20.0)
+    try:
+        current = schema_version(conn)
+        pending = [m for m in MIGRATIONS if m[0] > current]
+        before = explain_hot_queries(conn) if pending or explain else None
+
+        for version, description, steps in pending:
+            conn.execute('BEGIN IMMEDIATE')
+            # 多个进程同时启动时，拿到写锁后再确认一次版本
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            try:
+                if callable(steps):
+                    steps(conn)
+                else:
+                    for statement in steps:
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                print(f"❌ 数据库迁移 {version:03d} 失败: {description}")
+                raise
+            print(f"✅ 数据库迁移 {version:03d}: {description}")
+
+        if before is not None:
+            print_query_plans(before, explain_hot_queries(conn))
+        return schema_version(conn)
+    finally:
+        conn.close()
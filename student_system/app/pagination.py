@@ -0,0 +1,120 @@
+# app/pagination.py
+"""
+管理员列表分页（keyset / seek 分页）
+
+列表原来用 LIMIT ? OFFSET ? 翻页，第 n 页要先读过前面所有行，页码越大越慢。现在：
+- 上一页 / 下一页带一个不透明的游标（当前页首行或末行的排序键 + 目标页码），查询改为
+  WHERE (排序键) > (游标) ORDER BY 排序键 LIMIT n，沿索引直接定位，任何一页代价都和第一页相同
+- 页码链接（?page=n）照旧可用：前半部分从头 OFFSET，后半部分按反向排序从尾部 OFFSET，
+  末页就是反向的第一页
+- 页数不超过 NUMBERED_PAGES 时模板显示页码和跳页框；更大的表只显示首页 / 上一页 / 下一页 / 末页
+排序键必须能唯一确定一行（最后一列用主键兜底）、方向一致、且不为 NULL（可空列用 IFNULL），
+这样才能用行值比较；为排序键建的索引见 migrations.py。
+"""
+import base64
+import binascii
+import json
+import zlib
+
+NUMBERED_PAGES = 200
+
+
+def _tag(order, descending):
+    """排序方式的指纹，换了排序后旧游标作废"""
+    return zlib.crc32(repr((order, descending)).encode()) & 0xffff
+
+
+def _encode(kind, page, keys, tag):
+    raw = json.dumps([kind, page, keys, tag], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode(cursor, size, tag):
+    """解析游标，无效（被改过、排序方式不同）时返回 None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        kind, page, keys, cursor_tag = json.loads(raw)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if kind not in ('next', 'prev') or cursor_tag != tag or not isinstance(page, int) or page < 1:
+        return None
+    if not isinstance(keys, list) or len(keys) != size:
+        return None
+    if not all(isinstance(k, (str, int, float)) and not isinstance(k, bool) for k in keys):
+        return None
+    return kind, page, keys
+
+
+def paginate(conn, columns, from_sql, where_clauses, params, order, per_page, total,
+             page=1, cursor=None, descending=False):
+    """
+    分页查询，返回 (当前页行列表, pager)。
+    columns / from_sql 为 SELECT 列和 FROM 子句（含 JOIN），where_clauses / params 为筛选条件，
+    order 为排序键表达式列表，total 为符合条件的总行数（调用方从计数器或 COUNT 得到）。
+    pager: {'total', 'per_page', 'page', 'pages', 'numbered', 'prev_cursor', 'next_cursor'}
+    """
+    tag = _tag(order, descending)
+    forward, backward = ('DESC', 'ASC') if descending else ('ASC', 'DESC')
+    key_columns = ', '.join(f'{expr} AS _k{i}' for i, expr in enumerate(order))
+
+    def seek(op, keys):
+        """排序在游标之后（op 为 '>'）或之前（'<'）的条件"""
+        placeholders = '(' + ', '.join('?' * len(keys)) + ')'
+        if len(order) == 1:
+            return [f"{order[0]} {op} ?"], keys
+        # 行值比较只有在列都是普通列时才能定位索引，对 IFNULL 这样的表达式索引会退化成扫描；
+        # 先用首列的范围条件定位，行值比较只做过滤
+        return [f"{order[0]} {op}= ?", f"({', '.join(order)}) {op} {placeholders}"], [keys[0]] + keys
+
+    def fetch(extra_clauses, extra_params, reverse, limit, offset=0):
+        clauses = where_clauses + extra_clauses
+        sql = f"SELECT {columns}, {key_columns} FROM {from_sql}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        direction = backward if reverse else forward
+        sql += " ORDER BY " + ", ".join(f'{expr} {direction}' for expr in order) + " LIMIT ? OFFSET ?"
+        rows = conn.execute(sql, list(params) + extra_params + [limit, offset]).fetchall()
+        return rows[::-1] if reverse else rows
+
+    pages = (total + per_page - 1) // per_page
+    rows = None
+    decoded = _decode(cursor, len(order), tag) if cursor else None
+    if decoded:
+        kind, page, keys = decoded
+        if kind == 'next':
+            # 下一页：排序在游标之后的前 per_page 行
+            rows = fetch(*seek('<' if descending else '>', keys), False, per_page)
+        else:
+            # 上一页：排序在游标之前的最后 per_page 行
+            rows = fetch(*seek('>' if descending else '<', keys), True, per_page)
+            if len(rows) < per_page:
+                rows = None   # 前面的行变少了，回到第一页
+                page = 1
+        if rows is not None and not rows:
+            rows = None       # 游标之后已没有数据，按页码重新定位
+        if rows is not None and pages:
+            page = min(page, pages)
+
+    if rows is None:
+        page = min(max(page, 1), max(pages, 1))
+        offset = (page - 1) * per_page
+        remaining = total - offset
+        if page > 1 and page > (pages + 1) // 2 and remaining > 0:
+            # 后半部分从尾部反向取，末页与第一页代价相同
+            count = min(per_page, remaining)
+            rows = fetch([], [], True, count, remaining - count)
+        else:
+            rows = fetch([], [], False, per_page, offset)
+
+    def keys_of(row):
+        return [row[f'_k{i}'] for i in range(len(order))]
+
+    return rows, {
+        'total': total,
+        'per_page': per_page,
+        'page': page,
+        'pages': pages,
+        'numbered': pages <= NUMBERED_PAGES,
+        'prev_cursor': _encode('prev', page - 1, keys_of(rows[0]), tag) if rows and page > 1 else None,
+        'next_cursor': _encode('next', page + 1, keys_of(rows[-1]), tag) if rows and page < pages else None,
+    }
@@ -0,0 +1,170 @@
+# app/search.py
+"""
+全文检索（SQLite FTS5）
+
+校长信箱：messages_fts（标题、正文）和 replies_fts（回复正文）是以 messages / replies
+为外部内容的 FTS5 索引，由触发器随增删改同步（建表和触发器见 migrations.py）。
+检索时两边分别 MATCH，按主消息合并，取 bm25 最好的一条作为排名和摘要；
+命中过多的常见词只在最近的 RANK_WINDOW 条命中里排名，避免对几十万条命中逐条打分。
+
+管理员的学生 / 教师列表：student_fts、teacher_fts 是自带内容的 FTS5 表（学院名称要从 college
+连表取得，无法作为外部内容），rowid 与 student / teacher 的 rowid 相同，由 student、teacher、
+college 上的触发器同步。按 rowid 回表比读出索引里的学号快得多；VACUUM 可能重新编号没有
+INTEGER PRIMARY KEY 的表的 rowid，执行 VACUUM 后要重建索引。
+列表搜索按词前缀匹配（"Edw" 匹配 Edward，"S2023" 匹配该届学号），列表和总数用同一个条件。
+
+用户输入不直接作为 FTS5 查询语法：先拆成词，每个词加引号作为短语，词与词之间为 AND。
+已有数据（或索引损坏时）用 tools/全文索引重建.py 重建。
+"""
+import re
+
+from markupsafe import Markup, escape
+
+# snippet() 使用的高亮标记，转义 HTML 之后再替换成 <mark>
+_HL_START, _HL_END = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+
+
+def fts_query(text, prefix=False):
+    """把用户输入转成安全的 FTS5 查询；prefix=True 时每个词按前缀匹配。没有可检索的词返回 None"""
+    terms = re.findall(r'\w+', text or '')
+    if not terms:
+        return None
+    star = '*' if prefix else ''
+    return ' '.join(f'"{term}"{star}' for term in terms)
+
+
+def highlight(snippet):
+    """snippet() 的结果转义后把命中部分包上 <mark>"""
+    if not snippet:
+        return ''
+    html = str(escape(snippet)).replace(_HL_START, '<mark>').replace(_HL_END, '</mark>')
+    return Markup(html)
+
+
+# 每个索引最多取最近的多少条命中参与排名。几乎每条消息都含有的词（如 "the"）若对全部命中
+# 计算 bm25 要上秒；FTS5 按 rowid 倒序扫描时 LIMIT 可以提前结束，因此只在最近的命中里排名
+RANK_WINDOW = 2000
+
+_WINDOWS = """
+    WITH message_hits AS (
+        SELECT rowid AS hit_rowid{message_score} FROM messages_fts
+        WHERE messages_fts MATCH :q ORDER BY rowid DESC LIMIT :window
+    ),
+    reply_hits AS (
+        SELECT rowid AS hit_rowid{reply_score} FROM replies_fts
+        WHERE replies_fts MATCH :q ORDER BY rowid DESC LIMIT :window
+    )
+"""
+
+# 命中会话数，以及两个窗口是否被截断（只用于计数，不计算排名）
+_COUNT_MESSAGES = _WINDOWS.format(message_score='', reply_score='') + """
+    SELECT
+        (SELECT COUNT(*) FROM (
+            SELECT hit_rowid FROM message_hits
+            UNION
+            SELECT r.message_id FROM reply_hits h JOIN replies r ON r.reply_id = h.hit_rowid
+        )) AS total,
+        (SELECT COUNT(*) FROM message_hits) >= :window
+            OR (SELECT COUNT(*) FROM reply_hits) >= :window AS truncated
+"""
+
+# 每个会话取 bm25 最好的一条命中；聚合查询中与 MIN() 同行的 source / hit_rowid
+# 即这条命中的来源（SQLite 的 bare column 规则），摘要只为当前页计算
+_RANKED_MESSAGES = _WINDOWS.format(message_score=', bm25(messages_fts, 5.0, 1.0) AS score',
+                                   reply_score=', bm25(replies_fts) AS score') + """
+    , hits AS (
+        SELECT hit_rowid AS message_id, score, 'messages' AS source, hit_rowid FROM message_hits
+        UNION ALL
+        SELECT r.message_id, h.score, 'replies' AS source, h.hit_rowid
+        FROM reply_hits h JOIN replies r ON r.reply_id = h.hit_rowid
+    )
+    SELECT message_id, MIN(score) AS score, source, hit_rowid
+    FROM hits
+    GROUP BY message_id
+    ORDER BY score, message_id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def _snippets(conn, table, column, query, rowids):
+    """为指定的几行计算高亮摘要 {rowid: 摘要}"""
+    if not rowids:
+        return {}
+    rows = conn.execute(f"""
+        SELECT rowid, snippet({table}, {column}, '{_HL_START}', '{_HL_END}', '…', {SNIPPET_TOKENS})
+        FROM {table}
+        WHERE {table} MATCH ? AND rowid IN ({','.join('?' * len(rowids))})
+    """, [query, *rowids]).fetchall()
+    return {rowid: snippet for rowid, snippet in rows}
+
+
+def search_messages(conn, text, limit, offset=0):
+    """
+    按相关度检索信箱，返回 (命中会话数, [(message_id, 摘要 Markup), ...], 是否截断)。
+    同一会话只出现一次，排名和摘要取自最相关的标题/正文/回复。
+    截断表示命中太多，只在最近的 RANK_WINDOW 条命中里排名，命中会话数为下限。
+    """
+    query = fts_query(text)
+    if query is None:
+        return 0, [], False
+    params = {'q': query, 'window': RANK_WINDOW, 'limit': limit, 'offset': offset}
+    counted = conn.execute(_COUNT_MESSAGES, params).fetchone()
+    ranked = conn.execute(_RANKED_MESSAGES, params).fetchall()
+
+    snippets = {
+        'messages': _snippets(conn, 'messages_fts', -1, query,
+                              [row['hit_rowid'] for row in ranked if row['source'] == 'messages']),
+        'replies': _snippets(conn, 'replies_fts', 0, query,
+                             [row['hit_rowid'] for row in ranked if row['source'] == 'replies']),
+    }
+    hits = [(row['message_id'], highlight(snippets[row['source']].get(row['hit_rowid']))) for row in ranked]
+    return counted['total'], hits, bool(counted['truncated'])
+
+
+def rebuild_mailbox_index(conn):
+    """按 messages / replies 重建信箱全文索引（调用方负责 commit）"""
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO replies_fts (replies_fts) VALUES ('rebuild')")
+
+
+# 学生 / 教师列表的全文索引：(FTS 表, 原表, 原表中被索引的列)，每个索引另加一列 college_name
+PEOPLE_INDEXES = {
+    'student': ('student_fts', 'student',
+                ('student_id', 'name', 'phone', 'hometown', 'id_card', 'birth_date')),
+    'teacher': ('teacher_fts', 'teacher',
+                ('teacher_id', 'name', 'title')),
+}
+
+
+def people_filter(kind, text, alias):
+    """
+    学生 / 教师列表的搜索条件，返回 (SQL 片段, 参数)，可直接加入 WHERE。
+    alias 为原表在查询中的别名；输入中没有可检索的词时不匹配任何行。
+    """
+    fts = PEOPLE_INDEXES[kind][0]
+    query = fts_query(text, prefix=True)
+    if query is None:
+        return "0", []
+    return f"{alias}.rowid IN (SELECT rowid FROM {fts} WHERE {fts} MATCH ?)", [query]
+
+
+def people_count(conn, kind, text):
+    """只有搜索条件时的命中数，直接在索引上计数，不回表"""
+    fts = PEOPLE_INDEXES[kind][0]
+    query = fts_query(text, prefix=True)
+    if query is None:
+        return 0
+    return conn.execute(f"SELECT COUNT(*) FROM {fts} WHERE {fts} MATCH ?", (query,)).fetchone()[0]
+
+
+def rebuild_people_index(conn):
+    """按 student / teacher / college 重建学生、教师列表的全文索引（调用方负责 commit）"""
+    for fts, table, columns in PEOPLE_INDEXES.values():
+        names = ', '.join(columns)
+        conn.execute(f"DELETE FROM {fts}")
+        conn.execute(f"""
+            INSERT INTO {fts} (rowid, {names}, college_name)
+            SELECT x.rowid, {', '.join(f'x.{c}' for c in columns)}, c.college_name
+            FROM {table} x LEFT JOIN college c ON x.college_id = c.college_id
+        """)
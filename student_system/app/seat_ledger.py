@@ -0,0 +1,425 @@
+# app/seat_ledger.py
+"""
+选课座位账本（可选引擎）
+
+选课高峰期所有选课/退课请求都在进程内存中判定：
+- offered_course 的 capacity / current_count
+- 每个学生已选的班次集合、课程名集合、学分合计
+
+判定通过的操作放入写回队列，由后台线程按批次合并成一个事务写入
+enrollment / offered_course，请求线程不再争抢 SQLite 写锁。
+账本使用自己的连接（一条写回连接 + 少量只读连接），不占用请求的连接池。
+通过 Config.SEAT_LEDGER_ENABLED 开启。
+"""
+import atexit
+import sqlite3
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from itertools import chain
+
+from app.catalog import catalog_version
+from app.db import ConnectionPool
+from app.grade_stats import invalidate_grade_stats
+from app.teacher_stats import refresh_sections
+from app.timetable import invalidate_timetable
+from app.timeslot import time_slot_mask
+
+CREDIT_LIMIT = 15
+
+_ledger = None
+
+
+class SeatLedger:
+    def __init__(self, database, flush_interval=0.05, batch_size=500, read_connections=4):
+        self.database = database
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # 账本专用连接：请求线程已持有请求连接池的连接时，不会再等待同一个池
+        self._writer = ConnectionPool(database, size=1)   # 载入和写回，由 _flush_lock 串行使用
+        self._readers = ConnectionPool(database, size=read_connections, readonly=True)  # 学生状态按需载入
+
+        self._lock = threading.Lock()           # 保护座位数和学生状态
+        self._flush_lock = threading.Lock()     # 保证同一时刻只有一个写回事务（重新载入时也持有）
+        self._reload_lock = threading.Lock()    # 目录版本变化时只由一个线程重新载入
+        self._version = None                    # 载入时的课程目录版本
+        self._sections = {}                     # offered_id -> 班次信息（含 current_count）
+        self._students = {}                     # student_id -> 学生选课状态
+        self._stale = set()                     # 学院 / 入学年份需要重新读取的学生
+        self._pending = deque()                 # 待写回操作: ('enroll'|'drop', student_id, offered_id)
+        self.dead_letters = deque(maxlen=1000)  # 无法写回而被丢弃的操作: (操作, 错误信息)
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    # ---------- 加载 ----------
+    def load(self):
+        """
+        从数据库载入全部班次，学生状态在首次访问时按需载入。
+        重新载入期间持有 _flush_lock，没有批次在写回：数据库中的 current_count 加上仍在
+        队列中的操作（在 _lock 内重放，包括读库之后才放入队列的）就是最新的座位数。
+        """
+        version = catalog_version()
+        with self._flush_lock:
+            with self._writer.connection() as conn:
+                rows = conn.execute("""
+                    SELECT oc.offered_id, oc.semester_id, oc.time_slot, oc.time_mask, oc.capacity,
+                           oc.current_count, c.course_name, c.credits, c.college_id, c.target_grade
+                    FROM offered_course oc
+                    JOIN course c ON oc.course_id = c.course_id
+                """).fetchall()
+
+            sections = {}
+            for row in rows:
+                sec = dict(row)
+                sec['capacity'] = sec['capacity'] or 0
+                sec['current_count'] = sec['current_count'] or 0
+                sec['credits'] = sec['credits'] or 0
+                if sec['time_mask'] is None:
+                    sec['time_mask'] = time_slot_mask(sec['time_slot'])
+                sections[sec['offered_id']] = sec
+
+            with self._lock:
+                for op, _, offered_id in self._pending:
+                    sec = sections.get(offered_id)
+                    if sec is None:
+                        continue
+                    if op == 'enroll':
+                        sec['current_count'] += 1
+                    else:
+                        sec['current_count'] = max(sec['current_count'] - 1, 0)
+                # 已载入的学生保留已选班次（含未写回的），课程名、学分按新目录重新计算
+                for state in self._students.values():
+                    enrolled = state['enrolled']
+                    state['enrolled'], state['course_names'], state['credits'] = set(), set(), 0
+                    for oid in enrolled:
+                        if oid in sections:
+                            self._add_to_state(state, oid, sections[oid])
+                self._sections = sections
+                self._version = version
+
+    def _check_version(self):
+        # 管理员修改了课程目录（学分、课程名等），重新载入班次信息；并发请求只由一个线程载入
+        if self._version != catalog_version():
+            with self._reload_lock:
+                if self._version != catalog_version():
+                    self.load()
+
+    def _student(self, student_id):
+        state = self._students.get(student_id)
+        if state is not None and student_id not in self._stale:
+            return state
+
+        with self._lock:
+            # 先清除标记再读库：读库期间再次被标记的，下次访问时还会重新读取
+            self._stale.discard(student_id)
+        with self._readers.connection() as conn:
+            student = conn.execute(
+                "SELECT college_id, enrollment_year FROM student WHERE student_id = ?",
+                (student_id,)
+            ).fetchone()
+            if not student:
+                return None
+            if state is not None:
+                # 只刷新学院和入学年份，已选班次以账本为准（可能有未写回的操作）
+                with self._lock:
+                    state['college_id'] = student['college_id']
+                    state['enrollment_year'] = student['enrollment_year']
+                return state
+            enrolled = [row['offered_id'] for row in conn.execute(
+                "SELECT offered_id FROM enrollment WHERE student_id = ?", (student_id,)
+            )]
+
+        state = {
+            'college_id': student['college_id'],
+            'enrollment_year': student['enrollment_year'],
+            'enrolled': set(),
+            'course_names': set(),
+            'credits': 0,
+        }
+        with self._lock:
+            for oid in enrolled:
+                sec = self._sections.get(oid)
+                if sec:
+                    self._add_to_state(state, oid, sec)
+            # 队列中该学生尚未写回的操作（状态被丢弃后重新载入时会有）
+            for op, sid, oid in self._pending:
+                sec = self._sections.get(oid)
+                if sid != student_id or sec is None:
+                    continue
+                if op == 'enroll' and oid not in state['enrolled']:
+                    self._add_to_state(state, oid, sec)
+                elif op == 'drop' and oid in state['enrolled']:
+                    self._remove_from_state(state, oid, sec)
+            # 并发首次访问时以先写入者为准
+            return self._students.setdefault(student_id, state)
+
+    def forget_student(self, *student_ids):
+        """管理员修改学生信息后调用（在事务提交之后）：下次访问时重新读取学院和入学年份"""
+        with self._lock:
+            self._stale.update(student_ids)
+
+    @staticmethod
+    def _add_to_state(state, offered_id, sec):
+        state['enrolled'].add(offered_id)
+        state['course_names'].add(sec['course_name'])
+        state['credits'] += sec['credits']
+
+    @staticmethod
+    def _remove_from_state(state, offered_id, sec):
+        state['enrolled'].discard(offered_id)
+        state['course_names'].discard(sec['course_name'])
+        state['credits'] -= sec['credits']
+
+    # ---------- 选课 / 退课 ----------
+    def enroll(self, student_id, offered_id, window_open=None):
+        """
+        尝试选课，成功返回 None，失败返回提示信息（与原 SQL 流程一致）。
+        window_open(semester_id) 用于选课时间窗口检查，在持锁之前调用。
+        """
+        self._check_version()
+        state = self._student(student_id)
+        if state is None:
+            return 'Student information error!'
+
+        sec = self._sections.get(offered_id)
+        if sec is None:
+            return 'Course does not exist!'
+
+        if sec['college_id'] != state['college_id']:
+            return '❌ You can only select courses offered by your own college!'
+
+        student_grade = datetime.now().year - state['enrollment_year'] + 1
+        if sec['target_grade'] != student_grade:
+            return f'❌ This course is only open to grade {sec["target_grade"]} students!'
+
+        if window_open is not None and not window_open(sec['semester_id']):
+            return 'Course selection is not available outside the designated period!'
+
+        with self._lock:
+            # 持锁后重新取班次：期间可能已重新载入，座位数要记在新的班次信息上
+            sec = self._sections.get(offered_id)
+            if sec is None:
+                return 'Course does not exist!'
+            if offered_id in state['enrolled']:
+                return '❌ You have already enrolled in this course section!'
+
+            if sec['course_name'] in state['course_names']:
+                return f'❌ You have already enrolled in “{sec["course_name"]}” — duplicate course names are not allowed!'
+
+            new_total = state['credits'] + sec['credits']
+            if new_total > CREDIT_LIMIT:
+                return f'❌ Enrollment failed: total credits would reach {new_total}, exceeding the {CREDIT_LIMIT}-credit limit!'
+
+            conflicts = [
+                self._sections[oid]['course_name'] for oid in sorted(state['enrolled'])
+                if self._sections[oid]['semester_id'] == sec['semester_id']
+                and self._sections[oid]['time_mask'] & sec['time_mask']
+            ]
+            if conflicts:
+                conflict_names = ', '.join(conflicts)
+                return f'❌ Time conflict! Overlaps with enrolled course(s): 「{conflict_names}」.'
+
+            if sec['current_count'] >= sec['capacity']:
+                return '❌ Course is full (may have just been taken by another student)'
+
+            sec['current_count'] += 1
+            self._add_to_state(state, offered_id, sec)
+            self._pending.append(('enroll', student_id, offered_id))
+
+        self._wakeup.set()
+        return None
+
+    def drop(self, student_id, offered_id, window_open=None):
+        """退课，成功返回 None，失败返回提示信息"""
+        self._check_version()
+        sec = self._sections.get(offered_id)
+        if sec is not None and window_open is not None and not window_open(sec['semester_id']):
+            return 'Drop period has ended. Please act within the allowed timeframe!'
+
+        state = self._student(student_id)
+        with self._lock:
+            sec = self._sections.get(offered_id)
+            if state is None or sec is None or offered_id not in state['enrolled']:
+                return '❌ You are not enrolled in this course — cannot drop!'
+
+            sec['current_count'] = max(sec['current_count'] - 1, 0)
+            self._remove_from_state(state, offered_id, sec)
+            self._pending.append(('drop', student_id, offered_id))
+
+        self._wakeup.set()
+        return None
+
+    def enrolled_ids(self, student_id):
+        """学生已选的全部班次（含尚未写回数据库的）"""
+        state = self._student(student_id)
+        if state is None:
+            return set()
+        with self._lock:
+            return set(state['enrolled'])
+
+    def seat_counts(self):
+        """当前内存中的各班次已选人数"""
+        with self._lock:
+            return {oid: sec['current_count'] for oid, sec in self._sections.items()}
+
+    # ---------- 批量写回 ----------
+    def _persisted_counts(self, offered_ids, unwritten=()):
+        """
+        写回时 offered_course.current_count 的取值（调用方持有 _lock）。
+        座位数以账本为准，直接写入绝对值，避免增量叠加误差；
+        队列中剩下的操作和 unwritten（本批中尚未写入 enrollment 的）不计入，
+        这样数据库中的 current_count 总是与已写回的操作一致，重新载入时重放队列即可
+        """
+        unflushed = Counter()
+        for op, _, oid in chain(self._pending, unwritten):
+            if oid in offered_ids:
+                unflushed[oid] += 1 if op == 'enroll' else -1
+        return [(self._sections[oid]['current_count'] - unflushed[oid], oid)
+                for oid in offered_ids if oid in self._sections]
+
+    @staticmethod
+    def _write(conn, ops, counts):
+        """在 conn 的当前事务中写入一组操作，同一 (学生, 班次) 只保留最后一次操作即可得到最终状态"""
+        final = {}
+        for op, student_id, offered_id in ops:
+            final[(student_id, offered_id)] = op
+        conn.executemany(
+            "DELETE FROM enrollment WHERE student_id = ? AND offered_id = ?",
+            [key for key, op in final.items() if op == 'drop']
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO enrollment (student_id, offered_id, regular_score, exam_score, total_score) "
+            "VALUES (?, ?, NULL, NULL, NULL)", [key for key, op in final.items() if op == 'enroll']
+        )
+        conn.executemany(
+            "UPDATE offered_course SET current_count = ? WHERE offered_id = ?", counts
+        )
+        refresh_sections(conn, {oid for _, _, oid in ops})  # 教师仪表盘统计按班次重新计数
+
+    def flush(self):
+        """把待写回操作合并成一个事务写入数据库，返回处理掉的操作数（写回失败、留待重试时为 0）"""
+        with self._flush_lock:
+            with self._lock:
+                count = min(len(self._pending), self.batch_size)
+                batch = [self._pending.popleft() for _ in range(count)]
+                counts = self._persisted_counts({oid for _, _, oid in batch})
+            if not batch:
+                return 0
+
+            try:
+                # 出错时连接池会回滚这个事务
+                with self._writer.connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    self._write(conn, batch, counts)
+                    conn.commit()
+                written = batch
+            except sqlite3.Error as e:
+                print(f"⚠️ 座位账本批量写回失败，改为逐个写回: {e}")
+                written = self._flush_each(batch)
+                if written is None:
+                    return 0
+            self._written(written)
+            return len(batch)
+
+    def _flush_each(self, batch):
+        """
+        整批写回失败后，每个 (学生, 班次) 的操作单独提交：
+        违反约束的（学生或班次已被删除等）记入 dead_letters，并撤销其在账本中的效果，其余照常写入。
+        遇到其他数据库错误（锁等待超时、磁盘错误等）时，未写入的操作放回队首，返回 None，下个周期重试。
+        返回已写入的操作。
+        """
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[1:], []).append(item)
+        written = []
+        while groups:
+            key, ops = next(iter(groups.items()))
+            del groups[key]
+            with self._lock:
+                counts = self._persisted_counts({key[1]}, chain.from_iterable(groups.values()))
+            try:
+                with self._writer.connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    self._write(conn, ops, counts)
+                    conn.commit()
+                written.extend(ops)
+            except sqlite3.IntegrityError as e:
+                self._discard(ops, e)
+            except sqlite3.Error as e:
+                retry = {key, *groups}
+                with self._lock:
+                    self._pending.extendleft(reversed([item for item in batch if item[1:] in retry]))
+                print(f"⚠️ 座位账本写回失败，将重试: {e}")
+                self._written(written)
+                return None
+        return written
+
+    def _discard(self, ops, error):
+        """丢弃同一 (学生, 班次) 的一组无法写回的操作：座位数扣回，学生状态下次访问时按数据库和队列重新载入"""
+        op, student_id, offered_id = ops[-1]
+        with self._lock:
+            sec = self._sections.get(offered_id)
+            if sec is not None:
+                net = sum(1 if item[0] == 'enroll' else -1 for item in ops)
+                sec['current_count'] = max(sec['current_count'] - net, 0)
+            self._students.pop(student_id, None)
+            self.dead_letters.extend((item, str(error)) for item in ops)
+        print(f"⚠️ 座位账本丢弃无法写回的操作 {op} {student_id} -> {offered_id}: {error}")
+
+    def _written(self, ops):
+        # 写回之前被重新缓存的课表可能缺少这批操作
+        invalidate_timetable(*{student_id for _, student_id, _ in ops})
+        # 退掉的可能是已出成绩的记录
+        invalidate_grade_stats(*{offered_id for op, _, offered_id in ops if op == 'drop'})
+
+    def flush_all(self):
+        while self._pending:
+            if not self.flush():
+                break
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # 稍等片刻让同一时段的请求攒成一批
+            self._stopped.wait(self.flush_interval)
+            self.flush_all()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='seat-ledger-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush_all()
+        self._writer.close_all()
+        self._readers.close_all()
+
+
+def init_ledger(app):
+    """按配置创建并启动全局座位账本"""
+    global _ledger
+    if _ledger is not None:
+        _ledger.stop()
+    _ledger = SeatLedger(
+        app.config['DATABASE'],
+        flush_interval=app.config.get('SEAT_LEDGER_FLUSH_INTERVAL', 0.05),
+        batch_size=app.config.get('SEAT_LEDGER_BATCH_SIZE', 500),
+        read_connections=app.config.get('SEAT_LEDGER_READ_CONNECTIONS', 4),
+    )
+    _ledger.load()
+    _ledger.start()
+    atexit.register(_ledger.stop)
+    return _ledger
+
+
+def get_ledger():
+    """未启用时返回 None，调用方回退到直接读写数据库"""
+    return _ledger
@@ -0,0 +1,90 @@
+# app/semester.py
+"""
+当前学期缓存
+
+几乎每个请求都要查 is_current = 1 的学期，而这一行一学期只改一两次。
+整个进程缓存一份 CurrentSemester，选课起止时间在载入时解析成 datetime，
+管理员新增/修改/删除学期后调用 invalidate_current_semester() 使其失效。
+"""
+import threading
+from datetime import datetime
+
+_lock = threading.Lock()
+_version = 0
+_UNSET = object()
+_cached = _UNSET
+
+
+def parse_db_datetime(value):
+    """解析数据库中的 "2025-02-10 00:00:00"，为空或格式不对返回 None"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+
+
+class CurrentSemester:
+    """当前学期（只读），selection_start / selection_end 为 datetime 或 None"""
+
+    def __init__(self, row):
+        self.semester_id = row['semester_id']
+        self.semester_name = row['semester_name']
+        self.selection_start = parse_db_datetime(row['selection_start'])
+        self.selection_end = parse_db_datetime(row['selection_end'])
+
+    @property
+    def has_window(self):
+        return self.selection_start is not None and self.selection_end is not None
+
+    @property
+    def start_fmt(self):
+        return self.selection_start.strftime('%Y-%m-%d %H:%M:%S') if self.selection_start else None
+
+    @property
+    def end_fmt(self):
+        return self.selection_end.strftime('%Y-%m-%d %H:%M:%S') if self.selection_end else None
+
+    def window_open(self, now=None):
+        """按精确时间判断是否在选课/退课时间内（退课使用）"""
+        now = now or datetime.now()
+        return self.has_window and self.selection_start <= now <= self.selection_end
+
+    def window_open_on(self, day=None):
+        """按日期判断是否在选课时间内（选课页面和选课使用，结束当天全天有效）"""
+        day = day or datetime.now().date()
+        return self.has_window and self.selection_start.date() <= day <= self.selection_end.date()
+
+
+def invalidate_current_semester():
+    """学期数据被修改后调用，下一次访问时重新查询"""
+    global _version, _cached
+    with _lock:
+        _version += 1
+        _cached = _UNSET
+
+
+def get_current_semester(conn):
+    """返回当前学期，没有设置当前学期时返回 None"""
+    global _cached
+    cached = _cached
+    if cached is not _UNSET:
+        return cached
+
+    version = _version
+    row = conn.execute("""
+        SELECT semester_id, semester_name, selection_start, selection_end
+        FROM semester
+        WHERE is_current = 1
+    """).fetchone()
+    semester = CurrentSemester(row) if row else None
+
+    with _lock:
+        # 查询期间学期又被修改时，不缓存这份可能过期的结果
+        if version == _version:
+            _cached = semester
+    return semester
@@ -0,0 +1,174 @@
+# app/sqlstats.py
+"""
+按请求统计 SQL：语句数、数据库耗时、最慢的语句
+
+get_db_connection / get_read_connection 取到的连接在请求期间挂上 RequestSQLStats，
+连接上的 execute / executemany 以及取结果（fetch*、迭代）都会计时。
+请求结束时：
+- 超过 SLOW_QUERY_MS 的语句写入慢查询日志
+- 同一条语句在一个请求里执行 N_PLUS_ONE_THRESHOLD 次以上，记一次 N+1 警告
+- 结果按 endpoint 汇总到进程内，管理员在 /diagnostics 页面查看
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, request
+
+SLOWEST_PER_REQUEST = 5
+SLOWEST_OVERALL = 20
+RECENT_WARNINGS = 50
+
+_WHITESPACE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_endpoints = {}                              # endpoint -> 汇总数据
+_slowest = []                                # [(耗时ms, endpoint, sql)]，最多 SLOWEST_OVERALL 条
+_warnings = deque(maxlen=RECENT_WARNINGS)    # 最近的慢查询 / N+1 警告
+
+
+def normalize_sql(sql):
+    """压缩空白，便于在日志和页面中显示、并作为 N+1 检测的键"""
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class RequestSQLStats:
+    """单个请求内执行过的语句: [sql, 耗时ms]"""
+
+    def __init__(self):
+        self.statements = []
+
+    def add(self, sql, ms):
+        entry = [sql, ms]
+        self.statements.append(entry)
+        return entry
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_ms(self):
+        return sum(ms for _, ms in self.statements)
+
+    def slowest(self, n=SLOWEST_PER_REQUEST):
+        return sorted(self.statements, key=lambda s: s[1], reverse=True)[:n]
+
+    def repeated(self, threshold):
+        """执行次数达到阈值的语句 {sql: 次数}（N+1）"""
+        counts = Counter(sql for sql, _ in self.statements)
+        return {sql: n for sql, n in counts.items() if n >= threshold}
+
+
+class TimedCursor(sqlite3.Cursor):
+    """执行和取结果的耗时都累加到同一条语句上"""
+    entry = None
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            if self.entry is not None:
+                self.entry[1] += (time.perf_counter() - start) * 1000
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+
+def timed_execute(conn, stats, method, sql, parameters):
+    cursor = conn.cursor(TimedCursor)
+    cursor.entry = stats.add(normalize_sql(sql), 0.0)
+    cursor._timed(getattr(cursor, method), sql, parameters)
+    return cursor
+
+
+# ---------- 汇总 ----------
+def _record(endpoint, stats, slow_ms, n_plus_one):
+    slow = [(ms, sql) for sql, ms in stats.statements if ms >= slow_ms]
+    repeated = stats.repeated(n_plus_one)
+    total_ms = stats.total_ms
+    with _lock:
+        agg = _endpoints.setdefault(endpoint, {
+            'endpoint': endpoint, 'requests': 0, 'statements': 0, 'max_statements': 0,
+            'db_ms': 0.0, 'max_db_ms': 0.0, 'slow': 0, 'n_plus_one': 0,
+        })
+        agg['requests'] += 1
+        agg['statements'] += stats.count
+        agg['max_statements'] = max(agg['max_statements'], stats.count)
+        agg['db_ms'] += total_ms
+        agg['max_db_ms'] = max(agg['max_db_ms'], total_ms)
+        agg['slow'] += len(slow)
+        agg['n_plus_one'] += 1 if repeated else 0
+
+        for sql, ms in stats.slowest():
+            _slowest.append((ms, endpoint, sql))
+        _slowest.sort(key=lambda s: s[0], reverse=True)
+        del _slowest[SLOWEST_OVERALL:]
+
+        now = time.strftime('%Y-%m-%d %H:%M:%S')
+        for ms, sql in slow:
+            _warnings.appendleft({'time': now, 'kind': 'slow', 'endpoint': endpoint,
+                                  'detail': f'{ms:.1f} ms', 'sql': sql})
+        for sql, n in repeated.items():
+            _warnings.appendleft({'time': now, 'kind': 'N+1', 'endpoint': endpoint,
+                                  'detail': f'{n} times', 'sql': sql})
+    return slow, repeated
+
+
+def snapshot():
+    """诊断页面使用的汇总数据"""
+    with _lock:
+        endpoints = []
+        for agg in _endpoints.values():
+            row = dict(agg)
+            row['avg_statements'] = agg['statements'] / agg['requests']
+            row['avg_db_ms'] = agg['db_ms'] / agg['requests']
+            endpoints.append(row)
+        endpoints.sort(key=lambda r: r['db_ms'], reverse=True)
+        return {
+            'endpoints': endpoints,
+            'slowest': [{'ms': ms, 'endpoint': ep, 'sql': sql} for ms, ep, sql in _slowest],
+            'warnings': list(_warnings),
+        }
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+        del _slowest[:]
+        _warnings.clear()
+
+
+def init_sql_stats(app):
+    """注册请求钩子，SQL_STATS_ENABLED 关闭时不做任何统计"""
+    if not app.config.get('SQL_STATS_ENABLED'):
+        return
+
+    @app.before_request
+    def start_sql_stats():
+        g.sql_stats = RequestSQLStats()
+
+    @app.teardown_request
+    def finish_sql_stats(error=None):
+        stats = g.pop('sql_stats', None)
+        if stats is None or not stats.statements:
+            return
+        endpoint = request.endpoint or request.path
+        slow, repeated = _record(endpoint, stats, app.config.get('SLOW_QUERY_MS', 100),
+                                 app.config.get('N_PLUS_ONE_THRESHOLD', 10))
+        for ms, sql in slow:
+            app.logger.warning('slow query %.1f ms [%s]: %s', ms, endpoint, sql)
+        for sql, n in repeated.items():
+            app.logger.warning('possible N+1 [%s]: statement ran %d times: %s', endpoint, n, sql)
@@ -1,6 +1,13 @@
 # app/teacher.py
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from app.db import get_db_connection
+from app.db import get_db_connection, get_read_connection
+from app.identity import get_identity
+from app.grade_stats import course_summary, invalidate_grade_stats, section_summary
+from app.teacher_stats import refresh_sections
+from app.timetable import invalidate_timetable
+from app.export import csv_response
+from app.grades import (DEFAULT_REGULAR_RATIO, parse_ratio, parse_score, read_grade_form, read_grade_sheet,
+                        save_grades, recompute_totals)
 
 teacher_bp = Blueprint('teacher', __name__, url_prefix='/teacher')
 
@@ -10,6 +17,19 @@ def require_teacher():
     return session.get('role') == 'teacher'
 
 
+def _refresh_enrollment_section(conn, enrollment_id):
+    """
+    单条成绩修改后更新所属班次的统计（按 enrollment_id 找班次，不信任表单中的 offered_id），
+    返回该选课记录的 (student_id, offered_id)，提交后用于使课表缓存和成绩统计失效
+    """
+    row = conn.execute("SELECT student_id, offered_id FROM enrollment WHERE enrollment_id = ?",
+                       (enrollment_id,)).fetchone()
+    if row:
+        refresh_sections(conn, [row['offered_id']])
+        return row['student_id'], row['offered_id']
+    return None, None
+
+
 # 1.1 查看我的选课情况 - 课程列表
 @teacher_bp.route('/my-courses')
 def my_courses():
@@ -18,20 +38,16 @@ def my_courses():
         return redirect(url_for('auth.login'))
 
     username = session['username']
-    conn = get_db_connection()
+    conn = get_read_connection()
 
-    # 获取教师ID
-    teacher = conn.execute(
-        "SELECT user_id FROM account WHERE username = ?", (username,)
-    ).fetchone()
+    # 教师ID（登录时已解析）
+    teacher_id = get_identity().user_id
 
-    if not teacher:
+    if not teacher_id:
         flash('教师信息不存在！')
         conn.close()
         return redirect(url_for('main.dashboard'))
 
-    teacher_id = teacher['user_id']
-
     # 获取教师所教课程列表
     courses = conn.execute("""
         SELECT 
@@ -68,19 +84,17 @@ def course_detail(offered_id):
         flash('请以教师身份登录！')
         return redirect(url_for('auth.login'))
 
-    conn = get_db_connection()
+    conn = get_read_connection()
 
     # 验证教师是否有权访问此课程
     username = session['username']
-    teacher = conn.execute(
-        "SELECT user_id FROM account WHERE username = ?", (username,)
-    ).fetchone()
+    teacher_id = get_identity().user_id
 
-    if teacher:
+    if teacher_id:
         is_authorized = conn.execute("""
             SELECT 1 FROM offered_course 
             WHERE offered_id = ? AND teacher_id = ?
-        """, (offered_id, teacher['user_id'])).fetchone()
+        """, (offered_id, teacher_id)).fetchone()
 
         if not is_authorized:
             flash('无权访问此课程！')
@@ -127,135 +141,180 @@ def course_detail(offered_id):
         ORDER BY s.student_id
     """, (offered_id,)).fetchall()
 
+    # 成绩分布：本班次，以及这门课程所有班次合计（各班次摘要有缓存）
+    stats = course_stats = None
+    if course_info:
+        stats = section_summary(conn, offered_id).metrics()
+        course_stats = course_summary(conn, course_info['course_id']).metrics()
+
     conn.close()
 
     return render_template('teacher/teacher_course_detail.html',
                            course=course_info,
                            students=students,
+                           stats=stats,
+                           course_stats=course_stats,
                            username=username)
 
 
-# 2.1 成绩录入页面（带比例调整）
-@teacher_bp.route('/grade/<int:offered_id>', methods=['GET', 'POST'])
-def grade_input(offered_id):
+def _own_section(conn, offered_id):
+    """当前教师自己开设的班次（课程名、学期），不是自己的返回 None"""
+    return conn.execute("""
+        SELECT oc.offered_id, c.course_id, c.course_name, s.semester_name
+        FROM offered_course oc
+        JOIN course c ON oc.course_id = c.course_id
+        JOIN semester s ON oc.semester_id = s.semester_id
+        WHERE oc.offered_id = ? AND oc.teacher_id = ?
+    """, (offered_id, get_identity().user_id)).fetchone()
+
+
+# 1.3 导出学生名单（CSV）
+@teacher_bp.route('/course/<int:offered_id>/roster.csv')
+def export_roster(offered_id):
     if not require_teacher():
         flash('请以教师身份登录！')
         return redirect(url_for('auth.login'))
 
-    conn = get_db_connection()
+    conn = get_read_connection()
+    section = _own_section(conn, offered_id)
+    if not section:
+        flash('无权访问此课程！')
+        return redirect(url_for('teacher.my_courses'))
 
-    try:
-        # 验证教师权限
-        username = session['username']
-        teacher = conn.execute(
-            "SELECT user_id FROM account WHERE username = ?", (username,)
-        ).fetchone()
+    return csv_response(
+        f"roster_{section['course_id']}_{section['semester_name']}.csv",
+        ['Student ID', 'Name', 'Gender', 'College ID', 'College'],
+        conn,
+        """
+            SELECT s.student_id, s.name, s.gender, s.college_id, col.college_name
+            FROM enrollment e
+            JOIN student s ON e.student_id = s.student_id
+            LEFT JOIN college col ON s.college_id = col.college_id
+            WHERE e.offered_id = ?
+            ORDER BY s.student_id
+        """,
+        (offered_id,)
+    )
 
-        if teacher:
-            is_authorized = conn.execute("""
-                SELECT 1 FROM offered_course 
-                WHERE offered_id = ? AND teacher_id = ?
-            """, (offered_id, teacher['user_id'])).fetchone()
 
-            if not is_authorized:
-                flash('无权为此课程输入成绩！')
-                return redirect(url_for('teacher.my_courses'))
+# 1.4 导出成绩单（CSV，列与成绩上传的格式一致）
+@teacher_bp.route('/grade/<int:offered_id>/export')
+def export_grades(offered_id):
+    if not require_teacher():
+        flash('请以教师身份登录！')
+        return redirect(url_for('auth.login'))
 
-        # 获取课程基本信息
-        course_info = conn.execute("""
-            SELECT 
-                oc.offered_id,
-                c.course_name,
-                s.semester_name
-            FROM offered_course oc
-            JOIN course c ON oc.course_id = c.course_id
-            JOIN semester s ON oc.semester_id = s.semester_id
-            WHERE oc.offered_id = ?
-        """, (offered_id,)).fetchone()
+    conn = get_read_connection()
+    section = _own_section(conn, offered_id)
+    if not section:
+        flash('无权访问此课程！')
+        return redirect(url_for('teacher.my_courses'))
 
-        # 获取学生名单（用于成绩输入）
-        students = conn.execute("""
-            SELECT 
-                e.enrollment_id,
-                s.student_id,
-                s.name,
-                s.college_id,
-                col.college_name,
-                e.regular_score,
-                e.exam_score,
-                e.total_score
+    return csv_response(
+        f"grades_{section['course_id']}_{section['semester_name']}.csv",
+        ['student_id', 'name', 'regular_score', 'exam_score', 'total_score'],
+        conn,
+        """
+            SELECT s.student_id, s.name, e.regular_score, e.exam_score, e.total_score
             FROM enrollment e
             JOIN student s ON e.student_id = s.student_id
-            JOIN college col ON s.college_id = col.college_id
             WHERE e.offered_id = ?
             ORDER BY s.student_id
-        """, (offered_id,)).fetchall()
+        """,
+        (offered_id,)
+    )
 
-        if request.method == 'POST':
-            # 获取比例设置
-            regular_ratio = float(request.form.get('regular_ratio', 40))
-            exam_ratio = float(request.form.get('exam_ratio', 60))
-
-            # 验证比例总和为100%
-            if regular_ratio + exam_ratio != 100:
-                flash('❌ 平时成绩和考试成绩比例之和必须为100%！')
-                return render_template('teacher/teacher_grade_input.html',
-                                       course=course_info,
-                                       students=students,
-                                       username=username,
-                                       regular_ratio=regular_ratio,
-                                       exam_ratio=exam_ratio)
-
-            # 处理成绩提交
-            success_count = 0
-            for student in students:
-                enrollment_id = student['enrollment_id']
-                regular_score = request.form.get(f'regular_{enrollment_id}')
-                exam_score = request.form.get(f'exam_{enrollment_id}')
-
-                # 计算总评成绩（按设置的比例）
-                total_score = None
-                if regular_score and exam_score:
-                    try:
-                        regular = int(regular_score)
-                        exam = int(exam_score)
-                        total_score = round(regular * (regular_ratio / 100) + exam * (exam_ratio / 100))
-                    except ValueError:
-                        flash(f'学生 {student["name"]} 的成绩格式错误，已跳过')
-                        continue
-
-                # 更新成绩
-                try:
-                    conn.execute("""
-                        UPDATE enrollment 
-                        SET regular_score = ?, exam_score = ?, total_score = ?
-                        WHERE enrollment_id = ?
-                    """, (
-                        int(regular_score) if regular_score else None,
-                        int(exam_score) if exam_score else None,
-                        total_score,
-                        enrollment_id
-                    ))
-                    success_count += 1
-                except Exception as e:
-                    flash(f'更新学生 {student["name"]} 成绩失败: {str(e)}')
 
-            conn.commit()
+def _grade_roster(conn, offered_id):
+    """成绩录入页的学生名单"""
+    return conn.execute("""
+        SELECT 
+            e.enrollment_id,
+            s.student_id,
+            s.name,
+            s.college_id,
+            col.college_name,
+            e.regular_score,
+            e.exam_score,
+            e.total_score
+        FROM enrollment e
+        JOIN student s ON e.student_id = s.student_id
+        JOIN college col ON s.college_id = col.college_id
+        WHERE e.offered_id = ?
+        ORDER BY s.student_id
+    """, (offered_id,)).fetchall()
+
 
-            if success_count > 0:
-                flash('✅ 已保存修改')
-            else:
-                flash('❌ 未更新任何成绩，请检查输入格式')
+def _render_grade_input(course, students, regular_ratio, errors=None, submitted=None):
+    """渲染成绩录入页；errors 为校验错误（未保存任何修改），submitted 为要回填的表单"""
+    return render_template('teacher/teacher_grade_input.html',
+                           course=course,
+                           students=students,
+                           username=session['username'],
+                           regular_ratio=regular_ratio,
+                           exam_ratio=100 - regular_ratio,
+                           errors=errors or [],
+                           submitted=submitted)
+
+
+def _ratio_from(values):
+    """请求中的平时成绩比例；考试比例若也提交了，两者之和必须为 100"""
+    regular_ratio = parse_ratio(values.get('regular_ratio', DEFAULT_REGULAR_RATIO))
+    if values.get('exam_ratio') and parse_ratio(values['exam_ratio']) != 100 - regular_ratio:
+        raise ValueError('平时成绩和考试成绩比例之和必须为100%！')
+    return regular_ratio
+
+
+# 2.1 成绩录入页面（带比例调整）
+@teacher_bp.route('/grade/<int:offered_id>', methods=['GET', 'POST'])
+def grade_input(offered_id):
+    if not require_teacher():
+        flash('请以教师身份登录！')
+        return redirect(url_for('auth.login'))
 
+    conn = get_db_connection()
+
+    try:
+        # 验证教师权限，并取课程基本信息
+        course_info = _own_section(conn, offered_id)
+        if not course_info:
+            flash('无权为此课程输入成绩！')
+            return redirect(url_for('teacher.my_courses'))
+
+        # 获取学生名单（用于成绩输入）
+        students = _grade_roster(conn, offered_id)
+
+        if request.method == 'POST':
+            try:
+                regular_ratio = _ratio_from(request.form)
+            except ValueError as e:
+                flash(f'❌ {e}')
+                return _render_grade_input(course_info, students, DEFAULT_REGULAR_RATIO, submitted=request.form)
+
+            # 先校验整张表单，有错误时不写入任何成绩
+            grades, errors = read_grade_form(
+                request.form, [(s['enrollment_id'], s['student_id'], s['name']) for s in students])
+            if errors:
+                flash(f'❌ {len(errors)} 名学生的成绩格式错误，未保存任何修改')
+                return _render_grade_input(course_info, students, regular_ratio,
+                                           errors=[f'{sid} {name}：{message}' for sid, name, message in errors],
+                                           submitted=request.form)
+
+            changed = save_grades(conn, offered_id, grades, regular_ratio)
+            conn.commit()
+            invalidate_timetable(*[student['student_id'] for student in students])  # 学生首页显示成绩
+            if changed:
+                invalidate_grade_stats(offered_id)
+
+            flash(f'✅ 已保存修改（{changed} 名学生的成绩有变化）' if changed else '成绩没有变化')
             return redirect(url_for('teacher.course_detail', offered_id=offered_id))
 
-        # GET请求时使用默认比例
-        return render_template('teacher/teacher_grade_input.html',
-                               course=course_info,
-                               students=students,
-                               username=username,
-                               regular_ratio=40,
-                               exam_ratio=60)
+        # GET请求时使用默认比例（重算、上传成绩单后带回所用的比例）
+        try:
+            regular_ratio = parse_ratio(request.args.get('regular_ratio', DEFAULT_REGULAR_RATIO))
+        except ValueError:
+            regular_ratio = DEFAULT_REGULAR_RATIO
+        return _render_grade_input(course_info, students, regular_ratio)
 
     except Exception as e:
         flash(f'成绩录入失败: {str(e)}')
@@ -264,6 +323,73 @@ def grade_input(offered_id):
         conn.close()
 
 
+# 2.1.1 上传成绩单（CSV，格式与导出的成绩单相同，按学号对应）
+@teacher_bp.route('/grade/<int:offered_id>/upload', methods=['POST'])
+def upload_grades(offered_id):
+    if not require_teacher():
+        flash('请以教师身份登录！')
+        return redirect(url_for('auth.login'))
+
+    conn = get_db_connection()
+    course_info = _own_section(conn, offered_id)
+    if not course_info:
+        flash('无权为此课程输入成绩！')
+        return redirect(url_for('teacher.my_courses'))
+
+    try:
+        regular_ratio = _ratio_from(request.form)
+    except ValueError as e:
+        flash(f'❌ {e}')
+        return redirect(url_for('teacher.grade_input', offered_id=offered_id))
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('请选择要上传的成绩单（CSV）！')
+        return redirect(url_for('teacher.grade_input', offered_id=offered_id, regular_ratio=regular_ratio))
+
+    students = _grade_roster(conn, offered_id)
+    grades, errors = read_grade_sheet(upload.stream, {s['student_id']: s['enrollment_id'] for s in students})
+    if errors:
+        flash(f'❌ 成绩单有 {len(errors)} 处错误，未保存任何修改')
+        return _render_grade_input(course_info, students, regular_ratio,
+                                   errors=[f'第 {line} 行 {sid}：{message}'.replace(' ：', '：') for line, sid, message in errors])
+
+    changed = save_grades(conn, offered_id, grades, regular_ratio)
+    conn.commit()
+    invalidate_timetable(*[student['student_id'] for student in students])
+    if changed:
+        invalidate_grade_stats(offered_id)
+    flash(f'✅ 成绩单已导入：{len(grades)} 名学生，其中 {changed} 名的成绩有变化')
+    return redirect(url_for('teacher.grade_input', offered_id=offered_id, regular_ratio=regular_ratio))
+
+
+# 2.1.2 修改比例后重算全班总评（不改动平时、考试成绩）
+@teacher_bp.route('/grade/<int:offered_id>/recompute', methods=['POST'])
+def recompute_grades(offered_id):
+    if not require_teacher():
+        flash('请以教师身份登录！')
+        return redirect(url_for('auth.login'))
+
+    conn = get_db_connection()
+    if not _own_section(conn, offered_id):
+        flash('无权为此课程输入成绩！')
+        return redirect(url_for('teacher.my_courses'))
+
+    try:
+        regular_ratio = _ratio_from(request.form)
+    except ValueError as e:
+        flash(f'❌ {e}')
+        return redirect(url_for('teacher.grade_input', offered_id=offered_id))
+
+    changed = recompute_totals(conn, offered_id, regular_ratio)
+    conn.commit()
+    if changed:
+        invalidate_timetable(*[row['student_id'] for row in conn.execute(
+            "SELECT student_id FROM enrollment WHERE offered_id = ?", (offered_id,))])
+        invalidate_grade_stats(offered_id)
+    flash(f'✅ 已按 平时 {regular_ratio}% / 考试 {100 - regular_ratio}% 重算总评，{changed} 名学生的总评有变化')
+    return redirect(url_for('teacher.grade_input', offered_id=offered_id, regular_ratio=regular_ratio))
+
+
 # 2.2 快速成绩提交（单名学生）
 @teacher_bp.route('/update-single-grade', methods=['POST'])
 def update_single_grade():
@@ -283,46 +409,40 @@ def update_single_grade():
 
     try:
         # 验证权限
-        username = session['username']
-        teacher = conn.execute(
-            "SELECT user_id FROM account WHERE username = ?", (username,)
-        ).fetchone()
+        teacher_id = get_identity().user_id
 
-        if teacher:
+        if teacher_id:
             is_authorized = conn.execute("""
                 SELECT 1 FROM offered_course oc
                 JOIN enrollment e ON oc.offered_id = e.offered_id
                 WHERE e.enrollment_id = ? AND oc.teacher_id = ?
-            """, (enrollment_id, teacher['user_id'])).fetchone()
+            """, (enrollment_id, teacher_id)).fetchone()
 
             if not is_authorized:
                 flash('无权修改此成绩！')
                 return redirect(url_for('teacher.my_courses'))
 
-        # 计算总评成绩
-        total_score = None
-        if regular_score and exam_score:
-            try:
-                regular = float(regular_score)
-                exam = float(exam_score)
-                total_score = round(regular * 0.4 + exam * 0.6, 2)
-            except ValueError:
-                flash('成绩格式错误！')
-                return redirect(url_for('teacher.grade_input', offered_id=offered_id))
-
-        # 更新成绩
-        conn.execute("""
-            UPDATE enrollment 
-            SET regular_score = ?, exam_score = ?, total_score = ?
-            WHERE enrollment_id = ?
-        """, (
-            float(regular_score) if regular_score else None,
-            float(exam_score) if exam_score else None,
-            total_score,
-            enrollment_id
-        ))
+        # 与整表保存相同的校验和总评公式（save_grades），比例未提交时用默认比例
+        try:
+            regular_ratio = _ratio_from(request.form)
+            grades = [(int(enrollment_id), parse_score(regular_score), parse_score(exam_score))]
+        except ValueError as e:
+            flash(f'❌ {e}')
+            return redirect(url_for('teacher.grade_input', offered_id=offered_id))
+
+        # 按 enrollment_id 找班次，不信任表单中的 offered_id
+        row = conn.execute("SELECT student_id, offered_id FROM enrollment WHERE enrollment_id = ?",
+                           (enrollment_id,)).fetchone()
+        if not row:
+            flash('参数错误！')
+            return redirect(url_for('teacher.my_courses'))
+        changed = save_grades(conn, row['offered_id'], grades, regular_ratio)
         conn.commit()
-        flash('✅ 已保存修改')
+        if changed:
+            invalidate_timetable(row['student_id'])
+            invalidate_grade_stats(row['offered_id'])
+        flash('✅ 已保存修改' if changed else '成绩没有变化')
+        return redirect(url_for('teacher.grade_input', offered_id=row['offered_id'], regular_ratio=regular_ratio))
 
     except Exception as e:
         flash(f'❌ 成绩更新失败: {str(e)}')
@@ -350,9 +470,8 @@ def reset_grade():
 
     conn = get_db_connection()
     try:
-        username = session['username']
-        teacher = conn.execute("SELECT user_id FROM account WHERE username = ?", (username,)).fetchone()
-        if not teacher:
+        teacher_id = get_identity().user_id
+        if not teacher_id:
             flash('教师账户异常！')
             return redirect(url_for('auth.login'))
 
@@ -360,7 +479,7 @@ def reset_grade():
             SELECT 1 FROM offered_course oc
             JOIN enrollment e ON oc.offered_id = e.offered_id
             WHERE e.enrollment_id = ? AND oc.teacher_id = ?
-        """, (enrollment_id, teacher['user_id'])).fetchone()
+        """, (enrollment_id, teacher_id)).fetchone()
 
         if not is_authorized:
             flash('无权重置此学生成绩！')
@@ -374,8 +493,11 @@ def reset_grade():
                 total_score = ?
             WHERE enrollment_id = ?
         """, (None, None, None, enrollment_id))
+        student_id, section_id = _refresh_enrollment_section(conn, enrollment_id)
 
         conn.commit()
+        invalidate_timetable(student_id)
+        invalidate_grade_stats(section_id)
         flash('✅ 成绩已重置为空')
     except Exception as e:
         flash(f'❌ 重置成绩失败: {str(e)}')
@@ -0,0 +1,159 @@
+# app/teacher_stats.py
+"""
+教师仪表盘统计（物化）
+
+教师首页原来每次打开都要对 offered_course ⋈ enrollment 做三次聚合。现在改为两张统计表：
+- section_stats(offered_id)：每个班次的选课人数 enrolled、未出成绩人数 ungraded
+- teacher_stats(teacher_id, semester_id)：教师某学期的不同学生数 student_count、
+  有未出成绩学生的班次数 pending_sections
+
+写入 enrollment 的地方在同一事务内调用这里的函数做增量更新：
+- 选课 record_enroll / 退课 record_drop（在 DELETE 之前调用）
+- 修改成绩、座位账本批量写回 refresh_sections（按班次重新计数）
+直接改过 offered_course / enrollment（如 tools 脚本）后调用 rebuild_teacher_stats() 全量重建。
+"""
+
+
+def _section(conn, offered_id):
+    """取班次统计行，没有时按 offered_course 补建；班次不存在返回 None"""
+    conn.execute("""
+        INSERT OR IGNORE INTO section_stats (offered_id, teacher_id, semester_id, enrolled, ungraded)
+        SELECT offered_id, teacher_id, semester_id, 0, 0 FROM offered_course WHERE offered_id = ?
+    """, (offered_id,))
+    return conn.execute(
+        "SELECT teacher_id, semester_id, enrolled, ungraded FROM section_stats WHERE offered_id = ?",
+        (offered_id,)
+    ).fetchone()
+
+
+def _other_section_of_teacher(conn, student_id, offered_id, teacher_id, semester_id):
+    """学生是否还选了该教师同一学期的其他班次（决定不同学生数是否变化）"""
+    return conn.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM enrollment e
+            JOIN offered_course oc ON e.offered_id = oc.offered_id
+            WHERE e.student_id = ? AND e.offered_id != ?
+              AND oc.teacher_id = ? AND oc.semester_id = ?
+        )
+    """, (student_id, offered_id, teacher_id, semester_id)).fetchone()[0]
+
+
+def _add_teacher(conn, teacher_id, semester_id, students, pending):
+    if not students and not pending:
+        return
+    conn.execute("""
+        INSERT INTO teacher_stats (teacher_id, semester_id, student_count, pending_sections)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (teacher_id, semester_id) DO UPDATE SET
+            student_count = student_count + excluded.student_count,
+            pending_sections = pending_sections + excluded.pending_sections
+    """, (teacher_id, semester_id, students, pending))
+
+
+def record_enroll(conn, student_id, offered_id):
+    """学生选课成功（enrollment 已插入，成绩为空）"""
+    section = _section(conn, offered_id)
+    if section is None:
+        return
+    conn.execute(
+        "UPDATE section_stats SET enrolled = enrolled + 1, ungraded = ungraded + 1 WHERE offered_id = ?",
+        (offered_id,)
+    )
+    new_student = not _other_section_of_teacher(conn, student_id, offered_id,
+                                                section['teacher_id'], section['semester_id'])
+    _add_teacher(conn, section['teacher_id'], section['semester_id'],
+                 1 if new_student else 0, 1 if section['ungraded'] == 0 else 0)
+
+
+def record_drop(conn, student_id, offered_id):
+    """学生退课，须在删除 enrollment 之前调用"""
+    row = conn.execute(
+        "SELECT total_score FROM enrollment WHERE student_id = ? AND offered_id = ?",
+        (student_id, offered_id)
+    ).fetchone()
+    section = _section(conn, offered_id)
+    if row is None or section is None:
+        return
+    ungraded = 1 if row['total_score'] is None else 0
+    conn.execute(
+        "UPDATE section_stats SET enrolled = enrolled - 1, ungraded = ungraded - ? WHERE offered_id = ?",
+        (ungraded, offered_id)
+    )
+    gone = not _other_section_of_teacher(conn, student_id, offered_id,
+                                         section['teacher_id'], section['semester_id'])
+    _add_teacher(conn, section['teacher_id'], section['semester_id'],
+                 -1 if gone else 0, -1 if ungraded and section['ungraded'] == 1 else 0)
+
+
+def refresh_sections(conn, offered_ids):
+    """
+    按班次重新计数（成绩修改、批量选课/退课之后调用），
+    并重新统计这些班次所属教师学期的 teacher_stats 行。
+    """
+    offered_ids = list(set(offered_ids))
+    if not offered_ids:
+        return
+    placeholders = ','.join('?' * len(offered_ids))
+    conn.execute(f"""
+        INSERT OR REPLACE INTO section_stats (offered_id, teacher_id, semester_id, enrolled, ungraded)
+        SELECT oc.offered_id, oc.teacher_id, oc.semester_id,
+               COUNT(e.enrollment_id),
+               COUNT(e.enrollment_id) - COUNT(e.total_score)
+        FROM offered_course oc
+        LEFT JOIN enrollment e ON e.offered_id = oc.offered_id
+        WHERE oc.offered_id IN ({placeholders})
+        GROUP BY oc.offered_id
+    """, offered_ids)
+    keys = conn.execute(f"""
+        SELECT DISTINCT teacher_id, semester_id FROM section_stats WHERE offered_id IN ({placeholders})
+    """, offered_ids).fetchall()
+    for key in keys:
+        _refresh_teacher(conn, key['teacher_id'], key['semester_id'])
+
+
+def _refresh_teacher(conn, teacher_id, semester_id):
+    conn.execute("""
+        INSERT OR REPLACE INTO teacher_stats (teacher_id, semester_id, student_count, pending_sections)
+        SELECT ?, ?,
+               (SELECT COUNT(DISTINCT e.student_id)
+                FROM offered_course oc JOIN enrollment e ON e.offered_id = oc.offered_id
+                WHERE oc.teacher_id = ? AND oc.semester_id = ?),
+               (SELECT COUNT(*) FROM section_stats
+                WHERE teacher_id = ? AND semester_id = ? AND ungraded > 0)
+    """, (teacher_id, semester_id) * 3)
+
+
+def rebuild_teacher_stats(conn):
+    """按 offered_course / enrollment 全量重建两张统计表（调用方负责 commit）"""
+    conn.execute("DELETE FROM section_stats")
+    conn.execute("DELETE FROM teacher_stats")
+    conn.execute("""
+        INSERT INTO section_stats (offered_id, teacher_id, semester_id, enrolled, ungraded)
+        SELECT oc.offered_id, oc.teacher_id, oc.semester_id,
+               COUNT(e.enrollment_id),
+               COUNT(e.enrollment_id) - COUNT(e.total_score)
+        FROM offered_course oc
+        LEFT JOIN enrollment e ON e.offered_id = oc.offered_id
+        GROUP BY oc.offered_id
+    """)
+    conn.execute("""
+        INSERT INTO teacher_stats (teacher_id, semester_id, student_count, pending_sections)
+        SELECT ss.teacher_id, ss.semester_id,
+               (SELECT COUNT(DISTINCT e.student_id)
+                FROM offered_course oc JOIN enrollment e ON e.offered_id = oc.offered_id
+                WHERE oc.teacher_id = ss.teacher_id AND oc.semester_id = ss.semester_id),
+               SUM(ss.ungraded > 0)
+        FROM section_stats ss
+        GROUP BY ss.teacher_id, ss.semester_id
+    """)
+
+
+def teacher_summary(conn, teacher_id, semester_id):
+    """教师首页统计：(当前学期不同学生数, 有未出成绩学生的班次数)，一次按主键读取"""
+    row = conn.execute("""
+        SELECT COALESCE(MAX(CASE WHEN semester_id = ? THEN student_count END), 0) AS total_students,
+               COALESCE(SUM(pending_sections), 0) AS pending_courses
+        FROM teacher_stats
+        WHERE teacher_id = ?
+    """, (semester_id, teacher_id)).fetchone()
+    return row['total_students'], row['pending_courses']
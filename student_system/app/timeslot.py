@@ -0,0 +1,99 @@
+# app/timeslot.py
+"""
+上课时间 time_slot 的结构化表示
+
+time_slot 形如 "Monday 8:00-9:40"，写入 offered_course 时解析一次，
+存成 周×节次 位图 time_mask（周一~周五 × 第1~10节 = 50 位，一个整数即可）：
+第 (weekday - 1) * 10 + (period - 1) 位为 1 表示该时段有课。
+冲突检测、课表生成、按星期分组都只需位运算，不再反复解析字符串。
+"""
+
+DAYS = 5
+PERIODS_PER_DAY = 10
+
+WEEKDAY_NAMES = {
+    'Monday': 1, 'Tuesday': 2, 'Wednesday': 3, 'Thursday': 4,
+    'Friday': 5, 'Saturday': 6, 'Sunday': 7
+}
+
+# 每节课的 [开始, 结束] 时间（结束 = 开始 + 45分钟）
+PERIOD_TIMES = [
+    (1, "8:00", "8:45"),
+    (2, "8:55", "9:40"),
+    (3, "10:00", "10:45"),
+    (4, "10:55", "11:40"),
+    (5, "14:00", "14:45"),
+    (6, "14:55", "15:40"),
+    (7, "16:00", "16:45"),
+    (8, "16:55", "17:40"),
+    (9, "19:00", "19:45"),
+    (10, "19:55", "20:40")
+]
+
+
+def _to_minutes(time_str):
+    hour, minute = time_str.strip().split(':')
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(time_str)
+    return hour * 60 + minute
+
+
+_PERIOD_MINUTES = [(num, _to_minutes(start), _to_minutes(end)) for num, start, end in PERIOD_TIMES]
+_DAY_BITS = (1 << PERIODS_PER_DAY) - 1
+
+
+def time_to_period(time_str):
+    """将 '8:00' 或 '14:30' 转为节次编号，不在任何一节课内返回 None"""
+    try:
+        t = _to_minutes(time_str)
+    except (ValueError, AttributeError):
+        return None
+    for period_num, start, end in _PERIOD_MINUTES:
+        if start <= t <= end:  # 允许等于 end（因为 end 是实际下课时间）
+            return period_num
+    return None
+
+
+def parse_time_slot(slot):
+    """
+    输入: "Monday 8:00-9:40"
+    输出: (weekday_int, [period_start, ..., period_end]) → (1, [1, 2])，无法解析返回 (None, [])
+    """
+    if not slot:
+        return None, []
+    slot = slot.strip()
+    for day_str, wd in WEEKDAY_NAMES.items():
+        if slot.startswith(day_str):
+            time_part = slot[len(day_str):]  # 如 " 8:00-10:00"
+            if '-' in time_part:
+                start_time, end_time = time_part.split('-', 1)
+                p1 = time_to_period(start_time)
+                p2 = time_to_period(end_time)
+                if p1 and p2:
+                    return wd, list(range(p1, p2 + 1))
+            break
+    return None, []
+
+
+def time_slot_mask(slot):
+    """把 time_slot 字符串转为位图；周末或无法解析时返回 0"""
+    weekday, periods = parse_time_slot(slot)
+    if weekday is None or weekday > DAYS:
+        return 0
+    mask = 0
+    for p in periods:
+        if 1 <= p <= PERIODS_PER_DAY:
+            mask |= 1 << ((weekday - 1) * PERIODS_PER_DAY + (p - 1))
+    return mask
+
+
+def day_periods(mask, weekday):
+    """位图中某一天（1~5）有课的节次列表"""
+    bits = (mask >> ((weekday - 1) * PERIODS_PER_DAY)) & _DAY_BITS
+    return [p + 1 for p in range(PERIODS_PER_DAY) if bits >> p & 1]
+
+
+def mask_weekdays(mask):
+    """位图中有课的星期（1~5）"""
+    return [wd for wd in range(1, DAYS + 1) if (mask >> ((wd - 1) * PERIODS_PER_DAY)) & _DAY_BITS]
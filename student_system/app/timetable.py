@@ -0,0 +1,104 @@
+# app/timetable.py
+"""
+学生课表缓存
+
+学生首页和课表页每次打开都要查一遍已选课程、解析上课时间、填 5×10 的课表。
+而一个学生的课表只在选课、退课（以及成绩变化时首页上的成绩）后才会改变，
+因此按学生缓存一份可以直接渲染的 StudentTimetable：
+- 键为 student_id，值记录所属学期和课程目录版本，学期切换或目录被修改后自动失效
+- LRU 淘汰，最多 Config.TIMETABLE_CACHE_SIZE 个学生，内存占用与学生总数无关
+选课 / 退课 / 座位账本写回 / 修改成绩提交事务之后调用 invalidate_timetable(student_id)。
+"""
+from app.cache import LRUCache
+from app.catalog import catalog_version
+from app.timeslot import day_periods, mask_weekdays, time_slot_mask
+
+DEFAULT_SIZE = 2048
+
+_cache = None
+
+
+class StudentTimetable:
+    """某学生某学期的课表（只读）"""
+
+    def __init__(self, semester_id, version, rows):
+        self.semester_id = semester_id
+        self.version = version
+        # 学生首页的已选课程列表
+        self.enrollments = tuple(dict(row) for row in rows)
+
+        # 按星期几分组课程（学生首页使用，0 = 周一）
+        self.courses_by_day = {}
+        # 周一到周五 × 1-10 节（课表页使用）
+        self.time_table = {day: {period: None for period in range(1, 11)} for day in range(1, 6)}
+
+        for course in self.enrollments:
+            mask = course['time_mask']
+            if mask is None:
+                mask = time_slot_mask(course['time_slot'])  # 尚未回填位图的旧数据
+
+            for weekday in mask_weekdays(mask):  # 位图只含周一到周五
+                self.courses_by_day.setdefault(weekday - 1, []).append(course)
+
+                periods = day_periods(mask, weekday)
+                start_p = min(periods)
+                end_p = max(periods)
+                for p in range(start_p, end_p + 1):
+                    self.time_table[weekday][p] = {
+                        'name': course['course_name'],
+                        'teacher': course['teacher_name'],
+                        'classroom': course['classroom'],
+                        'span_start': start_p,
+                        'span_end': end_p
+                    }
+
+
+def init_timetable_cache(app):
+    global _cache
+    _cache = LRUCache(app.config.get('TIMETABLE_CACHE_SIZE', DEFAULT_SIZE), name='timetable')
+    return _cache
+
+
+def get_timetable_cache():
+    global _cache
+    if _cache is None:
+        _cache = LRUCache(DEFAULT_SIZE, name='timetable')
+    return _cache
+
+
+def _load(conn, student_id, semester_id, version):
+    rows = conn.execute("""
+        SELECT
+            c.course_name,
+            t.name AS teacher_name,
+            e.regular_score,
+            e.exam_score,
+            e.total_score,
+            oc.offered_id,
+            oc.classroom,
+            oc.time_slot,
+            oc.time_mask
+        FROM enrollment e
+        JOIN offered_course oc ON e.offered_id = oc.offered_id
+        JOIN course c ON oc.course_id = c.course_id
+        JOIN teacher t ON oc.teacher_id = t.teacher_id
+        WHERE e.student_id = ? AND oc.semester_id = ?
+    """, (student_id, semester_id)).fetchall()
+    return StudentTimetable(semester_id, version, rows)
+
+
+def get_timetable(conn, student_id, semester_id):
+    """学生在 semester_id 学期的课表，优先取缓存"""
+    version = catalog_version()
+    return get_timetable_cache().get_or_build(
+        student_id,
+        lambda: _load(conn, student_id, semester_id, version),
+        valid=lambda t: t.semester_id == semester_id and t.version == version,
+    )
+
+
+def invalidate_timetable(*student_ids):
+    """学生选课 / 退课 / 成绩变化后调用（在事务提交之后）"""
+    cache = get_timetable_cache()
+    for student_id in student_ids:
+        cache.invalidate(student_id)
@@ -2,4 +2,36 @@ import os
 
 class Config:
     SECRET_KEY = '123'
-    DATABASE = 'students.db'
\ No newline at end of file
+    DATABASE = 'students.db'
+    DB_POOL_SIZE = 8   # 每个进程的读写 / 只读连接池各自最多保持的 SQLite 连接数
+    AUTO_MIGRATE = True  # 启动时执行 app/migrations.py 中未执行的数据库迁移
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 上传文件（学生/教师 CSV 导入）的最大字节数
+
+    # SQL 统计：按请求记录语句数和耗时，管理员在 /diagnostics 查看
+    SQL_STATS_ENABLED = True
+    SLOW_QUERY_MS = 100          # 超过该耗时（毫秒）的语句写入慢查询日志
+    N_PLUS_ONE_THRESHOLD = 10    # 同一语句在一个请求中执行达到该次数时给出 N+1 警告
+
+    # 密码哈希进程池：登录时的哈希计算交给子进程，队列满时提示用户稍后重试
+    HASH_EXECUTOR_ENABLED = True
+    HASH_WORKERS = None       # 子进程数，None 表示 CPU 核数
+    HASH_MAX_PENDING = 64     # 排队 + 计算中的最大任务数
+    HASH_TIMEOUT = 10.0       # 秒，等待结果的最长时间
+    HASH_MAX_BACKGROUND = 2   # 登录后重新计算旧哈希的后台任务数上限（单独计数，不占登录名额）
+    # 密码哈希算法及参数（werkzeug 格式），可用 tools/密码哈希基准.py 比较各候选设置的耗时
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'   # 例如 'pbkdf2:sha256:600000'
+    PASSWORD_SALT_LENGTH = 16
+    REHASH_ON_LOGIN = True    # 登录成功后把不符合当前设置的旧哈希在后台重新计算并写回
+    # 账号身份版本号（禁用账号、修改姓名等）在进程内缓存的秒数，其他工作进程中的修改最迟在这段时间后生效
+    AUTH_VERSION_TTL = 5.0
+
+    # 学生课表缓存：最多缓存的学生数（LRU 淘汰）
+    TIMETABLE_CACHE_SIZE = 2048
+    # 成绩分布统计缓存：最多缓存的班次数（每个约 1 KB），应不少于全校班次数
+    GRADE_STATS_CACHE_SIZE = 50000
+
+    # 选课座位账本：选课高峰期在内存中判定选课/退课，再批量异步写回数据库
+    SEAT_LEDGER_ENABLED = False
+    SEAT_LEDGER_FLUSH_INTERVAL = 0.05  # 秒，写回线程攒批的等待时间
+    SEAT_LEDGER_BATCH_SIZE = 500       # 每个写回事务最多包含的操作数
+    SEAT_LEDGER_READ_CONNECTIONS = 4   # 账本按需载入学生状态的专用只读连接数（不占用请求连接池）
@@ -11,4 +11,5 @@ if __name__ == '__main__':
     if not os.path.exists(app.config['DATABASE']):
         print(f"⚠️ 警告：数据库 {app.config['DATABASE']} 不存在！")
 
-    app.run(debug=True, threaded=False)
\ No newline at end of file
+    # 多线程处理请求：密码哈希在进程池中计算，数据库连接来自连接池
+    app.run(debug=True, threaded=True)
\ No newline at end of file
@@ -64,6 +64,7 @@ CREATE TABLE "offered_course" (
 	"semester_id"	VARCHAR(20),
 	"classroom"	VARCHAR(50),
 	"time_slot"	VARCHAR(50),
+	"time_mask"	INTEGER,
 	"capacity"	INT,
 	"current_count"	INT DEFAULT 0,
 	UNIQUE("course_id","teacher_id","semester_id"),
@@ -92,6 +93,8 @@ CREATE TABLE "account" (
 	"role"	VARCHAR(20) NOT NULL CHECK("role" IN ('student', 'teacher', 'admin')),
 	"user_id"	VARCHAR(20),
 	"is_active"	BOOLEAN DEFAULT 1,
+	"auth_version"	INTEGER NOT NULL DEFAULT 0,
+	"display_name"	TEXT,
 	PRIMARY KEY("username")
 );
 
@@ -103,6 +106,7 @@ CREATE TABLE "messages" (
 	"content"	TEXT NOT NULL,
 	"created_at"	DATETIME DEFAULT CURRENT_TIMESTAMP,
 	"status"	TEXT DEFAULT 'open' CHECK("status" IN ('open', 'closed')),
+	"last_activity_at"	DATETIME,
 	PRIMARY KEY("message_id" AUTOINCREMENT)
 );
 
@@ -116,4 +120,27 @@ CREATE TABLE "replies" (
 	"created_at"	DATETIME DEFAULT CURRENT_TIMESTAMP,
 	PRIMARY KEY("reply_id" AUTOINCREMENT),
 	FOREIGN KEY("message_id") REFERENCES "messages"("message_id") ON DELETE CASCADE
-);
\ No newline at end of file
+);
+CREATE TABLE "section_stats" (
+	"offered_id"	INTEGER,
+	"teacher_id"	VARCHAR(20) NOT NULL,
+	"semester_id"	VARCHAR(20) NOT NULL,
+	"enrolled"	INTEGER NOT NULL DEFAULT 0,
+	"ungraded"	INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY("offered_id")
+);
+
+CREATE TABLE "teacher_stats" (
+	"teacher_id"	VARCHAR(20) NOT NULL,
+	"semester_id"	VARCHAR(20) NOT NULL,
+	"student_count"	INTEGER NOT NULL DEFAULT 0,
+	"pending_sections"	INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY("teacher_id","semester_id")
+) WITHOUT ROWID;
+
+CREATE TABLE "counters" (
+	"scope"	TEXT NOT NULL,
+	"key"	TEXT NOT NULL DEFAULT '',
+	"value"	INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY("scope","key")
+) WITHOUT ROWID;
@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
 import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.timeslot import time_slot_mask
 
 # === 配置 ===
 DB_PATH = "students-ENG.db"  # 你的 SQLite 数据库文件
@@ -67,6 +72,7 @@ def migrate_data():
             row['semester_id'],
             classroom_en,
             time_en,
+            time_slot_mask(time_en),  # 写入时即解析为位图
             row['capacity'],
             row['current_count']
         ))
@@ -75,8 +81,8 @@ def migrate_data():
     cursor.executemany("""
         INSERT INTO offered_course (
             offered_id, course_id, teacher_id, semester_id,
-            classroom, time_slot, capacity, current_count
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            classroom, time_slot, time_mask, capacity, current_count
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, insert_data)
 
     conn.commit()
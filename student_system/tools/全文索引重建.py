@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+重建全文检索索引（FTS5），并做完整性检查。
+正常情况下索引由触发器自动同步；导入旧数据、直接改过数据库文件或索引损坏时运行。
+
+用法:
+    python tools/全文索引重建.py [数据库路径]
+"""
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.search import rebuild_mailbox_index, rebuild_people_index
+
+# === 配置 ===
+DB_PATH = sys.argv[1] if len(sys.argv) > 1 else "students.db"
+
+# (名称, 重建函数, 涉及的 FTS 表)
+INDEXES = [
+    ('mailbox', rebuild_mailbox_index, ['messages_fts', 'replies_fts']),
+    ('people', rebuild_people_index, ['student_fts', 'teacher_fts']),
+]
+
+if __name__ == "__main__":
+    if not os.path.exists(DB_PATH):
+        print(f"❌ 数据库 {DB_PATH} 不存在")
+        sys.exit(1)
+    conn = sqlite3.connect(DB_PATH, timeout=20.0)
+    try:
+        for name, rebuild, tables in INDEXES:
+            start = time.perf_counter()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                rebuild(conn)
+                for table in tables:
+                    conn.execute(f"INSERT INTO {table} ({table}) VALUES ('integrity-check')")
+                    conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"❌ {name} 索引重建失败（是否尚未执行数据库迁移？）: {e}")
+                sys.exit(1)
+            rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables)
+            print(f"✅ {name}: {rows} 行，用时 {(time.perf_counter() - start) * 1000:.0f} ms")
+    finally:
+        conn.close()
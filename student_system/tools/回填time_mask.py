@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+为已有的 offered_course 记录补充 time_mask 列（周×节次位图）
+
+应用启动时的数据库迁移（app/migrations.py 第 15 步）会自动完成同样的工作；
+这里用于直接改过 offered_course.time_slot 之后重新回填，并列出无法解析的上课时间。
+"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.migrations import add_time_mask
+
+# === 配置 ===
+DB_PATH = sys.argv[1] if len(sys.argv) > 1 else "students.db"
+
+
+def backfill():
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        add_time_mask(conn)
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) FROM offered_course").fetchone()[0]
+        print(f"✅ 成功回填 {total} 条开课记录的 time_mask")
+        for offered_id, time_slot in conn.execute(
+                "SELECT offered_id, time_slot FROM offered_course WHERE time_mask = 0"):
+            print(f"⚠️ 无法解析的上课时间（位图为 0）: offered_id={offered_id}, time_slot={time_slot!r}")
+    except Exception as e:
+        print(f"❌ 回填失败: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    backfill()
@@ -1,48 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+批量生成学生/教师账号（用户名 = 学号/工号，初始密码 = 身份证后 6 位，没有则为 123456）
+
+- 用一条查询找出还没有账号的学生/教师（与 account 表求差集），已存在的账号不再逐行尝试插入
+- 密码哈希分给进程池（默认 CPU 核数个子进程）计算，哈希算法使用 Config.PASSWORD_HASH_METHOD
+- 按块 executemany 插入，每块一个事务；中途中断时已提交的块保留，重新运行会自动跳过
+- 可以只处理某一届学生（--year），用于每年新生入学后增量生成
+
+用法:
+    python tools/学生老师账号生成.py [--db students.db] [--year 2025] [--no-teachers]
+                                    [--workers N] [--chunk 500]
+"""
+import argparse
+import os
 import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from werkzeug.security import generate_password_hash
 
-# ⚠️ 修改为你的实际数据库路径（如 'instance/school.db'）
-DB_PATH = 'students-ENG.db'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+from app.hashing import initial_password
+
+# ⚠️ 默认数据库路径，可用 --db 指定
+DB_PATH = 'students.db'
+
+
+def _hash(password):
+    """在子进程中执行"""
+    return generate_password_hash(password, Config.PASSWORD_HASH_METHOD, Config.PASSWORD_SALT_LENGTH)
+
+
+def missing_students(conn, year=None):
+    """还没有账号的学生 [(student_id, id_card)]"""
+    sql = """
+        SELECT s.student_id, s.id_card
+        FROM student s
+        LEFT JOIN account a ON a.username = s.student_id
+        WHERE a.username IS NULL
+    """
+    params = ()
+    if year is not None:
+        sql += " AND s.enrollment_year = ?"
+        params = (year,)
+    return conn.execute(sql + " ORDER BY s.student_id", params).fetchall()
+
+
+def missing_teachers(conn):
+    """还没有账号的教师 [(teacher_id, id_card)]"""
+    return conn.execute("""
+        SELECT t.teacher_id, t.id_card
+        FROM teacher t
+        LEFT JOIN account a ON a.username = t.teacher_id
+        WHERE a.username IS NULL
+        ORDER BY t.teacher_id
+    """).fetchall()
 
-def init_accounts():
-    conn = sqlite3.connect(DB_PATH)
+
+def provision(conn, pool, rows, role, chunk_size):
+    """为 rows 中的用户创建 role 账号，返回实际插入的行数"""
+    if not rows:
+        return 0
+    passwords = [initial_password(id_card) for _, id_card in rows]
+    hashes = pool.map(_hash, passwords, chunksize=16)  # 按提交顺序返回，边算边插入
+
+    inserted = 0
+    batch = []
+    for (user_id, _), hashed in zip(rows, hashes):
+        batch.append((user_id, hashed, role, user_id))
+        if len(batch) >= chunk_size:
+            inserted += _insert(conn, batch)
+            batch = []
+    if batch:
+        inserted += _insert(conn, batch)
+    return inserted
+
+
+def _insert(conn, batch):
+    # OR IGNORE：运行期间管理员手动创建了同名账号时不报错
+    with conn:
+        before = conn.total_changes
+        conn.executemany("""
+            INSERT OR IGNORE INTO account (username, password_hash, role, user_id, is_active)
+            VALUES (?, ?, ?, ?, 1)
+        """, batch)
+        return conn.total_changes - before
+
+
+def init_accounts(db_path=DB_PATH, year=None, teachers=True, workers=None, chunk_size=500):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
     try:
-        # === 1. 为学生创建账号 ===
-        cur = conn.execute("SELECT student_id, id_card FROM student")
-        student_count = 0
-        for student_id, id_card in cur.fetchall():
-            username = student_id
-            raw_password = (id_card[-6:] if id_card and len(id_card) >= 6 else '123456')
-            hashed = generate_password_hash(raw_password)
-
-            try:
-                conn.execute("""
-                    INSERT INTO account (username, password_hash, role, user_id, is_active)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (username, hashed, 'student', username, True))
-                student_count += 1
-            except sqlite3.IntegrityError:
-                print(f"⚠️ 学生账号已存在，跳过: {username}")
-
-        # === 2. 为教师创建账号 ===
-        cur = conn.execute("SELECT teacher_id, id_card FROM teacher")
-        teacher_count = 0
-        for teacher_id, id_card in cur.fetchall():
-            username = teacher_id
-            raw_password = (id_card[-6:] if id_card and len(id_card) >= 6 else '123456')
-            hashed = generate_password_hash(raw_password)
-
-            try:
-                conn.execute("""
-                    INSERT INTO account (username, password_hash, role, user_id, is_active)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (username, hashed, 'teacher', username, True))
-                teacher_count += 1
-            except sqlite3.IntegrityError:
-                print(f"⚠️ 教师账号已存在，跳过: {username}")
-
-        conn.commit()
+        students = missing_students(conn, year)
+        teacher_rows = missing_teachers(conn) if teachers else []
+        scope = f"{year} 级" if year is not None else "全部"
+        print(f"待创建：{scope}学生账号 {len(students)} 个，教师账号 {len(teacher_rows)} 个"
+              f"（哈希设置 {Config.PASSWORD_HASH_METHOD}）")
+        if not students and not teacher_rows:
+            print("✅ 没有需要创建的账号")
+            return
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            student_count = provision(conn, pool, students, 'student', chunk_size)
+            teacher_count = provision(conn, pool, teacher_rows, 'teacher', chunk_size)
+        elapsed = time.perf_counter() - start
+
+        total = student_count + teacher_count
         print(f"✅ 账号初始化完成！新增学生账号: {student_count} 个，教师账号: {teacher_count} 个")
+        print(f"   用时 {elapsed:.1f}s，{total / elapsed:.1f} 行/秒")
 
     except Exception as e:
         print(f"❌ 初始化失败: {e}")
@@ -50,5 +118,13 @@ def init_accounts():
     finally:
         conn.close()
 
+
 if __name__ == "__main__":
-    init_accounts()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='批量生成学生/教师账号')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--year', type=int, help='只处理该入学年份的学生')
+    parser.add_argument('--no-teachers', action='store_true', help='不处理教师账号')
+    parser.add_argument('--workers', type=int, help='哈希子进程数，默认 CPU 核数')
+    parser.add_argument('--chunk', type=int, default=500, help='每个插入事务的行数')
+    args = parser.parse_args()
+    init_accounts(args.db, args.year, not args.no_teachers, args.workers, args.chunk)
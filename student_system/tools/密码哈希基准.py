@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+密码哈希基准测试：比较各候选哈希设置的单次校验耗时和登录吞吐量，
+用于选择 Config.PASSWORD_HASH_METHOD。
+
+- 单核：在当前进程中逐次校验，得到 ms/次 和 每核每秒登录数
+- 进程池：用 CPU 核数个子进程并发校验，得到整机每秒登录数
+- 按整届学生人数（--cohort）估算选课开始时全部登录完成所需的时间
+
+不访问数据库。用法:
+    python tools/密码哈希基准.py [--cohort 1500] [--rounds 20] [候选设置 ...]
+例如:
+    python tools/密码哈希基准.py scrypt:32768:8:1 pbkdf2:sha256:600000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+# === 默认候选设置 ===
+CANDIDATES = [
+    'scrypt:32768:8:1',        # werkzeug 默认
+    'scrypt:16384:8:1',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:100000',
+]
+PASSWORD = 'Benchmark#2025'
+
+
+def _check(pwhash):
+    return check_password_hash(pwhash, PASSWORD)
+
+
+def bench_single(pwhash, rounds):
+    """当前进程逐次校验，返回每次耗时（ms）列表"""
+    _check(pwhash)  # 预热
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        _check(pwhash)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def bench_pool(pool, workers, pwhash, rounds):
+    """进程池并发校验，返回每秒完成的校验数"""
+    total = rounds * workers
+    start = time.perf_counter()
+    list(pool.map(_check, [pwhash] * total))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='密码哈希设置基准测试')
+    parser.add_argument('methods', nargs='*', help='候选设置（werkzeug 格式），默认使用内置列表')
+    parser.add_argument('--cohort', type=int, default=1500, help='同时登录的学生人数（估算用）')
+    parser.add_argument('--rounds', type=int, default=20, help='每个设置单核测试的次数')
+    args = parser.parse_args()
+
+    methods = args.methods or CANDIDATES
+    workers = os.cpu_count() or 1
+    print(f"当前设置: {Config.PASSWORD_HASH_METHOD}，CPU 核数: {workers}，整届人数: {args.cohort}\n")
+    print(f"{'设置':<24}{'ms/次 p50':>10}{'p95':>9}{'次/秒/核':>10}{'次/秒(池)':>11}{'整届登录(s)':>12}")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pool.submit(os.getpid).result()
+        for method in methods:
+            try:
+                pwhash = generate_password_hash(PASSWORD, method, Config.PASSWORD_SALT_LENGTH)
+            except (ValueError, TypeError) as e:
+                print(f"{method:<24}无效设置: {e}")
+                continue
+            times = sorted(bench_single(pwhash, args.rounds))
+            p50 = statistics.median(times)
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            per_core = 1000 / p50
+            pooled = bench_pool(pool, workers, pwhash, max(2, args.rounds // 4))
+            marker = ' *' if method == Config.PASSWORD_HASH_METHOD else ''
+            print(f"{method:<24}{p50:>10.1f}{p95:>9.1f}{per_core:>10.1f}{pooled:>11.1f}"
+                  f"{args.cohort / pooled:>12.1f}{marker}")
+
+    print("\n* 为当前设置。修改 PASSWORD_HASH_METHOD 后，已有账号在下一次登录时自动升级为新设置。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+座位账本写回校验：同一批写回中混入一个无法写入的操作（学生在写回前被删除，违反外键约束），
+确认其余操作照常写入、坏操作被丢弃并记入 dead_letters、座位数与 enrollment 一致，写回队列不会被卡住。
+
+完全离线运行：按 sql/init_db.sql 和迁移生成一份临时数据库。
+
+用法:
+    python tools/座位账本写回校验.py
+
+校验不通过时以非零状态码退出。
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from app.migrations import migrate
+from app.seat_ledger import SeatLedger
+from app.timeslot import time_slot_mask
+
+STUDENTS = ['S001', 'S002', 'S003', 'S004']
+BAD_STUDENT = 'S003'
+
+
+def build_database(path):
+    conn = sqlite3.connect(path)
+    with open(os.path.join(PROJECT_ROOT, 'sql', 'init_db.sql'), encoding='utf-8') as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO college (college_id, college_name) VALUES ('CS', 'Computer Science')")
+    conn.execute("INSERT INTO semester (semester_id, semester_name, is_current) VALUES ('CHK', 'Check', 1)")
+    conn.execute("INSERT INTO teacher (teacher_id, name, college_id, id_card) VALUES ('T01', 'Teacher', 'CS', '220101197000000000')")
+    conn.executemany(
+        "INSERT INTO course (course_id, course_name, credits, hours, college_id, target_grade) VALUES (?, ?, 3, 32, 'CS', 1)",
+        [('CS101', 'Algorithms'), ('CS102', 'Databases')]
+    )
+    for course_id, slot in [('CS101', 'Monday 8:00-9:40'), ('CS102', 'Tuesday 8:00-9:40')]:
+        conn.execute("""
+            INSERT INTO offered_course (course_id, teacher_id, semester_id, classroom, time_slot, time_mask, capacity, current_count)
+            VALUES (?, 'T01', 'CHK', 'Room 101', ?, ?, 10, 0)
+        """, (course_id, slot, time_slot_mask(slot)))
+    conn.executemany(
+        "INSERT INTO student (student_id, name, college_id, id_card, enrollment_year) VALUES (?, ?, 'CS', ?, ?)",
+        [(sid, f"Student {sid}", f"{110101200000000000 + i}", datetime.now().year) for i, sid in enumerate(STUDENTS)]
+    )
+    conn.commit()
+    conn.close()
+    migrate(path)
+
+
+def main():
+    failures = []
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ledger_check.db')
+        build_database(path)
+
+        # 不启动后台线程，手动 flush，保证所有操作落在同一批
+        ledger = SeatLedger(path)
+        ledger.load()
+        sections = sorted(ledger.seat_counts())
+        for sid in STUDENTS:
+            for oid in sections:
+                error = ledger.enroll(sid, oid)
+                check(error is None, f"{sid} 选课 {oid}: {error or '成功'}")
+
+        # 写回之前删除一名学生，他的两条选课记录会违反外键约束
+        conn = sqlite3.connect(path)
+        conn.execute("DELETE FROM student WHERE student_id = ?", (BAD_STUDENT,))
+        conn.commit()
+
+        written = ledger.flush()
+        check(written == len(STUDENTS) * len(sections), f"一次 flush 处理完整批操作（{written}）")
+        check(not ledger._pending, "写回队列已清空")
+        check(sorted(item[1] for item, _ in ledger.dead_letters) == [BAD_STUDENT] * len(sections),
+              f"dead_letters 只包含 {BAD_STUDENT} 的操作")
+
+        rows = {(r[0], r[1]) for r in conn.execute("SELECT student_id, offered_id FROM enrollment")}
+        expected = {(sid, oid) for sid in STUDENTS if sid != BAD_STUDENT for oid in sections}
+        check(rows == expected, f"其余学生的选课全部写入（{len(rows)}/{len(expected)}）")
+
+        counts = dict(conn.execute("""
+            SELECT oc.offered_id, oc.current_count - (SELECT COUNT(*) FROM enrollment e WHERE e.offered_id = oc.offered_id)
+            FROM offered_course oc
+        """).fetchall())
+        check(not any(counts.values()), "offered_course.current_count 与 enrollment 行数一致")
+        check(ledger.seat_counts() == {oid: len(STUDENTS) - 1 for oid in sections}, "账本内存座位数已扣回")
+
+        # 后续操作不受影响
+        error = ledger.drop(STUDENTS[0], sections[0])
+        check(error is None and ledger.flush() == 1, "之后的退课正常写回")
+        check(conn.execute("SELECT COUNT(*) FROM enrollment WHERE student_id = ? AND offered_id = ?",
+                           (STUDENTS[0], sections[0])).fetchone()[0] == 0, "退课记录已删除")
+        conn.close()
+        ledger.stop()
+
+    if failures:
+        print(f"❌ {len(failures)} 项校验未通过")
+        sys.exit(1)
+    print("✅ 座位账本写回校验通过")
+
+
+if __name__ == "__main__":
+    main()
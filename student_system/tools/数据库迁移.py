@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+手动执行数据库迁移，并打印热点查询迁移前后的 EXPLAIN QUERY PLAN。
+
+用法:
+    python tools/数据库迁移.py [数据库路径]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.migrations import latest_version, migrate
+
+# === 配置 ===
+DB_PATH = sys.argv[1] if len(sys.argv) > 1 else "students.db"
+
+if __name__ == "__main__":
+    if not os.path.exists(DB_PATH):
+        print(f"❌ 数据库 {DB_PATH} 不存在")
+        sys.exit(1)
+    version = migrate(DB_PATH, explain=True)
+    print(f"📦 {DB_PATH} 当前结构版本: {version} (最新: {latest_version()})")
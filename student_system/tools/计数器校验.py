@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+校验 counters 表（触发器维护的行数计数器）与实际 COUNT(*) 是否一致，有偏差时重建。
+
+用法:
+    python tools/计数器校验.py [数据库路径] [--check-only]
+"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.counters import check_counters
+
+# === 配置 ===
+args = [a for a in sys.argv[1:] if not a.startswith('--')]
+DB_PATH = args[0] if args else "students.db"
+CHECK_ONLY = '--check-only' in sys.argv
+
+if __name__ == "__main__":
+    if not os.path.exists(DB_PATH):
+        print(f"❌ 数据库 {DB_PATH} 不存在")
+        sys.exit(1)
+    conn = sqlite3.connect(DB_PATH, timeout=20.0)
+    try:
+        # 读和重建在同一个写事务中，避免期间有新写入
+        conn.execute("BEGIN IMMEDIATE")
+        drift = check_counters(conn, repair=not CHECK_ONLY)
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        print(f"❌ 校验失败（是否尚未执行数据库迁移？）: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    if not drift:
+        print("✅ 计数器与实际数据一致")
+        sys.exit(0)
+    for scope, key, stored, actual in drift:
+        print(f"⚠️ {scope}[{key}]: 计数器 {stored}，实际 {actual}")
+    if CHECK_ONLY:
+        print(f"❌ 发现 {len(drift)} 处偏差（未修复）")
+        sys.exit(1)
+    print(f"✅ 发现 {len(drift)} 处偏差，已重建计数器")
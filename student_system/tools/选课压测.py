@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+选课高峰压测：模拟整届学生在同一分钟内登录、打开选课页、选课/退课。
+
+完全离线运行：先按 sql/init_db.sql 生成一份独立的测试数据库（默认 1500 名学生，
+与 tools/学生表生成.py 的规模一致），再通过 Flask 测试客户端多线程回放请求。
+结束后报告吞吐量、各接口 p50/p95/p99 延迟、数据库锁超时次数，
+并核对 offered_course.current_count 与 enrollment 实际行数（超卖/少卖）。
+
+用法:
+    python tools/选课压测.py [--students 1500] [--workers 16] [--actions 6] [--ledger]
+
+存在超卖、计数不一致或服务端错误时以非零状态码退出，可作为发布前的检查。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from werkzeug.security import generate_password_hash
+
+from config import Config
+
+COLLEGES = [('CS', 'Computer Science'), ('ENG', 'Engineering'), ('ARTS', 'Arts'),
+            ('MED', 'Medicine'), ('SCI', 'Science')]
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+SLOTS = ['8:00-9:40', '10:00-11:40', '14:00-15:40', '16:00-17:40', '19:00-20:40']
+PASSWORD = '123456'
+SEMESTER_ID = 'LOAD'
+
+
+# ---------- 测试数据 ----------
+def build_database(path, student_count, courses_per_grade=8, sections_per_course=2):
+    """生成压测数据库：每个学院每个年级若干门课，每门课若干班次，总座位略少于需求"""
+    from app.timeslot import time_slot_mask
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    with open(os.path.join(PROJECT_ROOT, 'sql', 'init_db.sql'), encoding='utf-8') as f:
+        conn.executescript(f.read())
+
+    rng = random.Random(2025)
+    year = datetime.now().year
+    now = datetime.now()
+
+    conn.executemany("INSERT INTO college (college_id, college_name) VALUES (?, ?)", COLLEGES)
+    conn.execute(
+        "INSERT INTO semester (semester_id, semester_name, is_current, selection_start, selection_end) VALUES (?, ?, 1, ?, ?)",
+        (SEMESTER_ID, 'Load Test', (now - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'),
+         (now + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'))
+    )
+
+    teachers = []
+    for i, (cid, _) in enumerate(COLLEGES):
+        for j in range(10):
+            teachers.append((f"T{cid}{j:02d}", f"Teacher {cid}{j}", cid, f"{220101197000000000 + i * 100 + j}"))
+    conn.executemany("INSERT INTO teacher (teacher_id, name, college_id, id_card) VALUES (?, ?, ?, ?)", teachers)
+
+    students = []
+    for i in range(student_count):
+        cid = COLLEGES[i % len(COLLEGES)][0]
+        grade = i // len(COLLEGES) % 3 + 1
+        students.append((f"L{i:06d}", f"Student {i}", cid, f"{110101200000000000 + i}", year - grade + 1))
+    conn.executemany(
+        "INSERT INTO student (student_id, name, college_id, id_card, enrollment_year) VALUES (?, ?, ?, ?, ?)", students
+    )
+
+    # 每名学生平均想选约 4 门课，总座位数约为需求的 80%，制造满员竞争
+    per_group = max(1, student_count // (len(COLLEGES) * 3))
+    capacity = max(1, int(per_group * 4 * 0.8 / (courses_per_grade * sections_per_course)))
+    offered = []
+    for cid, cname in COLLEGES:
+        college_teachers = [t[0] for t in teachers if t[2] == cid]
+        for grade in (1, 2, 3):
+            for k in range(courses_per_grade):
+                course_id = f"{cid}{grade}{k:02d}"
+                conn.execute(
+                    "INSERT INTO course (course_id, course_name, credits, hours, college_id, target_grade) VALUES (?, ?, ?, ?, ?, ?)",
+                    (course_id, f"{cname} {grade}-{k}", rng.choice([2, 3, 4]), 32, cid, grade)
+                )
+                for n in range(sections_per_course):
+                    slot = f"{rng.choice(WEEKDAYS)} {rng.choice(SLOTS)}"
+                    offered.append((course_id, college_teachers[(k + n) % len(college_teachers)],
+                                    slot, time_slot_mask(slot), capacity))
+    conn.executemany("""
+        INSERT INTO offered_course (course_id, teacher_id, semester_id, classroom, time_slot, time_mask, capacity, current_count)
+        VALUES (?, ?, '""" + SEMESTER_ID + """', 'Room 101', ?, ?, ?, 0)
+    """, offered)
+
+    # 压测关注选课本身，账号使用低成本哈希以免生成数据库耗时过长
+    hashed = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    conn.executemany(
+        "INSERT INTO account (username, password_hash, role, user_id, is_active) VALUES (?, ?, 'student', ?, 1)",
+        [(s[0], hashed, s[0]) for s in students]
+    )
+    conn.commit()
+
+    sections = defaultdict(list)
+    for row in conn.execute("""
+        SELECT oc.offered_id, c.college_id, c.target_grade
+        FROM offered_course oc JOIN course c ON oc.course_id = c.course_id
+    """):
+        sections[(row[1], row[2])].append(row[0])
+    conn.close()
+    return [(s[0], s[2], year - s[4] + 1) for s in students], sections
+
+
+# ---------- 回放 ----------
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.outcomes = Counter()
+        self.errors = Counter()
+
+    def record(self, endpoint, ms, outcome=None, message=None):
+        with self.lock:
+            self.latencies[endpoint].append(ms)
+            if outcome:
+                self.outcomes[outcome] += 1
+            if outcome in ('lock_timeout', 'error'):
+                self.errors[message] += 1
+
+
+def classify(message):
+    if message is None:
+        return 'no_message'
+    if 'locked' in message:
+        return 'lock_timeout'
+    if 'successfully' in message:
+        return 'ok'
+    if 'full' in message:
+        return 'full'
+    if message.startswith(('Enrollment failed:', 'Drop failed:')):
+        return 'error'  # 视图中捕获到异常
+    return 'rejected'
+
+
+def simulate_student(app, recorder, student, sections, actions, drop_ratio, rng):
+    student_id, college_id, grade = student
+    client = app.test_client()
+
+    def timed(endpoint, method, url, data=None):
+        start = time.perf_counter()
+        resp = client.open(url, method=method, data=data)
+        ms = (time.perf_counter() - start) * 1000
+        if resp.status_code >= 500:
+            recorder.record(endpoint, ms, 'http_5xx')
+            return None
+        message = None
+        if method == 'POST' and endpoint != 'login':
+            with client.session_transaction() as sess:
+                flashes = sess.pop('_flashes', [])
+                message = flashes[-1][1] if flashes else None
+        recorder.record(endpoint, ms, classify(message) if endpoint != 'login' and method == 'POST' else None, message)
+        return message
+
+    timed('login', 'POST', '/login', {'username': student_id, 'password': PASSWORD})
+    timed('select_course', 'GET', '/select-course')
+
+    candidates = list(sections[(college_id, grade)])
+    rng.shuffle(candidates)
+    enrolled = []
+    for _ in range(actions):
+        if enrolled and rng.random() < drop_ratio:
+            offered_id = enrolled.pop(rng.randrange(len(enrolled)))
+            timed('drop_course', 'POST', '/drop-course', {'offered_id': offered_id})
+        elif candidates:
+            offered_id = candidates.pop()
+            message = timed('handle_select_course', 'POST', '/handle-select-course', {'offered_id': offered_id})
+            if message and 'successfully' in message:
+                enrolled.append(offered_id)
+        if rng.random() < 0.3:
+            timed('select_course', 'GET', '/select-course')
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def check_consistency(path):
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("""
+            SELECT oc.offered_id, oc.capacity, oc.current_count,
+                   (SELECT COUNT(*) FROM enrollment e WHERE e.offered_id = oc.offered_id) AS actual
+            FROM offered_course oc
+        """).fetchall()
+    finally:
+        conn.close()
+    oversold = [r for r in rows if r[3] > r[1]]
+    drifted = [r for r in rows if r[2] != r[3]]
+    undersold = [r for r in rows if r[2] > r[3]]
+    return rows, oversold, drifted, undersold
+
+
+def main():
+    parser = argparse.ArgumentParser(description='选课高峰离线压测')
+    parser.add_argument('--students', type=int, default=1500)
+    parser.add_argument('--workers', type=int, default=16, help='并发线程数')
+    parser.add_argument('--actions', type=int, default=6, help='每名学生的选课/退课操作数')
+    parser.add_argument('--drop-ratio', type=float, default=0.2, help='操作中退课的比例')
+    parser.add_argument('--ledger', action='store_true', help='启用内存座位账本 (SEAT_LEDGER_ENABLED)')
+    parser.add_argument('--db', default=None, help='测试数据库路径（默认临时目录）')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='select_load_'), 'loadtest.db')
+    print(f"🛠️ 生成测试数据库 {db_path} ({args.students} 名学生)...")
+    students, sections = build_database(db_path, args.students)
+
+    Config.DATABASE = db_path
+    Config.SEAT_LEDGER_ENABLED = args.ledger
+    from app import create_app
+    flask_app = create_app()
+    flask_app.config['TESTING'] = True
+
+    recorder = Recorder()
+    rng = random.Random(7)
+    seeds = [rng.random() for _ in students]
+    print(f"🚀 开始回放: {args.workers} 线程, 每人 {args.actions} 次操作, 座位账本={'开' if args.ledger else '关'}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(simulate_student, flask_app, recorder, student, sections,
+                               args.actions, args.drop_ratio, random.Random(seed))
+                   for student, seed in zip(students, seeds)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    from app.seat_ledger import get_ledger
+    ledger = get_ledger()
+    if ledger is not None:
+        ledger.stop()  # 等待写回队列清空后再核对
+
+    total = sum(len(v) for v in recorder.latencies.values())
+    print(f"\n⏱️ 共 {total} 个请求，用时 {elapsed:.1f}s，吞吐量 {total / elapsed:.1f} req/s")
+    print(f"{'接口':<22}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values.sort()
+        print(f"{endpoint:<22}{len(values):>8}{statistics.median(values):>10.1f}"
+              f"{percentile(values, 95):>10.1f}{percentile(values, 99):>10.1f}{values[-1]:>10.1f}")
+
+    print("\n📋 请求结果:", dict(recorder.outcomes))
+    for message, count in recorder.errors.most_common(5):
+        print(f"   {count} × {message}")
+
+    rows, oversold, drifted, undersold = check_consistency(db_path)
+    seats = sum(r[1] for r in rows)
+    taken = sum(r[3] for r in rows)
+    print(f"🎟️ 座位 {seats}，实际选课 {taken}，满员班次 {sum(1 for r in rows if r[3] >= r[1])}/{len(rows)}")
+    print(f"❗ 超卖班次: {len(oversold)}，计数偏多(少卖): {len(undersold)}，current_count 与实际不一致: {len(drifted)}")
+    for r in drifted[:10]:
+        print(f"   offered_id={r[0]} capacity={r[1]} current_count={r[2]} actual={r[3]}")
+
+    failed = oversold or drifted or recorder.outcomes['http_5xx']
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+选课校验基准测试：对比 handle_select_course 中
+“逐项查询（8 条语句）”与“合并查询（1 条语句）”的每请求语句数和耗时。
+
+只读运行，不修改数据库。用法:
+    python tools/选课校验基准.py [数据库路径] [请求数]
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.course import check_selection_eligibility, load_selection_eligibility
+from app.semester import get_current_semester
+
+# === 配置 ===
+DB_PATH = sys.argv[1] if len(sys.argv) > 1 else "students.db"
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+
+def legacy_checks(conn, student_id, offered_id):
+    """原 handle_select_course 的逐项校验，仅用于对比"""
+    student = conn.execute(
+        "SELECT college_id, enrollment_year FROM student WHERE student_id = ?", (student_id,)
+    ).fetchone()
+    if not student:
+        return 'student'
+    course_info = conn.execute("""
+        SELECT c.college_id, oc.capacity, oc.time_slot, oc.time_mask, c.target_grade, c.course_name, oc.semester_id
+        FROM offered_course oc
+        JOIN course c ON oc.course_id = c.course_id
+        WHERE oc.offered_id = ?
+    """, (offered_id,)).fetchone()
+    if not course_info:
+        return 'course'
+    # 为了让两种方式执行相同的校验数量，这里不在学院/年级不符时提前返回
+    conn.execute("""
+        SELECT s.selection_start, s.selection_end
+        FROM semester s
+        WHERE s.semester_id = ? AND s.is_current = 1
+    """, (course_info['semester_id'],)).fetchone()
+    conn.execute("SELECT 1 FROM enrollment WHERE student_id = ? AND offered_id = ?",
+                 (student_id, offered_id)).fetchone()
+    conn.execute("""
+        SELECT 1
+        FROM enrollment e
+        JOIN offered_course oc2 ON e.offered_id = oc2.offered_id
+        JOIN course c2 ON oc2.course_id = c2.course_id
+        WHERE e.student_id = ? AND c2.course_name = ?
+    """, (student_id, course_info['course_name'])).fetchone()
+    conn.execute("""
+        SELECT COALESCE(SUM(c.credits), 0) AS total
+        FROM enrollment e
+        JOIN offered_course oc ON e.offered_id = oc.offered_id
+        JOIN course c ON oc.course_id = c.course_id
+        WHERE e.student_id = ?
+    """, (student_id,)).fetchone()
+    conn.execute("""
+        SELECT credits
+        FROM course c
+        JOIN offered_course oc ON c.course_id = oc.course_id
+        WHERE oc.offered_id = ?
+    """, (offered_id,)).fetchone()
+    conn.execute("""
+        SELECT c.course_name
+        FROM enrollment e
+        JOIN offered_course oc ON e.offered_id = oc.offered_id
+        JOIN course c ON oc.course_id = c.course_id
+        WHERE e.student_id = ? AND oc.semester_id = ? AND (oc.time_mask & ?) != 0
+    """, (student_id, course_info['semester_id'], course_info['time_mask'] or 0)).fetchall()
+    return None
+
+
+def consolidated_checks(conn, student_id, offered_id):
+    return check_selection_eligibility(load_selection_eligibility(conn, student_id, offered_id),
+                                       get_current_semester(conn))
+
+
+def run(name, func, conn, samples):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    latencies = []
+    for student_id, offered_id in samples:
+        start = time.perf_counter()
+        func(conn, student_id, offered_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+    conn.set_trace_callback(None)
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<8} 语句数/请求: {len(statements) / len(samples):5.2f}   "
+          f"平均: {statistics.mean(latencies):.3f} ms   p95: {p95:.3f} ms")
+
+
+def main():
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        students = [row[0] for row in conn.execute("SELECT student_id FROM student")]
+        offered = [row[0] for row in conn.execute("SELECT offered_id FROM offered_course")]
+        if not students or not offered:
+            print("❌ 数据库中没有学生或开课数据")
+            return
+        random.seed(42)
+        samples = [(random.choice(students), random.choice(offered)) for _ in range(REQUESTS)]
+
+        # 预热，避免首次读盘影响结果
+        for student_id, offered_id in samples[:50]:
+            legacy_checks(conn, student_id, offered_id)
+            consolidated_checks(conn, student_id, offered_id)
+        print(f"📊 {DB_PATH}: {len(students)} 名学生, {len(offered)} 个班次, {REQUESTS} 次请求")
+        run('逐项查询', legacy_checks, conn, samples)
+        run('合并查询', consolidated_checks, conn, samples)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()